@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Single-process acquisition service (Linux) replacing run.bat.
+
+Runs the ESP32 gait stream, the OWON meter poll loop and any extra serial
+instruments as asyncio tasks in one process. Ports are read non-blocking via
+loop.add_reader, so nothing spins or sleeps on a timeout.
+
+Every stream is stamped from one clock: time.monotonic(), anchored once to
+wall time at session start (SessionClock). All files go to one directory:
+
+  sessions/<YYYYmmdd_HHMMSS>/
+    gait_data_log_<stamp>.csv   same layout as serial_in.py
+    gait_sync_<stamp>.csv       host_epoch_s, host_mono_s, TimeStep, Elapsed_us
+                                as serial_in.py (host_mono_s is time.monotonic();
+                                one pair per --sync-period, the least delayed
+                                read; clock_sync.py fits the drift model)
+    owon_log_<stamp>.csv        same layout as owon_logger.py
+    <name>_<stamp>.csv          extra instruments: epoch_s, iso_time, line
+    session.json                clock anchor, ports, files, counters and
+                                gait_start_epoch_s (host time at Elapsed_us = 0,
+                                from the first, least delayed sync pair)
+
+gait_start_epoch_s replaces the HHMMSS prompt in owon_voltage.py
+(pass --session sessions/<stamp>/session.json).
+
+Usage:
+  python acquire.py
+  python acquire.py --gait-port /dev/ttyUSB0 --owon-port /dev/ttyUSB1
+  python acquire.py --no-owon --instrument bms=/dev/ttyACM0:9600
+  python acquire.py --instrument psu=/dev/ttyUSB2:115200:MEAS:VOLT? --poll-period 0.1
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import signal
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import serial
+
+from serial_in import SYNC_PERIOD_S, GaitLineHandler, SyncRecorder
+
+GAIT_PORT = "/dev/ttyUSB0"
+GAIT_BAUD = 921600
+OWON_PORT = "/dev/ttyUSB1"
+OWON_BAUD = 115200
+OWON_CMD = "MEAS:CURR?"
+POLL_PERIOD = 0.05         # 20 Hz, as owon_logger.py
+POLL_TIMEOUT = 0.1         # give up on a response after this long
+FLUSH_INTERVAL_S = 1.0
+STATUS_INTERVAL_S = 5.0
+
+
+class SessionClock:
+    """One monotonic clock for all streams, anchored to wall time once."""
+
+    def __init__(self):
+        self.t0_epoch = time.time()
+        self.t0_mono = time.monotonic()
+
+    def now(self):
+        return time.monotonic()
+
+    def epoch(self, mono):
+        return self.t0_epoch + (mono - self.t0_mono)
+
+    def iso(self, mono):
+        return datetime.fromtimestamp(self.epoch(mono)).isoformat()
+
+
+class SerialStream:
+    """
+    Non-blocking serial port on the event loop. Bytes are split into lines as
+    they arrive; each chunk of complete lines is stamped with its arrival time.
+    A read error closes the port and is raised from the next chunk/readline.
+    """
+
+    def __init__(self, port, baud, mode="chunks"):
+        self.ser = serial.Serial(port, baud, timeout=0, write_timeout=0)
+        self.pending = bytearray()
+        self.lines = deque()        # (t_mono, bytes) waiting for readline()
+        self.chunks = asyncio.Queue()
+        self.mode = mode            # "chunks" for streams, "lines" for pollers
+        self._line_ready = asyncio.Event()
+        self.bytes_in = 0
+        self.error = None
+
+    def start(self, clock):
+        self.clock = clock
+        self.ser.reset_input_buffer()
+        asyncio.get_running_loop().add_reader(self.ser.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:  # OSError: device unplugged (EIO)
+            self.error = e
+            self.close()
+            self.chunks.put_nowait(None)   # wake the task waiting on this port
+            self._line_ready.set()
+            return
+        if not data:
+            return
+        t = self.clock.now()
+        self.bytes_in += len(data)
+        self.pending += data
+        if b"\n" not in data:
+            return
+        *complete, rest = self.pending.split(b"\n")
+        self.pending = bytearray(rest)
+        if self.mode == "chunks":
+            self.chunks.put_nowait((t, complete))
+        else:
+            self.lines.extend((t, ln) for ln in complete)
+            self._line_ready.set()
+
+    async def next_chunk(self):
+        """Next (t_mono, lines) in "chunks" mode."""
+        item = await self.chunks.get()
+        if item is None:
+            raise self.error
+        return item
+
+    async def readline(self):
+        """Next (t_mono, line) in "lines" mode."""
+        while not self.lines:
+            if self.error is not None:
+                raise self.error
+            self._line_ready.clear()
+            await self._line_ready.wait()
+        return self.lines.popleft()
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def close(self):
+        if self.ser.is_open:
+            try:
+                asyncio.get_running_loop().remove_reader(self.ser.fileno())
+            except (RuntimeError, ValueError):
+                pass
+            self.ser.close()
+
+
+class CsvSink:
+    """Buffered CSV file flushed by the session's flusher task, not per row."""
+
+    def __init__(self, path, header, name):
+        self.path = path
+        self.name = name
+        self.f = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.f)
+        self.rows = 0
+        if header:
+            self.writer.writerow(header)
+
+    def writerows(self, rows):
+        self.writer.writerows(rows)
+        self.rows += len(rows)
+
+    def close(self):
+        self.f.close()
+
+
+# ---------- tasks ----------
+async def gait_task(stream, sink, sync, session, stop):
+    """ESP32 gait stream → gait CSV, plus host/firmware time pairs for the drift model."""
+    handler = GaitLineHandler()
+    try:
+        while not stop.is_set():
+            t, lines = await stream.next_chunk()
+            last = None
+            for raw in lines:
+                rows = handler.handle(raw.decode(errors="ignore"))
+                if not rows:
+                    continue
+                sink.writerows(rows)
+                last = rows[-1]
+            if last is None or handler.expected_cols != 36:
+                continue
+            sync.offer(session.clock.epoch(t), t, last)
+    finally:
+        sync.close()
+        # from the least delayed pair, not the first chunk (which waited in USB buffers)
+        session.meta["gait_start_epoch_s"] = sync.start_epoch
+        session.meta["gait_malformed"] = handler.malformed
+        session.meta["gait_sync_pairs"] = sync.pairs
+
+
+async def poll_task(stream, sink, cmd, period, timeout, session, stop, parse=float):
+    """
+    Send cmd every period seconds and log the reply. Deadlines are on the
+    session clock, so a slow reply delays one sample instead of the schedule.
+    """
+    payload = (cmd + "\r\n").encode("ascii")
+    stats = {"sent": 0, "replies": 0, "timeouts": 0}
+    session.meta.setdefault("pollers", {})[sink.name] = stats
+    next_t = session.clock.now()
+    while not stop.is_set():
+        stream.lines.clear()  # a late reply to a timed-out poll is not this sample
+        stream.write(payload)
+        stats["sent"] += 1
+        try:
+            t, raw = await asyncio.wait_for(stream.readline(), timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+        else:
+            txt = raw.decode("ascii", errors="replace").strip()
+            try:
+                val = parse(txt)
+            except ValueError:
+                val = None
+            sink.writerows([[session.clock.epoch(t), session.clock.iso(t), val, txt]])
+            stats["replies"] += 1
+        next_t += period
+        delay = next_t - session.clock.now()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            next_t = session.clock.now()  # overran; don't burst to catch up
+
+
+async def line_task(stream, sink, session, stop):
+    """Unpolled instrument: log every line with the session clock."""
+    while not stop.is_set():
+        t, lines = await stream.next_chunk()
+        epoch, iso = session.clock.epoch(t), session.clock.iso(t)
+        sink.writerows([[epoch, iso, ln.decode(errors="replace").strip()]
+                        for ln in lines if ln.strip()])
+
+
+async def housekeeping(session, stop, flush_interval, status_interval):
+    """Flush all sinks on an interval and print one status line now and then."""
+    last_status = session.clock.now()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        for s in session.sinks:
+            s.f.flush()
+        now = session.clock.now()
+        if now - last_status >= status_interval:
+            last_status = now
+            print("[STAT] " + "  ".join(f"{s.name} {s.rows}" for s in session.sinks))
+
+
+def stop_on_error(task, session, stop):
+    """Done-callback: a task that raised stops the whole session (its stream isn't logging)."""
+    if task.cancelled() or task.exception() is None:
+        return
+    e = task.exception()
+    session.errors.append(f"{task.get_name()}: {e!r}")
+    print(f"[ERROR] {task.get_name()} failed: {e!r}")
+    stop.set()
+
+
+# ---------- session ----------
+class Session:
+    def __init__(self, out_dir):
+        self.clock = SessionClock()
+        self.stamp = datetime.fromtimestamp(self.clock.t0_epoch).strftime("%Y%m%d_%H%M%S")
+        self.dir = Path(out_dir) / self.stamp
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.sinks = []
+        self.streams = []
+        self.errors = []
+        self.meta = {
+            "stamp": self.stamp,
+            "t0_epoch_s": self.clock.t0_epoch,
+            "t0_monotonic_s": self.clock.t0_mono,
+            "gait_start_epoch_s": None,
+            "ports": {},
+            "files": {},
+        }
+
+    def sink(self, kind, name, header):
+        s = CsvSink(self.dir / f"{name}_{self.stamp}.csv", header, kind)
+        self.sinks.append(s)
+        self.meta["files"][kind] = s.path.name
+        return s
+
+    def stream(self, kind, port, baud, mode="chunks"):
+        st = SerialStream(port, baud, mode)
+        self.streams.append(st)
+        self.meta["ports"][kind] = {"port": port, "baud": baud}
+        return st
+
+    def write_meta(self):
+        self.meta["end_epoch_s"] = self.clock.epoch(self.clock.now())
+        self.meta["rows"] = {s.path.name: s.rows for s in self.sinks}
+        self.meta["errors"] = self.errors
+        with open(self.dir / "session.json", "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    def close(self):
+        for st in self.streams:
+            st.close()
+        for s in self.sinks:
+            s.close()
+        self.write_meta()
+
+
+def parse_instrument(spec):
+    """name=port[:baud[:poll_cmd]] → (name, port, baud, cmd or None)."""
+    name, _, rest = spec.partition("=")
+    if not name or not rest:
+        raise argparse.ArgumentTypeError(f"bad instrument spec: {spec!r}")
+    parts = rest.split(":", 2)
+    baud = int(parts[1]) if len(parts) > 1 and parts[1] else 115200
+    cmd = parts[2] if len(parts) > 2 and parts[2] else None
+    return name, parts[0], baud, cmd
+
+
+async def run(args):
+    session = Session(args.out_dir)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"Session: {session.dir}")
+    tasks = []
+    try:
+        if not args.no_gait:
+            st = session.stream("gait", args.gait_port, args.gait_baud)
+            gait = session.sink("gait", "gait_data_log", None)
+            sync_sink = session.sink("gait_sync", "gait_sync", SyncRecorder.HEADER)
+            sync = SyncRecorder(sync_sink.writerows, args.sync_period)
+            tasks.append(("gait", gait_task(st, gait, sync, session, stop)))
+        if not args.no_owon:
+            st = session.stream("owon", args.owon_port, args.owon_baud, mode="lines")
+            owon = session.sink("owon", "owon_log", ["epoch_s", "iso_time", "value", "raw"])
+            tasks.append(("owon", poll_task(st, owon, args.owon_cmd, args.poll_period,
+                                            args.poll_timeout, session, stop)))
+        for name, port, baud, cmd in args.instrument:
+            st = session.stream(name, port, baud, mode="lines" if cmd else "chunks")
+            if cmd:
+                s = session.sink(name, name, ["epoch_s", "iso_time", "value", "raw"])
+                tasks.append((name, poll_task(st, s, cmd, args.poll_period, args.poll_timeout,
+                                              session, stop)))
+            else:
+                s = session.sink(name, name, ["epoch_s", "iso_time", "line"])
+                tasks.append((name, line_task(st, s, session, stop)))
+        if not tasks:
+            raise SystemExit("Nothing to acquire (all streams disabled).")
+
+        for st in session.streams:
+            st.start(session.clock)
+            print(f"Connected to {st.ser.port} at {st.ser.baudrate} baud.")
+        print("Acquiring (Ctrl+C to stop)...")
+
+        running = [asyncio.create_task(coro, name=name) for name, coro in tasks]
+        for t in running:
+            t.add_done_callback(lambda t: stop_on_error(t, session, stop))
+        keeper = asyncio.create_task(housekeeping(session, stop, args.flush_interval,
+                                                  STATUS_INTERVAL_S))
+        await stop.wait()
+        for t in running:
+            t.cancel()
+        await asyncio.gather(*running, return_exceptions=True)   # failures: stop_on_error
+        await keeper
+    except serial.SerialException as e:
+        print(f"[ERROR] {e}")
+    finally:
+        session.close()
+        print(f"\nStopped. Files in {session.dir}")
+        for s in session.sinks:
+            print(f"  {s.path.name}: {s.rows} rows")
+    if session.errors:
+        # a failed stream stopped the session early; don't exit as if stopped by the user
+        raise SystemExit("[ERROR] Acquisition stopped early:\n  " + "\n  ".join(session.errors))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Acquire gait, OWON and other serial streams in one process.")
+    ap.add_argument("--out-dir", type=Path, default=Path("sessions"))
+    ap.add_argument("--gait-port", default=GAIT_PORT)
+    ap.add_argument("--gait-baud", type=int, default=GAIT_BAUD)
+    ap.add_argument("--owon-port", default=OWON_PORT)
+    ap.add_argument("--owon-baud", type=int, default=OWON_BAUD)
+    ap.add_argument("--owon-cmd", default=OWON_CMD, help="e.g. MEAS:CURR? / MEAS:VOLT?")
+    ap.add_argument("--poll-period", type=float, default=POLL_PERIOD)
+    ap.add_argument("--poll-timeout", type=float, default=POLL_TIMEOUT)
+    ap.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL_S)
+    ap.add_argument("--sync-period", type=float, default=SYNC_PERIOD_S,
+                    help="Seconds between host↔Elapsed_us pairs in gait_sync (0 = every read)")
+    ap.add_argument("--no-gait", action="store_true")
+    ap.add_argument("--no-owon", action="store_true")
+    ap.add_argument("--instrument", type=parse_instrument, action="append", default=[],
+                    help="Extra port: name=port[:baud[:poll_cmd]] (repeatable)")
+    args = ap.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
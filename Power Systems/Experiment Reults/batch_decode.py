@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Decode every raw gait log under the experiment folders, using all cores.
+
+Finds raw gait_data_log_YYYYMMDD_HHMMSS.csv logs under Experiment*/ and
+Old Experiment Data/ (or the roots given), skips the ones whose
+_decoded.csv is up to date, and decodes the rest in a ProcessPoolExecutor.
+Files larger than --split-mb are cut into byte ranges aligned to line
+boundaries so one long session is spread over all workers; the parts are
+stitched back in order, so the output is identical to decode_exo_can_csv.py.
+
+Up-to-date check, per raw log (decode_manifest.json next to this script):
+  - manifest entry with the same raw size/mtime, decoded size/mtime and
+    pole pairs → skip
+  - --hash: a raw log whose mtime changed but whose SHA-1 didn't → skip,
+    and store the new mtime so the next run doesn't hash it again
+  - no entry yet → skip if the decoded CSV is newer than the raw log
+
+Legacy 35-column logs (no Elapsed_us) are reported and left alone.
+
+Usage:
+  python batch_decode.py
+  python batch_decode.py Experiment8 -j 8 --split-mb 32
+  python batch_decode.py --hash --dry-run
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from decode_exo_can_csv import decode_file, decode_numpy, decoded_header
+
+HERE = Path(__file__).resolve().parent
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST = HERE / "decode_manifest.json"
+SPLIT_MB = 64
+RAW_LOG_RE = re.compile(r"gait_data_log_\d{8}_\d{6}")   # stem of what serial_in.py writes
+
+
+# ---------- discovery ----------
+def default_roots():
+    return sorted(p for p in HERE.glob("Experiment*") if p.is_dir()) + [HERE / "Old Experiment Data"]
+
+
+def find_raw_logs(roots):
+    """Raw logs under roots; a file given directly only has to be a non-decoded CSV."""
+    found = set()
+    for root in roots:
+        root = Path(root)
+        if root.is_file():
+            if "_decoded" not in root.stem:
+                found.add(root.resolve())
+            continue
+        for p in root.rglob("gait_data_log_*.csv"):
+            if RAW_LOG_RE.fullmatch(p.stem):
+                found.add(p.resolve())
+    return sorted(found)
+
+
+def decoded_path_for(raw):
+    return raw.with_name(raw.stem + "_decoded.csv")
+
+
+def raw_width(path, max_lines=200):
+    """Field count of the first data row (None if none in the first lines)."""
+    with path.open("r", newline="", errors="replace") as f:
+        for _, line in zip(range(max_lines), f):
+            if line[:1].isdigit():
+                return line.count(",") + 1
+    return None
+
+
+# ---------- manifest ----------
+def file_sig(path, with_hash=False):
+    st = path.stat()
+    sig = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if with_hash:
+        sig["sha1"] = sha1_of(path)
+    return sig
+
+
+def sha1_of(path):
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for buf in iter(lambda: f.read(1 << 20), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+def manifest_key(path):
+    try:
+        return str(path.relative_to(HERE))
+    except ValueError:
+        return str(path)
+
+
+def load_manifest(path):
+    if path.exists():
+        try:
+            m = json.loads(path.read_text())
+            if m.get("version") == MANIFEST_VERSION:
+                return m
+        except ValueError:
+            pass
+    return {"version": MANIFEST_VERSION, "entries": {}}
+
+
+def save_manifest(manifest, path):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    tmp.replace(path)
+
+
+def is_up_to_date(raw, entry, pole_pairs, use_hash):
+    """
+    True if raw's decoded CSV matches its manifest entry. A hash match stores
+    the raw log's new size/mtime in entry["raw"] (the caller saves it).
+    """
+    out = decoded_path_for(raw)
+    if not out.exists():
+        return False
+    if entry is None:
+        return out.stat().st_mtime >= raw.stat().st_mtime
+    if entry.get("pole_pairs") != pole_pairs:
+        return False
+    dec = file_sig(out)
+    if entry["decoded"]["size"] != dec["size"] or entry["decoded"]["mtime_ns"] != dec["mtime_ns"]:
+        return False
+    sig = file_sig(raw)
+    if sig["size"] == entry["raw"]["size"] and sig["mtime_ns"] == entry["raw"]["mtime_ns"]:
+        return True
+    if (use_hash and entry["raw"].get("sha1") and
+            sig["size"] == entry["raw"]["size"] and sha1_of(raw) == entry["raw"]["sha1"]):
+        entry["raw"].update(sig)
+        return True
+    return False
+
+
+# ---------- splitting ----------
+def split_ranges(size, parts):
+    """[(start, end)] byte ranges; each line belongs to the range holding its first byte."""
+    parts = max(1, parts)
+    step = -(-size // parts)
+    return [(s, min(size, s + step)) for s in range(0, size, step)] or [(0, 0)]
+
+
+def read_range(path, start, end):
+    """Text of all lines whose first byte lies in [start, end)."""
+    with path.open("rb") as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()             # finish the line the previous range owns
+        pos = f.tell()
+        if pos >= end:
+            return ""
+        data = f.read(end - pos)
+        if data and not data.endswith(b"\n"):
+            data += f.readline()     # this range owns the line it started
+    return data.decode("utf-8", errors="replace")
+
+
+# ---------- workers ----------
+def part_arrays(part_csv):
+    return part_csv.with_name(part_csv.name + ".npz")
+
+
+def decode_whole(raw, out, pole_pairs, cache):
+    t = time.perf_counter()
+    n = decode_file(raw, out, pole_pairs, engine="numpy", cache=cache)
+    return n, time.perf_counter() - t
+
+
+def decode_part(raw, start, end, part_csv, pole_pairs, cache):
+    """Decode one byte range to a headerless CSV part (+ arrays for the cache)."""
+    t = time.perf_counter()
+    kept = [] if cache else None
+    with part_csv.open("w", newline="") as f_out:
+        n = decode_numpy(io.StringIO(read_range(raw, start, end), newline=""), f_out,
+                         pole_pairs, keep=kept)
+    if cache:
+        meta = np.concatenate([k[0] for k in kept]) if kept else np.empty((0, 4), np.int64)
+        payload = np.concatenate([k[1] for k in kept]) if kept else np.empty((0, 4, 8), np.uint8)
+        np.savez(part_arrays(part_csv), meta=meta, payload=payload)
+    return n, time.perf_counter() - t
+
+
+def assemble(raw, out, parts, pole_pairs, cache):
+    """Header + parts (in order) → out; build the .npz cache from the part arrays."""
+    import fault_events
+    import gait_cache
+
+    tmp = out.with_name(out.name + ".tmp")
+    with tmp.open("w", newline="") as f_out:
+        csv.writer(f_out).writerow(decoded_header(pole_pairs))
+        for p in parts:
+            with p.open("r", newline="") as f_in:
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+    tmp.replace(out)
+    if cache:
+        metas, payloads = [], []
+        for p in parts:
+            with np.load(part_arrays(p)) as z:
+                metas.append(z["meta"])
+                payloads.append(z["payload"])
+        meta, payload = np.concatenate(metas), np.concatenate(payloads)
+        gait_cache.write_cache(gait_cache.cache_path_for(out), meta, payload, pole_pairs,
+                               source=raw.name)
+        fault_events.write_events(fault_events.events_path_for(out),
+                                  fault_events.events_from_payload(meta, payload), len(meta),
+                                  source=raw.name)
+    for p in parts:
+        p.unlink(missing_ok=True)
+        part_arrays(p).unlink(missing_ok=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Decode all stale raw gait logs in parallel.")
+    ap.add_argument("roots", nargs="*", type=Path,
+                    help="Folders or files to scan (default: Experiment*/ and Old Experiment Data/)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--split-mb", type=float, default=SPLIT_MB,
+                    help="Split files larger than this across workers (MiB)")
+    ap.add_argument("--pole-pairs", type=int, default=21)
+    ap.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    ap.add_argument("--hash", action="store_true",
+                    help="Store SHA-1 of raw logs and ignore mtime-only changes")
+    ap.add_argument("--force", action="store_true", help="Decode even if up to date")
+    ap.add_argument("--no-cache", action="store_true", help="Don't write .npz caches")
+    ap.add_argument("--dry-run", action="store_true", help="Only list what would be decoded")
+    args = ap.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    entries = manifest["entries"]
+    cache = not args.no_cache
+    todo = []
+    rehashed = 0
+    for raw in find_raw_logs(args.roots or default_roots()):
+        key = manifest_key(raw)
+        width = raw_width(raw)
+        if width != 36:
+            print(f"skip (legacy/unknown layout, {width} cols): {key}")
+            continue
+        entry = entries.get(key)
+        old_sig = dict(entry["raw"]) if entry else None
+        if not args.force and is_up_to_date(raw, entry, args.pole_pairs, args.hash):
+            rehashed += entry is not None and entry["raw"] != old_sig
+            continue
+        todo.append(raw)
+    if rehashed:
+        save_manifest(manifest, args.manifest)
+        print(f"{rehashed} raw log(s) touched but unchanged; stored their new mtime")
+
+    if not todo:
+        print("All decoded files are up to date.")
+        return
+    split_bytes = int(args.split_mb * (1 << 20))
+    for raw in todo:
+        size = raw.stat().st_size
+        how = f"split x{args.jobs}" if size > split_bytes and args.jobs > 1 else "whole"
+        print(f"{'would decode' if args.dry_run else 'decode'}: {manifest_key(raw)} "
+              f"({size / (1 << 20):.1f} MiB, {how})")
+    if args.dry_run:
+        return
+
+    t0 = time.perf_counter()
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {}
+        pending_parts = {}
+        for raw in todo:
+            out = decoded_path_for(raw)
+            size = raw.stat().st_size
+            if size > split_bytes and args.jobs > 1:
+                ranges = split_ranges(size, args.jobs)
+                parts = [out.with_name(f"{out.name}.part{i:03d}") for i in range(len(ranges))]
+                pending_parts[raw] = {"parts": parts, "left": len(parts), "rows": 0}
+                for (s, e), part in zip(ranges, parts):
+                    fut = pool.submit(decode_part, raw, s, e, part, args.pole_pairs, cache)
+                    futures[fut] = raw
+            else:
+                futures[pool.submit(decode_whole, raw, out, args.pole_pairs, cache)] = raw
+
+        for fut in as_completed(futures):
+            raw = futures[fut]
+            n, _dt = fut.result()
+            job = pending_parts.get(raw)
+            if job is not None:
+                job["rows"] += n
+                job["left"] -= 1
+                if job["left"]:
+                    continue
+                assemble(raw, decoded_path_for(raw), job["parts"], args.pole_pairs, cache)
+                n = job["rows"]
+            total_rows += n
+            entries[manifest_key(raw)] = {
+                "raw": file_sig(raw, with_hash=args.hash),
+                "decoded": file_sig(decoded_path_for(raw)),
+                "pole_pairs": args.pole_pairs,
+                "rows": n,
+            }
+            save_manifest(manifest, args.manifest)
+            print(f"  done: {manifest_key(raw)} ({n} rows)")
+
+    dt = time.perf_counter() - t0
+    print(f"Decoded {len(todo)} file(s), {total_rows} rows in {dt:.1f} s "
+          f"({total_rows / max(dt, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Battery-sizing parameter sweep: net_bat_power.py's battery estimate over a
+grid of settings, from one load of the session, written to a table.
+
+Every net_bat_power.py setting can be given as a list or a range:
+
+  --kt 0.14,0.16,0.18   --tau-peak 8:14:1   --eta-fwd 0.85:0.95:0.01
+  --eta-regen ...   --v-batt 44,48,52   --unidirectional both|on|off
+  --eta-motor-peak / --eta-motor-min / --tau-max
+
+Only Kt and the motor-efficiency curve change the per-sample motor terms, so
+each of those combinations takes one pass over the session
+(MotorModel.battery_terms), optionally spread over --workers processes. Per
+row that pass leaves
+
+  P_batt = drive / η_fwd + η_regen · regen        (regen dropped if unidirectional)
+
+which is linear in 1/η_fwd and η_regen, so the remaining settings are
+broadcast over a handful of sums:
+
+  total Wh           trapezoid weights · drive / regen
+  mean current       sample mean of P_batt / V (as net_bat_power.py plots)
+  peak current       max over the Pareto front of (drive, regen) rows —
+                     exact, since no other row can be the maximum
+  regen fraction     energy returned / energy drawn
+
+Output: one row per combination, CSV (or .parquet if pandas can write it).
+
+Usage:
+  python battery_sweep.py -i Experiment5/gait_data_log_20251120_151836_decoded.csv -o sweep.csv \\
+      --eta-fwd 0.85:0.95:0.01 --eta-regen 0:0.9:0.1 --v-batt 44,48,52 --unidirectional both
+  python battery_sweep.py -i decoded.csv --kt 0.14:0.18:0.01 --tau-peak 8:14:0.5 --workers 4
+"""
+
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from clock_sync import load_model
+from gait_cache import load_decoded
+from motor_model import (ETA_MIN, ETA_PEAK, MOTOR_PARAMS, TAU_MAX, TAU_PEAK, EfficiencyTable,
+                         MotorModel)
+from net_bat_power import DEFAULT_CSV, MOTORS, build_timebase
+
+MOTOR_KEYS = ["kt", "eta_motor_min", "eta_motor_peak", "tau_peak", "tau_max"]
+
+
+def parse_values(spec):
+    """'a,b,c' or 'start:stop:step' (stop included) → sorted unique float array."""
+    vals = []
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, stop, step = (float(v) for v in part.split(":"))
+            if step <= 0:
+                raise argparse.ArgumentTypeError(f"step must be > 0 in {part!r}")
+            n = int(np.floor((stop - start) / step + 1e-9)) + 1
+            vals.extend(start + step * np.arange(max(n, 0)))
+        else:
+            vals.append(float(part))
+    if not vals:
+        raise argparse.ArgumentTypeError(f"no values in {spec!r}")
+    return np.unique(np.round(vals, 12))
+
+
+def trapezoid_weights(t):
+    """w with sum(w * y) == cumulative_trapezoid(y, t)[-1]."""
+    w = np.zeros(len(t))
+    if len(t) > 1:
+        dt = np.diff(t)
+        w[:-1] += 0.5 * dt
+        w[1:] += 0.5 * dt
+    return w
+
+
+def pareto_front(drive, regen):
+    """Rows not beaten in both drive (larger) and regen (closer to 0) by another row."""
+    order = np.lexsort((-regen, -drive))         # drive desc, then regen desc
+    r = regen[order]
+    best_before = np.r_[-np.inf, np.maximum.accumulate(r)[:-1]]
+    keep = order[r > best_before]
+    return drive[keep], regen[keep]
+
+
+# ---------- one pass per motor setting ----------
+_SESSION = {}
+
+
+def _init_session(current, omega, weights, pole_pairs, gear):
+    _SESSION.update(current=current, omega=omega, weights=weights,
+                    pole_pairs=pole_pairs, gear=gear)
+
+
+def motor_pass(setting):
+    """Sums and Pareto front of (drive, regen) for one (kt, efficiency curve) setting."""
+    kt, eta_min, eta_peak, tau_peak, tau_max = setting
+    s = _SESSION
+    model = MotorModel(MOTORS, kt=kt, pole_pairs=s["pole_pairs"], gear=s["gear"],
+                       eta_table=EfficiencyTable.from_curve(eta_min, eta_peak, tau_peak, tau_max))
+    drive, regen = model.battery_terms(s["current"], s["omega"])
+    front = pareto_front(drive, regen)
+    return {
+        "drive_J": float(s["weights"] @ drive), "regen_J": float(s["weights"] @ regen),
+        "drive_mean": float(drive.mean()), "regen_mean": float(regen.mean()),
+        "front_drive": front[0], "front_regen": front[1],
+    }
+
+
+def evaluate(terms, eta_fwd, eta_regen, v_batt, unidirectional):
+    """Broadcast the cheap settings over one motor pass; returns {column: flat array}."""
+    ef, er, vb, uni = np.meshgrid(eta_fwd, eta_regen, v_batt, unidirectional, indexing="ij")
+    ef, er, vb, uni = (a.ravel() for a in (ef, er, vb, uni))
+    eta_regen_col = np.where(uni, np.nan, er)
+    ef = np.maximum(ef, 1e-6)                        # same floors as net_bat_power.py
+    er = np.where(uni, 0.0, np.maximum(er, 1e-6))   # unidirectional: no regen term
+
+    drawn_J = terms["drive_J"] / ef
+    returned_J = er * terms["regen_J"]               # ≤ 0
+    mean_p = terms["drive_mean"] / ef + er * terms["regen_mean"]
+    # peak of drive/ef + er*regen over the Pareto rows (few), for every combination
+    peak_p = (terms["front_drive"][None, :] / ef[:, None]
+              + er[:, None] * terms["front_regen"][None, :]).max(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        regen_fraction = np.where(drawn_J > 0, -returned_J / drawn_J, 0.0)
+    return {
+        "eta_fwd": ef, "eta_regen": eta_regen_col, "v_batt": vb,
+        "unidirectional": uni.astype(bool),
+        "total_Wh": (drawn_J + returned_J) / 3600.0,
+        "drawn_Wh": drawn_J / 3600.0,
+        "returned_Wh": -returned_J / 3600.0,
+        "mean_current_A": mean_p / vb,
+        "peak_current_A": peak_p / vb,
+        "peak_power_W": peak_p,
+        "regen_fraction": regen_fraction,
+    }
+
+
+def sweep(df, t, grid, pole_pairs, gear, workers=1):
+    """DataFrame with one row per combination of the grid's settings."""
+    probe = MotorModel(MOTORS, pole_pairs=pole_pairs, gear=gear)
+    session = (probe.currents(df), probe.rotor_omega(df), trapezoid_weights(t), pole_pairs, gear)
+    settings = list(itertools.product(*(grid[k] for k in MOTOR_KEYS)))
+
+    if workers > 1 and len(settings) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_session,
+                                 initargs=session) as pool:
+            passes = list(pool.map(motor_pass, settings))
+    else:
+        _init_session(*session)
+        passes = [motor_pass(s) for s in settings]
+
+    frames = []
+    for setting, terms in zip(settings, passes):
+        cols = evaluate(terms, grid["eta_fwd"], grid["eta_regen"], grid["v_batt"],
+                        grid["unidirectional"])
+        n = len(cols["eta_fwd"])
+        motor_cols = {k: np.full(n, v) for k, v in zip(MOTOR_KEYS, setting)}
+        frames.append(pd.DataFrame({**motor_cols, **cols}))
+    out = pd.concat(frames, ignore_index=True)
+    # unidirectional rows don't depend on eta_regen: keep one of each
+    keys = MOTOR_KEYS + ["eta_fwd", "v_batt", "unidirectional"]
+    dup = out["unidirectional"] & out.duplicated(keys)
+    return out[~dup].reset_index(drop=True)
+
+
+def main():
+    ak10 = MOTOR_PARAMS["AK10-9"]
+    ap = argparse.ArgumentParser(description="Sweep net_bat_power.py settings over one session.")
+    ap.add_argument("-i", "--input", type=Path, default=DEFAULT_CSV, help="Path to decoded CSV")
+    ap.add_argument("-o", "--output", type=Path, default=Path("battery_sweep.csv"),
+                    help="Result table (.csv, or .parquet)")
+    ap.add_argument("--v-batt", "--v_batt", type=parse_values, default=parse_values("48"),
+                    help="Battery voltage(s) (V)")
+    ap.add_argument("--eta-fwd", "--eta_fwd", type=parse_values, default=parse_values("0.90"),
+                    help="Converter efficiency forward")
+    ap.add_argument("--eta-regen", "--eta_regen", type=parse_values, default=parse_values("0.90"),
+                    help="Converter efficiency on regen")
+    ap.add_argument("--unidirectional", choices=["off", "on", "both"], default="off",
+                    help="No backflow to battery: off, on, or both")
+    ap.add_argument("--kt", type=parse_values, default=parse_values(str(ak10["kt"])),
+                    help="Torque constant(s) Kt (N·m/A)")
+    ap.add_argument("--eta-motor-peak", type=parse_values, default=parse_values(str(ETA_PEAK)))
+    ap.add_argument("--eta-motor-min", type=parse_values, default=parse_values(str(ETA_MIN)))
+    ap.add_argument("--tau-peak", type=parse_values, default=parse_values(str(TAU_PEAK)),
+                    help="Torque(s) where efficiency peaks (N·m)")
+    ap.add_argument("--tau-max", type=parse_values, default=parse_values(str(TAU_MAX)))
+    ap.add_argument("--pole-pairs", type=int, default=ak10["pole_pairs"],
+                    help="Motor pole pairs for eRPM→mech RPM")
+    ap.add_argument("--gear", type=float, default=ak10["gear"], help="Gear ratio")
+    ap.add_argument("--dt", type=float, default=0.04, help="Sample period (s), without a drift model")
+    ap.add_argument("--sync", type=Path, default=None,
+                    help="gait_sync CSV or drift model JSON (default: gait_sync_<stamp>.csv next to input)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Processes for the per-(Kt, efficiency curve) passes")
+    args = ap.parse_args()
+
+    grid = {
+        "kt": args.kt, "eta_motor_min": args.eta_motor_min, "eta_motor_peak": args.eta_motor_peak,
+        "tau_peak": args.tau_peak, "tau_max": args.tau_max,
+        "eta_fwd": args.eta_fwd, "eta_regen": args.eta_regen, "v_batt": args.v_batt,
+        "unidirectional": {"off": [False], "on": [True], "both": [False, True]}[args.unidirectional],
+    }
+
+    df = load_decoded(args.input)
+    t = build_timebase(df, args.dt, load_model(args.input, args.sync))
+    n_pass = int(np.prod([len(grid[k]) for k in MOTOR_KEYS]))
+
+    t0 = time.perf_counter()
+    res = sweep(df, t, grid, args.pole_pairs, args.gear, args.workers)
+    elapsed = time.perf_counter() - t0
+
+    if args.output.suffix.lower() == ".parquet":
+        res.to_parquet(args.output, index=False)
+    else:
+        res.to_csv(args.output, index=False)
+
+    print(f"Session: {args.input.name}  {len(df)} rows, {t[-1] - t[0]:.1f} s")
+    print(f"{len(res)} combinations ({n_pass} motor pass(es)) in {elapsed:.2f} s → {args.output}")
+    lo, hi = res["total_Wh"].idxmin(), res["total_Wh"].idxmax()
+    pd.set_option("display.width", 160)
+    print(res.loc[[lo, hi]].to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the analysis pipeline.
+
+Builds deterministic synthetic sessions in the exact on-disk layouts
+(raw gait_data_log as written by serial_in.py, owon_log as written by
+owon_logger.py, BMS detaillogs-*.txt as exported by the BMS tool) and times
+each stage as its own process, exactly as it is run by hand:
+
+  decode      decode_exo_can_csv.py raw → _decoded.csv
+  merge_gait  motor_reading_appending.py raw raw
+  merge_owon  owon_appending.py owon owon
+  power       net_bat_power.py -i decoded
+  sync        owon_voltage.py bms decoded owon --session (no HHMMSS prompt)
+  plot        plot_params.py -i decoded, plotter.py owon --save
+
+For every stage/size it records wall time, peak RSS (from wait4) and rows/s,
+appends the run to a JSON history, and flags stages that got slower than
+the previous run by more than --threshold. Inputs and history default to
+.cache/bench/ next to this script (gitignored).
+
+Usage:
+  python bench_pipeline.py                       # 10k, 1M, 10M rows
+  python bench_pipeline.py --sizes 10k,1M --stages decode,power
+  python bench_pipeline.py --sizes 10k --history /tmp/bench_history.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from decode_exo_can_csv import MOTOR_ORDER
+from serial_in import infer_header_for_width
+
+HERE = Path(__file__).resolve().parent
+BENCH_CACHE = HERE / ".cache" / "bench"
+DEFAULT_SIZES = "10k,1M,10M"
+STAGES = ["decode", "merge_gait", "merge_owon", "power", "sync", "plot"]
+ROW_PERIOD_US = 11108          # printed-row spacing of the current firmware
+OWON_PERIOD_S = 0.05
+BMS_PERIOD_S = 5.0
+START_EPOCH = 1763612316.0     # 2025-11-20 15:18:36, like Experiment5
+GEN_CHUNK = 200_000
+BMS_COLUMNS = ["Date & Time", "System Log", "Charge MOS Status", "Discharge MOS Status",
+               "Balance Status", "Heating Status", "Max Cell Voltage No", "Min Cell Voltage No",
+               "Max Cell Voltage", "Min Cell Voltage", "Battery Voltage", "Battery Current",
+               "SOC Cap. Remain", "SOC Full Charge Cap.", "Max Temp", "Min Temp", "Temp MOS",
+               "Heat Current"]
+
+
+def parse_size(s):
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+
+# ---------- synthetic data ----------
+BYTE_TEXT = np.array([str(b) for b in range(256)], dtype=object)
+
+
+def _gait_chunk(start, n, rng):
+    """Raw text lines for rows start..start+n with plausible CAN payloads."""
+    i = np.arange(start, start + n, dtype=np.int64)
+    step = 5 * i
+    elapsed = 1_000_000 + i * ROW_PERIOD_US + rng.integers(-40, 40, n)
+    l_idx = step % 100
+    r_idx = (step + 50) % 100
+    cols = [step.astype(str), elapsed.astype(str), l_idx.astype(str), r_idx.astype(str)]
+    for mi, _ in enumerate(MOTOR_ORDER):
+        idx = l_idx if mi >= 2 else r_idx
+        ph = 2 * np.pi * idx / 100.0 + mi
+        words = [
+            np.round(300 * np.sin(ph)),                                  # pos  ×0.1 deg
+            np.round(150 * np.cos(ph) + rng.normal(0, 5, n)),            # spd  ×10 eRPM
+            np.round(250 * np.sin(ph + 0.3) + rng.normal(0, 20, n)),     # cur  ×0.01 A
+        ]
+        for w in words:
+            w = w.astype(np.int64) & 0xFFFF
+            cols += [BYTE_TEXT[w >> 8], BYTE_TEXT[w & 0xFF]]
+        cols.append(BYTE_TEXT[(33 + (i // 50_000) % 8 + mi).astype(np.int64)])   # temp
+        err = np.where(rng.random(n) < 1e-4, 1, 0)
+        cols.append(BYTE_TEXT[err])
+    return [",".join(r) for r in zip(*cols)]
+
+
+def make_gait(path, rows, seed=0):
+    """Raw gait log as serial_in.py writes it (expanded header, one chatter row)."""
+    rng = np.random.default_rng(seed)
+    with path.open("w", newline="") as f:
+        f.write(",".join(infer_header_for_width(36)) + "\r\n")
+        f.write("Moving legs to start\r\n")
+        for start in range(0, rows, GEN_CHUNK):
+            lines = _gait_chunk(start, min(GEN_CHUNK, rows - start), rng)
+            f.write("\r\n".join(lines) + "\r\n")
+
+
+def make_owon(path, duration_s, seed=1):
+    """OWON log (epoch_s, iso_time, value, raw) at 20 Hz over the session."""
+    rng = np.random.default_rng(seed)
+    n = int(duration_s / OWON_PERIOD_S) + 1
+    with path.open("w", newline="") as f:
+        f.write("epoch_s,iso_time,value,raw\r\n")
+        for start in range(0, n, GEN_CHUNK):
+            k = np.arange(start, min(n, start + GEN_CHUNK))
+            t = START_EPOCH + k * OWON_PERIOD_S + rng.normal(0, 0.002, len(k))
+            v = 1.5 + 0.6 * np.sin(2 * np.pi * k * OWON_PERIOD_S / 1.1) + rng.normal(0, 0.05, len(k))
+            f.write("".join(
+                f"{ti!r},{datetime.fromtimestamp(ti).isoformat()},{vi:.7g},{vi:.6E}\r\n"
+                for ti, vi in zip(t.tolist(), v.tolist())))
+
+
+def make_bms(path, duration_s, seed=2):
+    """BMS detaillogs-*.txt export (', '-padded) covering the session."""
+    rng = np.random.default_rng(seed)
+    t0 = START_EPOCH - 30
+    n = int((duration_s + 60) / BMS_PERIOD_S) + 1
+    sep = ",   "
+    with path.open("w", newline="") as f:
+        f.write(sep.join(BMS_COLUMNS) + "\n")
+        for k in range(n):
+            ts = datetime.fromtimestamp(t0 + k * BMS_PERIOD_S).strftime("%Y-%m-%d %H:%M:%S")
+            v = 48.7 - 2.0 * k / n + rng.normal(0, 0.05)
+            i = 1.5 + rng.normal(0, 0.2)
+            f.write(sep.join([ts, "Unknown Log Code [0]", "CHG ON", "DSG ON", "BALANCE ON", "HEAT OFF",
+                              "5", "6", "3.7", "3.7", f"{v:.1f}", f"{i:.1f}", "2.0", "3.0",
+                              "27", "26", "29", "0.0"]) + "\n")
+
+
+def build_session(workdir, rows):
+    """Create (or reuse) the synthetic files for one size; returns a dict of paths."""
+    d = workdir / f"rows_{rows}"
+    d.mkdir(parents=True, exist_ok=True)
+    duration_s = rows * ROW_PERIOD_US * 1e-6
+    p = {
+        "gait": d / "gait_data_log_bench.csv",
+        "owon": d / "owon_log_bench.csv",
+        "bms": d / "detaillogs-bench.txt",
+        "session": d / "session.json",
+        "decoded": d / "gait_data_log_bench_decoded.csv",
+        "dir": d,
+    }
+    for key, maker, arg in (("gait", make_gait, rows), ("owon", make_owon, duration_s),
+                            ("bms", make_bms, duration_s)):
+        if not p[key].exists():
+            t = time.perf_counter()
+            tmp = p[key].with_name(p[key].name + ".tmp")
+            maker(tmp, arg)
+            tmp.replace(p[key])
+            print(f"  generated {p[key].name} in {time.perf_counter() - t:.1f} s")
+    # Gait starts when Elapsed_us = 0, one second before the first row
+    p["session"].write_text(json.dumps({"gait_start_epoch_s": START_EPOCH - 1.0}))
+    return p
+
+
+# ---------- stage runner ----------
+def run_stage(cmd, log, timeout=None):
+    """Run one stage; returns (ok, wall_s, peak_rss_MiB) using wait4 for the child's rusage."""
+    env = dict(os.environ, MPLBACKEND="Agg")
+    t = time.perf_counter()
+    with log.open("w") as out:
+        proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=out, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL)
+        deadline = None if timeout is None else t + timeout
+        while True:
+            pid, status, ru = os.wait4(proc.pid, os.WNOHANG if deadline else 0)
+            if pid:
+                break
+            if time.perf_counter() > deadline:
+                proc.kill()
+                pid, status, ru = os.wait4(proc.pid, 0)
+                break
+            time.sleep(0.05)
+    wall = time.perf_counter() - t
+    proc.returncode = os.waitstatus_to_exitcode(status)   # already reaped by wait4
+    return proc.returncode == 0, wall, ru.ru_maxrss / 1024.0
+
+
+def stage_commands(stage, p):
+    """[(label, argv, input_rows_key)] for a stage."""
+    py = sys.executable
+    out = p["dir"]
+    if stage == "decode":
+        return [("decode", [py, "decode_exo_can_csv.py", str(p["gait"]), "-o", str(p["decoded"])], "gait")]
+    if stage == "merge_gait":
+        return [("merge_gait", [py, "motor_reading_appending.py", str(p["gait"]), str(p["gait"]),
+                                "-o", str(out / "merged_gait.csv")], "gait")]
+    if stage == "merge_owon":
+        return [("merge_owon", [py, "owon_appending.py", str(p["owon"]), str(p["owon"]),
+                                "-o", str(out / "merged_owon.csv")], "owon")]
+    if stage == "power":
+        return [("power", [py, "net_bat_power.py", "-i", str(p["decoded"])], "gait")]
+    if stage == "sync":
+        return [("sync", [py, "owon_voltage.py", str(p["bms"]), str(p["decoded"]), str(p["owon"]),
+                          "--session", str(p["session"]), "--save",
+                          "--output", str(out / "sync.png")], "gait")]
+    if stage == "plot":
+        return [("plot_params", [py, "plot_params.py", "-i", str(p["decoded"]), "-o", str(out),
+                                 "--force"], "gait"),
+                ("plot_owon", [py, "plotter.py", str(p["owon"]), "--save"], "owon")]
+    raise ValueError(stage)
+
+
+def count_rows(path):
+    with path.open("rb") as f:
+        return max(0, sum(buf.count(b"\n") for buf in iter(lambda: f.read(1 << 20), b"")) - 1)
+
+
+# ---------- history ----------
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_history(path):
+    if path.exists():
+        try:
+            return json.loads(path.read_text())
+        except ValueError:
+            print(f"[WARN] {path} is not valid JSON; starting a new history")
+    return []
+
+
+def previous_result(history, stage, rows):
+    for run in reversed(history):
+        for r in run["results"]:
+            if r["stage"] == stage and r["rows"] == rows and r["ok"]:
+                return r
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Time each analysis stage on synthetic sessions.")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="Gait row counts, e.g. 10k,1M,10M")
+    ap.add_argument("--stages", default=",".join(STAGES), help=f"Subset of {','.join(STAGES)}")
+    ap.add_argument("--workdir", type=Path, default=BENCH_CACHE / "data",
+                    help="Where synthetic inputs and outputs live (reused between runs)")
+    ap.add_argument("--history", type=Path, default=BENCH_CACHE / "history.json",
+                    help="JSON list of previous runs, appended to")
+    ap.add_argument("--timeout", type=float, default=None, help="Per-stage timeout (s)")
+    ap.add_argument("--threshold", type=float, default=0.20,
+                    help="Flag stages slower than the last run by this fraction")
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    for s in stages:
+        if s not in STAGES:
+            ap.error(f"unknown stage {s!r}")
+    # sync/power/plot need the decoded CSV
+    if any(s in stages for s in ("power", "sync", "plot")) and "decode" not in stages:
+        stages.insert(0, "decode")
+
+    history = load_history(args.history)
+    run = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_rev(),
+        "python": platform.python_version(),
+        "machine": f"{platform.machine()} {os.cpu_count()} cpu",
+        "results": [],
+    }
+
+    for size in [parse_size(s) for s in args.sizes.split(",")]:
+        print(f"\n=== {size:,} rows ===")
+        p = build_session(args.workdir, size)
+        input_rows = {"gait": size, "owon": count_rows(p["owon"])}
+        for stage in [s for s in STAGES if s in stages]:
+            for label, cmd, rows_key in stage_commands(stage, p):
+                log = p["dir"] / f"{label}.log"
+                ok, wall, rss = run_stage(cmd, log, args.timeout)
+                rows = input_rows[rows_key]
+                res = {"stage": label, "rows": size, "input_rows": rows, "ok": ok,
+                       "wall_s": round(wall, 4), "peak_rss_MiB": round(rss, 1),
+                       "rows_per_s": round(rows / wall, 1) if wall > 0 else None}
+                prev = previous_result(history, label, size)
+                flag = ""
+                if not ok:
+                    flag = f"  FAILED (see {log})"
+                elif prev:
+                    change = wall / prev["wall_s"] - 1.0
+                    res["vs_prev"] = round(change, 4)
+                    flag = f"  {change:+.0%} vs {prev['wall_s']:.2f} s"
+                    if change > args.threshold:
+                        flag += "  <-- REGRESSION"
+                print(f"  {label:12s} {wall:9.2f} s  {rss:8.1f} MiB  "
+                      f"{res['rows_per_s'] or 0:12,.0f} rows/s{flag}")
+                run["results"].append(res)
+
+    history.append(run)
+    args.history.parent.mkdir(parents=True, exist_ok=True)
+    args.history.write_text(json.dumps(history, indent=1))
+    print(f"\nAppended run to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Typed loader (with .npz cache) for the BMS tool's detaillogs-*.txt exports.
+
+The exports are ",   "-padded text with string flags ("CHG ON", "BALANCE OFF")
+and a footer of free-text notes. read_bms() parses one file into typed
+arrays with a fixed timestamp format:
+
+  time            datetime64[s]
+  log             int16 index into log_texts (the "System Log" strings)
+  chg_mos, dsg_mos, balance, heat              bool
+  max_cell_no, min_cell_no                     int8
+  max_cell_v, min_cell_v, pack_v, current_a,
+  cap_remain_ah, cap_full_ah, heat_current_a   float32
+  max_temp_c, min_temp_c, mos_temp_c           int16
+
+Rows whose time doesn't parse (footer, repeated headers) or that fall before
+VALID_FROM (the BMS boots with its RTC at 2020-01-01) are dropped.
+
+The arrays are cached next to the log (X.txt → X.npz) and reused while the
+cache is at least as new as the log. load_bms() concatenates any number of
+exports — they overlap, since each one holds the BMS's whole history — sorts
+them by time and drops repeated rows, returning a DataFrame with the
+export's column names plus DateTime.
+
+Usage:
+  python bms_log.py logs/detaillogs-*.txt
+  python bms_log.py logs/detaillogs-*.txt --force --csv logs/bms_all.csv
+"""
+
+import argparse
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".npz"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+VALID_FROM = np.datetime64("2021-01-01")
+
+# export header → (key, dtype); flags are (key, "flag", ON text)
+FIELDS = {
+    "Charge MOS Status": ("chg_mos", "flag", "CHG ON"),
+    "Discharge MOS Status": ("dsg_mos", "flag", "DSG ON"),
+    "Balance Status": ("balance", "flag", "BALANCE ON"),
+    "Heating Status": ("heat", "flag", "HEAT ON"),
+    "Max Cell Voltage No": ("max_cell_no", np.int8),
+    "Min Cell Voltage No": ("min_cell_no", np.int8),
+    "Max Cell Voltage": ("max_cell_v", np.float32),
+    "Min Cell Voltage": ("min_cell_v", np.float32),
+    "Battery Voltage": ("pack_v", np.float32),
+    "Battery Current": ("current_a", np.float32),
+    "SOC Cap. Remain": ("cap_remain_ah", np.float32),
+    "SOC Full Charge Cap.": ("cap_full_ah", np.float32),
+    "Max Temp": ("max_temp_c", np.int16),
+    "Min Temp": ("min_temp_c", np.int16),
+    "Temp MOS": ("mos_temp_c", np.int16),
+    "Heat Current": ("heat_current_a", np.float32),
+}
+KEY_TO_HEADER = {spec[0]: h for h, spec in FIELDS.items()}
+
+
+def cache_path_for(log_path):
+    return Path(log_path).with_suffix(CACHE_SUFFIX)
+
+
+def cache_is_fresh(log_path):
+    cache = cache_path_for(log_path)
+    return cache.exists() and cache.stat().st_mtime >= Path(log_path).stat().st_mtime
+
+
+def _data_lines(path):
+    """(header fields, bytes of the lines that start with a timestamp digit)."""
+    with Path(path).open("rb") as f:
+        header = f.readline().decode("utf-8", errors="replace")
+        body = f.read()
+    fields = [c.strip() for c in header.split(",")]
+    while fields and not fields[-1]:
+        fields.pop()
+    lines = body.split(b"\n")
+    return fields, b"\n".join(l for l in lines if l[:1].isdigit())
+
+
+def parse_bms(path):
+    """Parse one export into a dict of typed arrays (see module docstring)."""
+    fields, data = _data_lines(path)
+    if "Date & Time" not in fields:
+        raise ValueError(f"{path}: no 'Date & Time' column")
+    dtypes = {h: ("category" if spec[1] == "flag" else np.float64)
+              for h, spec in FIELDS.items() if h in fields}
+    dtypes["System Log"] = "category"
+    raw = pd.read_csv(io.BytesIO(data), header=None, names=fields, usecols=range(len(fields)),
+                      skipinitialspace=True, dtype=dtypes, keep_default_na=False,
+                      na_values={h: [""] for h in dtypes if dtypes[h] is np.float64},
+                      on_bad_lines="skip")
+
+    time = pd.to_datetime(raw["Date & Time"], format=TIME_FORMAT, errors="coerce")
+    time = time.to_numpy().astype("datetime64[s]")
+    keep = ~np.isnat(time) & (time >= VALID_FROM)
+
+    arrays = {"time": time[keep]}
+    if "System Log" in raw.columns:
+        logs = raw["System Log"][keep]
+        texts = np.array([str(c).strip() for c in logs.cat.categories], dtype=str)
+        arrays["log"] = logs.cat.codes.to_numpy().astype(np.int16)
+        arrays["log_texts"] = texts
+    else:
+        arrays["log"] = np.zeros(int(keep.sum()), dtype=np.int16)
+        arrays["log_texts"] = np.array([""], dtype=str)
+    for header, spec in FIELDS.items():
+        if header not in raw.columns:
+            continue
+        col = raw[header][keep]
+        if spec[1] == "flag":
+            on = [c for c in col.cat.categories if str(c).strip() == spec[2]]
+            arrays[spec[0]] = col.isin(on).to_numpy()
+        else:
+            num = col.to_numpy(dtype=float)
+            if np.issubdtype(spec[1], np.integer):
+                num = np.nan_to_num(num, nan=-1)
+            arrays[spec[0]] = num.astype(spec[1])
+    return arrays
+
+
+def write_cache(cache, arrays, source=None):
+    meta = {"version": CACHE_VERSION, "source": str(source) if source else ""}
+    tmp = Path(cache).with_name(Path(cache).name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+    tmp.replace(cache)
+    return cache
+
+
+def read_cache(cache):
+    with np.load(cache, allow_pickle=False) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta.get("version") != CACHE_VERSION:
+            raise ValueError(f"{cache}: unsupported cache version {meta.get('version')}")
+        return {k: z[k] for k in z.files if k != "meta"}
+
+
+def read_bms(path, use_cache=True, write=True):
+    """Typed arrays for one export, via its cache when that is up to date."""
+    path = Path(path)
+    cache = cache_path_for(path)
+    if use_cache and cache_is_fresh(path):
+        try:
+            return read_cache(cache)
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable/old cache → reparse
+    arrays = parse_bms(path)
+    if use_cache and write:
+        try:
+            write_cache(cache, arrays, source=path.name)
+        except OSError:
+            pass  # read-only location; parsing still worked
+    return arrays
+
+
+def to_frame(arrays):
+    """DataFrame with the export's column names (+ DateTime, System Log text)."""
+    cols = {"DateTime": arrays["time"].astype("datetime64[ns]")}
+    texts = arrays["log_texts"].astype(object)
+    cols["System Log"] = texts[arrays["log"]] if len(texts) else np.array([], dtype=object)
+    for key, header in KEY_TO_HEADER.items():
+        if key in arrays:
+            cols[header] = arrays[key]
+    return pd.DataFrame(cols)
+
+
+def load_bms(paths, use_cache=True):
+    """One time-sorted, de-duplicated DataFrame from any number of exports."""
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    frames = [to_frame(read_bms(p, use_cache)) for p in paths]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if len(frames) > 1 or not df["DateTime"].is_monotonic_increasing:
+        df = df.sort_values("DateTime", kind="stable").drop_duplicates().reset_index(drop=True)
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parse/cache BMS detaillogs exports.")
+    ap.add_argument("logs", nargs="+", type=Path, help="detaillogs-*.txt files")
+    ap.add_argument("--force", action="store_true", help="Rebuild caches even if fresh")
+    ap.add_argument("--csv", type=Path, default=None, help="Also write the merged history as CSV")
+    args = ap.parse_args()
+
+    for p in args.logs:
+        fresh = cache_is_fresh(p) and not args.force
+        if fresh:
+            a = read_cache(cache_path_for(p))
+        else:
+            a = parse_bms(p)
+            write_cache(cache_path_for(p), a, source=p.name)
+        span = f"{a['time'].min()} → {a['time'].max()}" if len(a["time"]) else "no valid rows"
+        print(f"{p.name}: {len(a['time'])} rows  {span}  ({'cached' if fresh else 'parsed'})")
+
+    df = load_bms(args.logs)
+    print(f"Merged: {len(df)} rows  {df['DateTime'].min()} → {df['DateTime'].max()}")
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+        print(f"Saved → {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Fixed-width binary store for raw CAN feedback frames.
+
+serial_in.py logs each of the 32 payload bytes as decimal text. This format
+keeps one 48-byte little-endian record per logged row instead:
+
+  Elapsed_us    int64   (-1 for legacy 35-column logs without Elapsed_us)
+  TimeStep      int32
+  L_Gait_Index  int16
+  R_Gait_Index  int16
+  payload       uint8[4][8]   CAN feedback bytes in MOTOR_ORDER (RH, RK, LK, LH)
+
+after a 64-byte file header (magic, version, record size, flags). The reader
+np.memmap's the records as a structured array, so any time window of a long
+session is a binary search + slice, with no parsing.
+
+Usage:
+  python can_frame_store.py convert gait_data_log_20251120_151836.csv
+  python can_frame_store.py info gait_data_log_20251120_151836.bin
+  python can_frame_store.py window gait_data_log_20251120_151836.bin --t0 60 --t1 90 -o window_decoded.csv
+"""
+
+import argparse
+import csv
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from decode_exo_can_csv import MOTOR_ORDER, decoded_header, write_decoded_chunk
+from serial_in import infer_header_for_width
+
+MAGIC = b"EXOCAN\0\0"
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_FMT = "<8sIII"          # magic, version, record size, flags
+FLAG_HAS_ELAPSED = 0x1
+NO_ELAPSED = -1
+
+RECORD_DTYPE = np.dtype([
+    ("Elapsed_us", "<i8"),
+    ("TimeStep", "<i4"),
+    ("L_Gait_Index", "<i2"),
+    ("R_Gait_Index", "<i2"),
+    ("payload", "u1", (len(MOTOR_ORDER), 8)),
+])
+
+CHUNK_ROWS = 65536
+
+
+# ---------- writing ----------
+def write_header(f, has_elapsed=True):
+    flags = FLAG_HAS_ELAPSED if has_elapsed else 0
+    hdr = struct.pack(HEADER_FMT, MAGIC, VERSION, RECORD_DTYPE.itemsize, flags)
+    f.write(hdr.ljust(HEADER_SIZE, b"\0"))
+
+
+def make_records(meta, payload):
+    """
+    Pack decoder-style arrays into records.
+    meta int64 (n, 4): TimeStep, Elapsed_us, L_Gait_Index, R_Gait_Index
+    payload uint8 (n, 4, 8)
+    """
+    rec = np.empty(len(meta), dtype=RECORD_DTYPE)
+    rec["TimeStep"] = meta[:, 0]
+    rec["Elapsed_us"] = meta[:, 1]
+    rec["L_Gait_Index"] = meta[:, 2]
+    rec["R_Gait_Index"] = meta[:, 3]
+    rec["payload"] = payload
+    return rec
+
+
+def append_records(f, meta, payload):
+    """Append one chunk of frames to an open store file."""
+    f.write(make_records(meta, payload).tobytes())
+
+
+# ---------- CSV → binary ----------
+def _parse_block(lines, ncols):
+    """float64 (n, ncols) from numeric text lines; bad lines are dropped."""
+    try:
+        return np.loadtxt(lines, delimiter=",", dtype=np.float64, comments=None, ndmin=2)
+    except ValueError:
+        if len(lines) > 64:
+            mid = len(lines) // 2
+            return np.concatenate([_parse_block(lines[:mid], ncols), _parse_block(lines[mid:], ncols)])
+        rows = []
+        for line in lines:
+            try:
+                rows.append([float(x) for x in line.split(",")])
+            except ValueError:
+                continue
+        return np.array(rows, dtype=np.float64).reshape(-1, ncols)
+
+
+def _block_to_arrays(lines, ncols):
+    """Convert a run of same-width lines to (meta, payload) using the serial_in layout."""
+    cols = infer_header_for_width(ncols)
+    idx = {c: i for i, c in enumerate(cols)}
+    vals = np.trunc(_parse_block(lines, ncols))
+    first = idx["RH_0"]
+    ok = np.isfinite(vals).all(axis=1)
+    ok &= ((vals[:, first:first + 32] >= 0) & (vals[:, first:first + 32] <= 255)).all(axis=1)
+    vals = vals[ok]
+
+    meta = np.empty((len(vals), 4), dtype=np.int64)
+    meta[:, 0] = vals[:, idx["TimeStep"]]
+    meta[:, 1] = vals[:, idx["Elapsed_us"]] if "Elapsed_us" in idx else NO_ELAPSED
+    meta[:, 2] = vals[:, idx["L_Gait_Index"]]
+    meta[:, 3] = vals[:, idx["R_Gait_Index"]]
+    payload = vals[:, first:first + 32].astype(np.uint8).reshape(-1, len(MOTOR_ORDER), 8)
+    return meta, payload
+
+
+def iter_csv_blocks(f_in, chunk_rows=CHUNK_ROWS):
+    """
+    Yield (ncols, meta, payload) from a raw serial_in.py CSV. Handles both the
+    36-column (with Elapsed_us) and legacy 35-column layouts; headers, chatter
+    and rows of any other width are skipped.
+    """
+    lines, width = [], None
+    for line in f_in:
+        line = line.strip()
+        if not line[:1].isdigit():
+            continue
+        ncols = line.count(",") + 1
+        if infer_header_for_width(ncols) is None:
+            continue
+        if width is not None and (ncols != width or len(lines) >= chunk_rows):
+            yield (width,) + _block_to_arrays(lines, width)
+            lines = []
+        width = ncols
+        lines.append(line)
+    if lines:
+        yield (width,) + _block_to_arrays(lines, width)
+
+
+def convert_csv(input_csv, out_path=None):
+    """Convert a raw gait CSV to the binary store. Returns (out_path, rows)."""
+    input_csv = Path(input_csv)
+    out_path = Path(out_path) if out_path else input_csv.with_suffix(".bin")
+    rows = 0
+    has_elapsed = True
+    with input_csv.open("r", newline="") as f_in, out_path.open("wb") as f_out:
+        write_header(f_out, has_elapsed=True)
+        for ncols, meta, payload in iter_csv_blocks(f_in):
+            has_elapsed &= "Elapsed_us" in infer_header_for_width(ncols)
+            append_records(f_out, meta, payload)
+            rows += len(meta)
+        if not has_elapsed:
+            f_out.seek(0)
+            write_header(f_out, has_elapsed=False)
+    return out_path, rows
+
+
+# ---------- reading ----------
+def read_header(path):
+    with Path(path).open("rb") as f:
+        hdr = f.read(HEADER_SIZE)
+    if len(hdr) < HEADER_SIZE:
+        raise ValueError(f"{path}: truncated header")
+    magic, version, rec_size, flags = struct.unpack_from(HEADER_FMT, hdr)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a CAN frame store (bad magic)")
+    if version != VERSION or rec_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: unsupported version {version} / record size {rec_size}")
+    return {"version": version, "record_size": rec_size, "has_elapsed": bool(flags & FLAG_HAS_ELAPSED)}
+
+
+def open_frames(path):
+    """Memory-map a store as a read-only structured array (RECORD_DTYPE)."""
+    read_header(path)
+    n = (Path(path).stat().st_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if n <= 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n,))
+
+
+def window(frames, t0_s=None, t1_s=None):
+    """
+    Records with t0_s <= Elapsed_us * 1e-6 <= t1_s, found by binary search
+    (Elapsed_us is monotonic within a session). Returns a memmap slice.
+    """
+    t = frames["Elapsed_us"]
+    lo = 0 if t0_s is None else int(np.searchsorted(t, int(round(t0_s * 1e6)), side="left"))
+    hi = len(frames) if t1_s is None else int(np.searchsorted(t, int(round(t1_s * 1e6)), side="right"))
+    return frames[lo:hi]
+
+
+def frames_to_arrays(frames):
+    """(meta, payload) arrays in decoder order from a slice of records."""
+    meta = np.stack([frames["TimeStep"], frames["Elapsed_us"],
+                     frames["L_Gait_Index"], frames["R_Gait_Index"]], axis=1).astype(np.int64)
+    return meta, np.asarray(frames["payload"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Binary CAN frame store: convert, inspect, slice.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("convert", help="Raw gait CSV → binary store")
+    c.add_argument("input_csv", type=Path)
+    c.add_argument("-o", "--output", type=Path, default=None, help="Output (default: <input>.bin)")
+
+    i = sub.add_parser("info", help="Print record count and time span")
+    i.add_argument("store", type=Path)
+
+    w = sub.add_parser("window", help="Decode a time window [t0, t1] (seconds) to CSV")
+    w.add_argument("store", type=Path)
+    w.add_argument("--t0", type=float, default=None)
+    w.add_argument("--t1", type=float, default=None)
+    w.add_argument("--pole-pairs", type=int, default=21)
+    w.add_argument("-o", "--output", type=Path, required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "convert":
+        out, rows = convert_csv(args.input_csv, args.output)
+        ratio = out.stat().st_size / max(args.input_csv.stat().st_size, 1)
+        print(f"Wrote: {out}  ({rows} records, {ratio:.0%} of CSV size)")
+
+    elif args.cmd == "info":
+        hdr = read_header(args.store)
+        frames = open_frames(args.store)
+        print(f"Records: {len(frames)}  (record size {hdr['record_size']} B)")
+        if len(frames) and hdr["has_elapsed"]:
+            t = frames["Elapsed_us"]
+            print(f"Elapsed: {t[0] * 1e-6:.3f} s → {t[-1] * 1e-6:.3f} s")
+        elif len(frames):
+            print(f"TimeStep: {frames['TimeStep'][0]} → {frames['TimeStep'][-1]} (no Elapsed_us)")
+
+    elif args.cmd == "window":
+        if not read_header(args.store)["has_elapsed"]:
+            raise SystemExit("Store has no Elapsed_us (legacy 35-column log); cannot window by time.")
+        sel = window(open_frames(args.store), args.t0, args.t1)
+        meta, payload = frames_to_arrays(sel)
+        with args.output.open("w", newline="") as f_out:
+            csv.writer(f_out).writerow(decoded_header(args.pole_pairs))
+            write_decoded_chunk(f_out, meta, payload, args.pole_pairs)
+        print(f"Wrote: {args.output}  ({len(sel)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Clock-drift model between the ESP32's Elapsed_us (esp_timer) and host time.
+
+serial_in.py and acquire.py write gait_sync_<stamp>.csv next to the gait log:
+
+  host_epoch_s, host_mono_s, TimeStep, Elapsed_us
+
+at most one pair per --sync-period, the row of that period that waited the
+least in USB/OS buffers. This module fits a continuous piecewise-linear
+offset (host - Elapsed) through those pairs:
+
+  - pairs are binned every --bin-s of Elapsed and only the smallest offset
+    per bin is kept (host stamps are only ever late, never early)
+  - the offset is least-squares fitted with knots every --knot-s, so slow
+    crystal drift and temperature changes over hour-long runs are followed
+  - outside the fitted range the end segments are extrapolated
+
+DriftModel.to_epoch(Elapsed_us) then maps a whole column in one call, so
+loaders can use absolute time instead of TimeStep * --dt.
+
+Usage:
+  python clock_sync.py sessions/20251120_151836/gait_sync_20251120_151836.csv
+  python clock_sync.py gait_sync_20251120_151836.csv --knot-s 120 -o drift.json
+"""
+
+import argparse
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+KNOT_S = 300.0   # knot spacing along Elapsed (s)
+BIN_S = 5.0      # min-delay filter window (s)
+MODEL_VERSION = 1
+
+
+def sync_path_for(gait_path):
+    """gait_data_log_<stamp>[_decoded].csv/.npz → gait_sync_<stamp>.csv next to it."""
+    gait_path = Path(gait_path)
+    m = re.match(r"gait_data_log_(.+?)(?:_decoded)?$", gait_path.stem)
+    if not m:
+        return None
+    return gait_path.with_name(f"gait_sync_{m.group(1)}.csv")
+
+
+def read_sync(path):
+    """(elapsed_s, host_epoch_s) arrays from a gait_sync CSV, after the last firmware reset."""
+    df = pd.read_csv(path)
+    el = pd.to_numeric(df["Elapsed_us"], errors="coerce").to_numpy(dtype=float)
+    host = pd.to_numeric(df["host_epoch_s"], errors="coerce").to_numpy(dtype=float)
+    ok = np.isfinite(el) & np.isfinite(host)
+    el, host = el[ok] * 1e-6, host[ok]
+    resets = np.flatnonzero(np.diff(el) < 0)
+    if len(resets):
+        print(f"[WARN] {path}: Elapsed_us went back {len(resets)} time(s) (ESP32 reset); "
+              f"using the pairs after the last one")
+        el, host = el[resets[-1] + 1:], host[resets[-1] + 1:]
+    return el, host
+
+
+def min_filter(elapsed_s, offset_s, bin_s=BIN_S):
+    """Smallest offset (and its Elapsed) in each bin_s window of Elapsed."""
+    if not len(elapsed_s):
+        return elapsed_s, offset_s
+    b = np.floor((elapsed_s - elapsed_s[0]) / bin_s).astype(np.int64)
+    order = np.lexsort((offset_s, b))         # by bin, then by offset
+    b, e, d = b[order], elapsed_s[order], offset_s[order]
+    first = np.r_[True, b[1:] != b[:-1]]
+    return e[first], d[first]
+
+
+class DriftModel:
+    """Piecewise-linear host - Elapsed offset; knots in Elapsed seconds."""
+
+    def __init__(self, knots_s, offsets_s):
+        self.knots_s = np.asarray(knots_s, dtype=float)
+        self.offsets_s = np.asarray(offsets_s, dtype=float)
+
+    @classmethod
+    def fit(cls, elapsed_s, host_s, knot_s=KNOT_S, bin_s=BIN_S):
+        elapsed_s = np.asarray(elapsed_s, dtype=float)
+        e, d = min_filter(elapsed_s, np.asarray(host_s, dtype=float) - elapsed_s, bin_s)
+        if not len(e):
+            raise ValueError("no sync pairs to fit")
+        if len(e) == 1 or e[-1] == e[0]:
+            return cls([e[0], e[0] + 1.0], [d[0], d[0]])
+        nk = int(np.ceil((e[-1] - e[0]) / knot_s)) + 1
+        nk = max(2, min(nk, len(e) // 2 + 1))
+        knots = np.linspace(e[0], e[-1], nk)
+        # Hat-function basis: offset(e) = sum_k w_k(e) * offset_k
+        j = np.clip(np.searchsorted(knots, e, side="right") - 1, 0, nk - 2)
+        frac = (e - knots[j]) / (knots[j + 1] - knots[j])
+        A = np.zeros((len(e), nk))
+        A[np.arange(len(e)), j] = 1.0 - frac
+        A[np.arange(len(e)), j + 1] = frac
+        offsets = np.linalg.lstsq(A, d, rcond=None)[0]
+        return cls(knots, offsets)
+
+    @classmethod
+    def from_sync_csv(cls, path, knot_s=KNOT_S, bin_s=BIN_S):
+        return cls.fit(*read_sync(path), knot_s=knot_s, bin_s=bin_s)
+
+    def offset(self, elapsed_s):
+        """host - Elapsed (s) at the given Elapsed seconds, extrapolating past the ends."""
+        e = np.asarray(elapsed_s, dtype=float)
+        k, d = self.knots_s, self.offsets_s
+        out = np.interp(e, k, d)
+        lo, hi = e < k[0], e > k[-1]
+        if lo.any():
+            out[lo] = d[0] + (e[lo] - k[0]) * (d[1] - d[0]) / (k[1] - k[0])
+        if hi.any():
+            out[hi] = d[-1] + (e[hi] - k[-1]) * (d[-1] - d[-2]) / (k[-1] - k[-2])
+        return out
+
+    def to_epoch(self, elapsed_us):
+        """Host epoch seconds for an Elapsed_us array (or Series)."""
+        e = np.asarray(elapsed_us, dtype=float) * 1e-6
+        return e + self.offset(e)
+
+    def drift_ppm(self):
+        """Drift of each knot interval: +100 ppm = host gains 100 µs per second."""
+        return np.diff(self.offsets_s) / np.diff(self.knots_s) * 1e6
+
+    def to_dict(self):
+        return {"version": MODEL_VERSION, "knots_s": self.knots_s.tolist(),
+                "offsets_s": self.offsets_s.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get("version") != MODEL_VERSION:
+            raise ValueError(f"unsupported drift model version {d.get('version')}")
+        return cls(d["knots_s"], d["offsets_s"])
+
+    def save(self, path):
+        Path(path).write_text(json.dumps(self.to_dict(), indent=1))
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_dict(json.loads(Path(path).read_text()))
+
+
+def load_model(gait_path=None, sync=None, knot_s=KNOT_S, bin_s=BIN_S):
+    """
+    Drift model from `sync` (gait_sync CSV or saved .json), or from the
+    gait_sync CSV next to gait_path. None if there is nothing to fit.
+    """
+    if sync is None and gait_path is not None:
+        sync = sync_path_for(gait_path)
+        if sync is None or not sync.exists():
+            return None
+    if sync is None:
+        return None
+    sync = Path(sync)
+    if sync.suffix.lower() == ".json":
+        return DriftModel.load(sync)
+    return DriftModel.from_sync_csv(sync, knot_s, bin_s)
+
+
+def add_epoch(df, model, column="epoch_s"):
+    """df with a host-epoch column mapped from Elapsed_us."""
+    return df.assign(**{column: model.to_epoch(df["Elapsed_us"].to_numpy())})
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fit the Elapsed_us → host time drift model.")
+    ap.add_argument("sync_csv", type=Path, help="gait_sync_<stamp>.csv")
+    ap.add_argument("--knot-s", type=float, default=KNOT_S, help="Knot spacing (s of Elapsed)")
+    ap.add_argument("--bin-s", type=float, default=BIN_S, help="Min-delay filter window (s)")
+    ap.add_argument("-o", "--output", type=Path, default=None,
+                    help="Model JSON (default: <sync csv>.drift.json)")
+    args = ap.parse_args()
+
+    el, host = read_sync(args.sync_csv)
+    model = DriftModel.fit(el, host, args.knot_s, args.bin_s)
+    resid = host - model.to_epoch(el * 1e6)
+
+    print(f"Pairs: {len(el)}  over {el[-1] - el[0]:.1f} s of Elapsed")
+    print(f"Knots: {len(model.knots_s)}  offset {model.offsets_s[0]:.6f} → {model.offsets_s[-1]:.6f} s")
+    print("Drift per interval (ppm): " + "  ".join(f"{p:.1f}" for p in model.drift_ppm()))
+    print(f"Host delay vs model (ms): p50 {np.percentile(resid, 50) * 1e3:.2f}  "
+          f"p99 {np.percentile(resid, 99) * 1e3:.2f}  min {resid.min() * 1e3:.2f}")
+
+    out = args.output or args.sync_csv.with_suffix(".drift.json")
+    model.save(out)
+    print(f"Saved model → {out}")
+
+
+if __name__ == "__main__":
+    main()
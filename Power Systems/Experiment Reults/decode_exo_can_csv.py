@@ -5,14 +5,40 @@ Decode CubeMars CAN feedback bytes logged by the Arduino gait script.
 STRICT: expects rows with Elapsed_us:
   [TimeStep, Elapsed_us, L_idx, R_idx, 32 bytes...]
 
+Two engines produce byte-for-byte identical output:
+  row    – the original per-row Python decoder
+  numpy  – batch decoder: parses rows in chunks into an (N, 4, 8) uint8 array
+           and decodes all motors at once with big-endian int16 views
+
 Usage:
   python decode_exo_can_csv.py input.csv -o decoded.csv --pole-pairs 7
+  python decode_exo_can_csv.py input.csv --engine row
+  python decode_exo_can_csv.py input.csv --benchmark
+  python decode_exo_can_csv.py input.csv --no-cache
+  python decode_exo_can_csv.py input.csv --incremental
+  python decode_exo_can_csv.py input.csv --follow
+
+Alongside <output>.csv a binary columnar cache <output>.npz is written
+(see gait_cache.py); analysis scripts load that instead of re-parsing text.
+With it comes <output>.events.npz, the run-length-encoded fault intervals
+per motor (see fault_events.py).
+
+--incremental decodes only the rows appended since the last run, using the
+byte offset and last TimeStep saved in <output>.tail.json; --follow keeps
+doing that as serial_in.py writes. Neither rewrites the .npz cache (it goes
+stale and is rebuilt by the next load_decoded()).
 """
 
 import argparse
 import csv
+import io
+import json
+import time
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+
 # >>> EDIT THIS LINE: put your CSV path here (leave "" to use CLI argument)
 DEFAULT_INPUT_PATH = r""
 
@@ -104,6 +130,363 @@ def _parse_row_strict_elapsed(row):
         # Any parse problems → invalid row
         return None
 
+def decoded_header(pole_pairs):
+    """Column names of the decoded CSV (includes Elapsed_us)."""
+    base_cols = ["TimeStep", "Elapsed_us", "L_Gait_Index", "R_Gait_Index"]
+    motor_cols = []
+    for m in MOTOR_ORDER:
+        motor_cols += [f"{m}_pos_deg", f"{m}_spd_eRPM"]
+        if pole_pairs:
+            motor_cols += [f"{m}_spd_mech_RPM"]
+        motor_cols += [f"{m}_current_A", f"{m}_temp_C", f"{m}_err_code", f"{m}_err_text"]
+    return base_cols + motor_cols
+
+# ---------- row engine ----------
+def decode_rows(f_in, f_out, pole_pairs):
+    """Original per-row decoder. Returns the number of rows written."""
+    writer = csv.writer(f_out)
+    n = 0
+    for row in csv.reader(f_in):
+        parsed = _parse_row_strict_elapsed(row)
+        if parsed is None:
+            continue  # skip anything that isn't strict-elapsed layout
+
+        timestep, elapsed_us, L_idx, R_idx, bytes_all = parsed
+
+        decoded = []
+        for mi, _motor in enumerate(MOTOR_ORDER):
+            blk = bytes_all[mi*8:(mi+1)*8]
+            if len(blk) != 8:
+                decoded = None
+                break
+            dd = decode_block(blk)
+            mech_rpm = maybe_mech_rpm(dd["spd_erpm"], pole_pairs)
+            decoded.extend([round(dd["pos_deg"], 3), round(dd["spd_erpm"], 3)])
+            if pole_pairs:
+                decoded.append(round(mech_rpm, 3))
+            decoded.extend([round(dd["cur_A"], 3), int(dd["temp_C"]), int(dd["err_code"]), dd["err_text"]])
+
+        if decoded is None:
+            continue
+
+        writer.writerow([timestep, elapsed_us, L_idx, R_idx] + decoded)
+        n += 1
+    return n
+
+# ---------- numpy engine ----------
+CHUNK_ROWS = 65536
+
+@lru_cache(maxsize=None)
+def _scale_luts(pole_pairs):
+    """
+    Lookup tables over every int16 raw value, built with exactly the same
+    float expressions and round() as decode_block, so the batch engine
+    reproduces the row engine's values bit for bit.
+    """
+    raw = range(-0x8000, 0x8000)
+    pos = np.array([round(r * 0.1, 3) for r in raw])
+    erpm = np.array([round(r * 10.0, 3) for r in raw])
+    cur = np.array([round(r * 0.01, 3) for r in raw])
+    mech = None
+    if pole_pairs:
+        mech = np.array([round(maybe_mech_rpm(r * 10.0, pole_pairs), 3) for r in raw])
+    return pos, erpm, mech, cur
+
+ERROR_TEXT = np.array([ERROR_MAP.get(e, f"Unknown({e})") for e in range(256)], dtype=object)
+
+def _strict_line(line):
+    """Strict-parse one raw text line; returns its 36 values as an int list or None."""
+    parsed = _parse_row_strict_elapsed(next(csv.reader([line]), []))
+    if parsed is None:
+        return None
+    return list(parsed[:4]) + parsed[4]
+
+def _lines_to_float(lines):
+    """
+    float64 (n, 36) array from raw text lines. A block that fails to parse is
+    bisected so only the offending lines go through the strict per-row parser.
+    """
+    try:
+        return np.loadtxt(lines, delimiter=",", dtype=np.float64, comments=None, ndmin=2)
+    except ValueError:
+        if len(lines) > 64:
+            mid = len(lines) // 2
+            return np.concatenate([_lines_to_float(lines[:mid]), _lines_to_float(lines[mid:])])
+        # Something odd in these lines (stray text, blanks) → strict per-row parse
+        parsed = [v for v in map(_strict_line, lines) if v is not None]
+        return np.array(parsed, dtype=np.float64).reshape(-1, 36)
+
+def _lines_to_arrays(lines):
+    """
+    Convert raw 36-field text lines to (meta int64 (n, 4), payload uint8 (n, 4, 8)).
+    Mirrors _parse_row_strict_elapsed: int(float(x)) on every field and rows
+    with any byte outside 0..255 are dropped.
+    """
+    vals = np.trunc(_lines_to_float(lines))
+    ok = np.isfinite(vals).all(axis=1)
+    ok &= ((vals[:, 4:] >= 0) & (vals[:, 4:] <= 255)).all(axis=1)
+    vals = vals[ok]
+    meta = vals[:, :4].astype(np.int64)
+    payload = vals[:, 4:].astype(np.uint8).reshape(-1, len(MOTOR_ORDER), 8)
+    return meta, payload
+
+def iter_raw_chunks(f_in, chunk_rows=CHUNK_ROWS):
+    """
+    Yield (meta, payload) arrays from a raw gait log opened with newline="".
+
+    meta    int64 (n, 4): TimeStep, Elapsed_us, L_Gait_Index, R_Gait_Index
+    payload uint8 (n, 4, 8): CAN feedback bytes in MOTOR_ORDER
+
+    Plain numeric 36-field lines go straight to np.loadtxt; anything else
+    (headers, chatter, blank fields, extra columns) is strict-parsed here so
+    the result matches the row engine exactly.
+    """
+    lines = []
+    for line in f_in:
+        if line[:1].isdigit() and line.count(",") == 35 and ",," not in line:
+            lines.append(line)
+        else:
+            vals = _strict_line(line)
+            if vals is None:
+                continue
+            lines.append(",".join(map(str, vals)))
+
+        if len(lines) >= chunk_rows:
+            yield _lines_to_arrays(lines)
+            lines = []
+    if lines:
+        yield _lines_to_arrays(lines)
+
+def _payload_fields(payload):
+    """
+    Split an (N, 4, 8) payload into LUT indices for position/speed/current
+    (big-endian int16 offset by 0x8000), signed temperature and error code.
+    """
+    # bytes 0..5 are three big-endian int16 words: position, speed, current
+    words = np.ascontiguousarray(payload[:, :, 0:6]).view(">i2").astype(np.int32) + 0x8000
+    temp = payload[:, :, 6].view(np.int8)
+    err = payload[:, :, 7]
+    return words, temp, err
+
+def decode_payload(payload, pole_pairs):
+    """
+    Decode an (N, 4, 8) uint8 payload array for all motors at once.
+
+    Returns a dict keyed like the decoded CSV columns (without the base
+    columns); values are (N,) arrays equal to what the row engine writes.
+    """
+    pos_lut, erpm_lut, mech_lut, cur_lut = _scale_luts(pole_pairs)
+    words, temp, err = _payload_fields(payload)
+
+    out = {}
+    for mi, m in enumerate(MOTOR_ORDER):
+        out[f"{m}_pos_deg"] = pos_lut[words[:, mi, 0]]
+        out[f"{m}_spd_eRPM"] = erpm_lut[words[:, mi, 1]]
+        if pole_pairs:
+            out[f"{m}_spd_mech_RPM"] = mech_lut[words[:, mi, 1]]
+        out[f"{m}_current_A"] = cur_lut[words[:, mi, 2]]
+        out[f"{m}_temp_C"] = temp[:, mi]
+        out[f"{m}_err_code"] = err[:, mi]
+        out[f"{m}_err_text"] = ERROR_TEXT[err[:, mi]]
+    return out
+
+@lru_cache(maxsize=None)
+def _text_luts(pole_pairs):
+    """The scale LUTs pre-formatted the way csv.writer formats floats (repr)."""
+    fmt = lambda lut: None if lut is None else np.array([repr(v) for v in lut.tolist()], dtype=object)
+    return tuple(fmt(lut) for lut in _scale_luts(pole_pairs))
+
+TEMP_TEXT = np.array([str(to_int8(b)) for b in range(256)], dtype=object)
+ERR_CODE_TEXT = np.array([str(v) for v in range(256)], dtype=object)
+
+def write_decoded_chunk(f_out, meta, payload, pole_pairs):
+    """
+    Write one chunk of decoded rows as CSV text, column order as decoded_header().
+
+    Every field is looked up pre-formatted, so this only joins strings; none of
+    the values need csv quoting and the line terminator matches csv.writer.
+    """
+    pos_txt, erpm_txt, mech_txt, cur_txt = _text_luts(pole_pairs)
+    words, _temp, err = _payload_fields(payload)
+
+    cols = [list(map(str, meta[:, i].tolist())) for i in range(4)]
+    for mi in range(len(MOTOR_ORDER)):
+        cols += [pos_txt[words[:, mi, 0]], erpm_txt[words[:, mi, 1]]]
+        if pole_pairs:
+            cols.append(mech_txt[words[:, mi, 1]])
+        cols += [cur_txt[words[:, mi, 2]], TEMP_TEXT[payload[:, mi, 6]],
+                 ERR_CODE_TEXT[err[:, mi]], ERROR_TEXT[err[:, mi]]]
+    cols = [c if isinstance(c, list) else c.tolist() for c in cols]
+    if cols[0]:
+        f_out.write("\r\n".join(map(",".join, zip(*cols))) + "\r\n")
+    return len(meta)
+
+def decode_numpy(f_in, f_out, pole_pairs, chunk_rows=CHUNK_ROWS, keep=None):
+    """
+    Batch decoder. Returns the number of rows written.
+    If keep is a list, each (meta, payload) chunk is appended to it.
+    """
+    n = 0
+    for meta, payload in iter_raw_chunks(f_in, chunk_rows):
+        n += write_decoded_chunk(f_out, meta, payload, pole_pairs)
+        if keep is not None:
+            keep.append((meta, payload))
+    return n
+
+ENGINES = {"row": decode_rows, "numpy": decode_numpy}
+
+def decode_file(input_csv, out_path, pole_pairs, engine="numpy", cache=True):
+    """
+    Decode input_csv to out_path. With cache=True also write the binary
+    columnar cache and the fault event index next to it (see gait_cache.py,
+    fault_events.py). Returns rows written.
+    """
+    import fault_events  # both import this module; keep them out of module scope
+    import gait_cache
+
+    kept = [] if (cache and engine == "numpy") else None
+    with input_csv.open("r", newline="") as f_in, out_path.open("w", newline="") as f_out:
+        csv.writer(f_out).writerow(decoded_header(pole_pairs))
+        if kept is not None:
+            n = decode_numpy(f_in, f_out, pole_pairs, keep=kept)
+        else:
+            n = ENGINES[engine](f_in, f_out, pole_pairs)
+
+    if cache:
+        cache_path = gait_cache.cache_path_for(out_path)
+        if kept:
+            meta = np.concatenate([k[0] for k in kept])
+            payload = np.concatenate([k[1] for k in kept])
+            gait_cache.write_cache(cache_path, meta, payload, pole_pairs, source=input_csv.name)
+            fault_events.write_events(fault_events.events_path_for(out_path),
+                                      fault_events.events_from_payload(meta, payload), n,
+                                      source=input_csv.name)
+        else:
+            gait_cache.cache_from_csv(out_path, cache_path, source=input_csv.name)
+            fault_events.load_events(out_path)
+    return n
+
+# ---------- incremental / follow ----------
+TAIL_SUFFIX = ".tail.json"
+READ_BLOCK = 16 * 1024 * 1024
+
+def tail_state_path(out_path):
+    """Sidecar next to the decoded CSV: X_decoded.csv → X_decoded.tail.json."""
+    return out_path.with_name(out_path.stem + TAIL_SUFFIX)
+
+def _last_timestep_before(input_csv, offset, window=65536):
+    """TimeStep of the last decodable row ending at or before byte offset (None if none)."""
+    with input_csv.open("rb") as f:
+        start = max(0, offset - window)
+        f.seek(start)
+        text = f.read(offset - start).decode("utf-8", errors="replace")
+    for line in reversed(text.splitlines(keepends=True)[1 if start else 0:]):
+        for meta, _payload in iter_raw_chunks([line]):
+            if len(meta):
+                return int(meta[-1, 0])
+    return None
+
+def load_tail_state(input_csv, out_path, pole_pairs):
+    """
+    The saved state if it still describes input_csv → out_path, else None:
+    same source and pole pairs, decoded file untouched since, raw log not
+    truncated, and the row just before the offset still has last_timestep.
+    """
+    try:
+        state = json.loads(tail_state_path(out_path).read_text())
+    except (OSError, ValueError):
+        return None
+    if state.get("source") != input_csv.name or state.get("pole_pairs") != pole_pairs:
+        return None
+    if not out_path.exists() or out_path.stat().st_size != state.get("decoded_size"):
+        return None
+    if input_csv.stat().st_size < state.get("offset", 0):
+        return None
+    if _last_timestep_before(input_csv, state["offset"]) != state.get("last_timestep"):
+        return None
+    return state
+
+def decode_incremental(input_csv, out_path, pole_pairs, state=None):
+    """
+    Decode only what was appended to input_csv since the last run and append
+    it to out_path. Only complete lines are consumed, so a row serial_in.py is
+    still writing is picked up next time. Starts over (fresh header) when
+    there is no valid saved state. Returns (new_rows, state).
+    """
+    if state is None:
+        state = load_tail_state(input_csv, out_path, pole_pairs)
+    if state is None:
+        state = {"source": input_csv.name, "pole_pairs": pole_pairs,
+                 "offset": 0, "rows": 0, "last_timestep": None}
+        with out_path.open("w", newline="") as f_out:
+            csv.writer(f_out).writerow(decoded_header(pole_pairs))
+
+    new_rows = 0
+    with input_csv.open("rb") as f_in, out_path.open("a", newline="") as f_out:
+        f_in.seek(state["offset"])
+        while True:
+            block = f_in.read(READ_BLOCK)
+            if not block:
+                break
+            cut = block.rfind(b"\n") + 1
+            if cut == 0:
+                if len(block) < READ_BLOCK:
+                    break               # only a partial line so far
+                cut = len(block)        # a block-sized line is junk; skip it
+            elif cut < len(block):
+                f_in.seek(cut - len(block), 1)
+            text = block[:cut].decode("utf-8", errors="replace")
+            for meta, payload in iter_raw_chunks(io.StringIO(text, newline="")):
+                new_rows += write_decoded_chunk(f_out, meta, payload, pole_pairs)
+                if len(meta):
+                    state["last_timestep"] = int(meta[-1, 0])
+            state["offset"] += cut
+
+    state["rows"] += new_rows
+    state["decoded_size"] = out_path.stat().st_size
+    tmp = tail_state_path(out_path).with_suffix(".tmp")
+    tmp.write_text(json.dumps(state))
+    tmp.replace(tail_state_path(out_path))
+    return new_rows, state
+
+def follow(input_csv, out_path, pole_pairs, poll_interval=1.0):
+    """tail -f: keep out_path in step with a log that is still being written."""
+    n, state = decode_incremental(input_csv, out_path, pole_pairs)
+    print(f"Following {input_csv} → {out_path}  ({state['rows']} rows so far, Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(poll_interval)
+            size = input_csv.stat().st_size
+            if size == state["offset"]:
+                continue
+            if size < state["offset"]:
+                state = None            # log replaced/truncated → start over
+            n, state = decode_incremental(input_csv, out_path, pole_pairs, state)
+            if n:
+                print(f"+{n} rows  (total {state['rows']}, TimeStep {state['last_timestep']})")
+    except KeyboardInterrupt:
+        print("\nStopped following.")
+
+def benchmark(input_csv, pole_pairs, repeat=3):
+    """Decode into memory with each engine, check outputs match, print rows/s."""
+    with input_csv.open("r", newline="") as f_in:
+        text = f_in.read()
+    outputs = {}
+    for name, fn in ENGINES.items():
+        _text_luts(pole_pairs)  # exclude one-off LUT build from timings
+        best = float("inf")
+        for _ in range(repeat):
+            buf = io.StringIO(newline="")
+            t0 = time.perf_counter()
+            n = fn(io.StringIO(text, newline=""), buf, pole_pairs)
+            best = min(best, time.perf_counter() - t0)
+        outputs[name] = buf.getvalue()
+        print(f"{name:>6}: {n} rows in {best:.3f} s  →  {n / best:,.0f} rows/s")
+    same = outputs["row"] == outputs["numpy"]
+    print(f"Outputs identical: {same}")
+    if not same:
+        raise SystemExit("Engine outputs differ!")
+
 def main():
     ap = argparse.ArgumentParser()
     if DEFAULT_INPUT_PATH:
@@ -115,49 +498,35 @@ def main():
                     help="Output CSV (default: <input>_decoded.csv)")
     ap.add_argument("--pole-pairs", type=int, default=21,
                     help="Pole pairs for mechanical RPM conversion (e.g., 7)")
+    ap.add_argument("--engine", choices=sorted(ENGINES), default="numpy",
+                    help="Decoder engine (default: numpy; row = original per-row loop)")
+    ap.add_argument("--benchmark", action="store_true",
+                    help="Time both engines on the input (rows/s) and check identical output")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Don't write the binary .npz cache next to the decoded CSV")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Only decode rows appended since the last --incremental run")
+    ap.add_argument("--follow", action="store_true",
+                    help="Like tail -f: keep decoding new rows as the log grows")
+    ap.add_argument("--poll-interval", type=float, default=1.0,
+                    help="Seconds between size checks in --follow mode")
 
     args = ap.parse_args()
-    out_path = args.output or args.input_csv.with_name(args.input_csv.stem + "_decoded.csv")
 
-    with args.input_csv.open("r", newline="") as f_in, out_path.open("w", newline="") as f_out:
-        reader = csv.reader(f_in)
-        writer = csv.writer(f_out)
-
-        # Output header NOW includes Elapsed_us
-        base_cols = ["TimeStep", "Elapsed_us", "L_Gait_Index", "R_Gait_Index"]
-        motor_cols = []
-        for m in MOTOR_ORDER:
-            motor_cols += [f"{m}_pos_deg", f"{m}_spd_eRPM"]
-            if args.pole_pairs:
-                motor_cols += [f"{m}_spd_mech_RPM"]
-            motor_cols += [f"{m}_current_A", f"{m}_temp_C", f"{m}_err_code", f"{m}_err_text"]
-        writer.writerow(base_cols + motor_cols)
-
-        for row in reader:
-            parsed = _parse_row_strict_elapsed(row)
-            if parsed is None:
-                continue  # skip anything that isn't strict-elapsed layout
-
-            timestep, elapsed_us, L_idx, R_idx, bytes_all = parsed
-
-            decoded = []
-            for mi, _motor in enumerate(MOTOR_ORDER):
-                blk = bytes_all[mi*8:(mi+1)*8]
-                if len(blk) != 8:
-                    decoded = None
-                    break
-                dd = decode_block(blk)
-                mech_rpm = maybe_mech_rpm(dd["spd_erpm"], args.pole_pairs)
-                decoded.extend([round(dd["pos_deg"], 3), round(dd["spd_erpm"], 3)])
-                if args.pole_pairs:
-                    decoded.append(round(mech_rpm, 3))
-                decoded.extend([round(dd["cur_A"], 3), int(dd["temp_C"]), int(dd["err_code"]), dd["err_text"]])
-
-            if decoded is None:
-                continue
-
-            writer.writerow([timestep, elapsed_us, L_idx, R_idx] + decoded)
+    if args.benchmark:
+        benchmark(args.input_csv, args.pole_pairs)
+        return
 
+    out_path = args.output or args.input_csv.with_name(args.input_csv.stem + "_decoded.csv")
+    if args.follow:
+        follow(args.input_csv, out_path, args.pole_pairs, args.poll_interval)
+        return
+    if args.incremental:
+        n, state = decode_incremental(args.input_csv, out_path, args.pole_pairs)
+        print(f"Appended {n} rows to {out_path} (total {state['rows']})")
+        return
+    decode_file(args.input_csv, out_path, args.pole_pairs, engine=args.engine,
+                cache=not args.no_cache)
     print(f"Wrote: {out_path}")
 
 if __name__ == "__main__":
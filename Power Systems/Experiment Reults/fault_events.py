@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Fault/error event index for decoded gait sessions.
+
+Each motor's error byte is run-length encoded: every run of one non-zero
+code becomes an event with
+
+  motor, code, text        ERROR_MAP entry (Unknown(n) for codes outside it)
+  start_row, end_row       decoded data rows, inclusive
+  start_s, duration_s      from the first row's Elapsed_us; the duration runs to
+                           the first row after the interval (the last row if the
+                           fault lasts to the end of the log)
+  peak_temp_C, peak_current_A   max temperature / max |Iq| during the interval
+  valid                    code is in ERROR_MAP
+
+A code outside ERROR_MAP is not a fault report. For example, the startup
+frame with 0xFF bytes in every field decodes as Unknown(255), -9 °C and
+-6.41 A. Those events are kept with valid = False, and queries leave them
+out unless --all is given.
+
+The decoder writes the index next to the decoded CSV (X_decoded.csv →
+X_decoded.events.npz) together with the .npz cache, straight from the
+decoded byte arrays. For older sessions it is built from the decoded file
+on first use and reused while it is at least as new as the source. A query
+over every experiment then only reads these small files.
+
+Usage:
+  python fault_events.py                                   # all Experiment*/ sessions
+  python fault_events.py Experiment5 --motor LeftHip --code 1,2
+  python fault_events.py --all --csv faults.csv
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from decode_exo_can_csv import ERROR_MAP, MOTOR_ORDER, _payload_fields, _scale_luts
+from gait_cycles import segment_reduce
+
+HERE = Path(__file__).resolve().parent
+EVENTS_VERSION = 1
+EVENTS_SUFFIX = ".events.npz"
+FIELDS = {
+    "motor": np.uint8,          # index into MOTOR_ORDER
+    "code": np.uint8,
+    "start_row": np.int64,
+    "end_row": np.int64,
+    "start_s": np.float64,
+    "duration_s": np.float64,
+    "peak_temp_C": np.int16,
+    "peak_current_A": np.float32,
+}
+
+
+def events_path_for(decoded_path):
+    return Path(decoded_path).with_suffix(EVENTS_SUFFIX)
+
+
+def events_is_fresh(decoded_path):
+    decoded_path = Path(decoded_path)
+    cache = events_path_for(decoded_path)
+    if not cache.exists():
+        return False
+    if not decoded_path.exists():
+        return True
+    return cache.stat().st_mtime >= decoded_path.stat().st_mtime
+
+
+# ---------- run-length encoding ----------
+def error_runs(codes):
+    """(starts, stops) of the runs of one non-zero code, stops exclusive."""
+    codes = np.asarray(codes)
+    if not len(codes):
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    edges = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts, stops = np.r_[0, edges], np.r_[edges, len(codes)]
+    keep = codes[starts] != 0
+    return starts[keep], stops[keep]
+
+
+def motor_events(motor_idx, codes, temp, current, elapsed_us):
+    """{field: array} of one motor's events."""
+    starts, stops = error_runs(codes)
+    n = len(codes)
+    t = (np.asarray(elapsed_us, dtype=np.int64) - int(elapsed_us[0])) * 1e-6 if n else np.zeros(0)
+    return {
+        "motor": np.full(len(starts), motor_idx),
+        "code": np.asarray(codes)[starts],
+        "start_row": starts,
+        "end_row": stops - 1,
+        "start_s": t[starts],
+        "duration_s": t[np.minimum(stops, n - 1)] - t[starts],
+        "peak_temp_C": segment_reduce(np.maximum, np.asarray(temp, dtype=np.int16), starts, stops),
+        "peak_current_A": segment_reduce(np.fmax, np.abs(np.asarray(current, dtype=float)),
+                                         starts, stops),
+    }
+
+
+def _concat(per_motor):
+    return {f: np.concatenate([e[f] for e in per_motor]).astype(dt) if per_motor
+            else np.zeros(0, dt) for f, dt in FIELDS.items()}
+
+
+def events_from_payload(meta, payload):
+    """Events for all motors from the decoder's (meta, payload) arrays."""
+    cur_lut = _scale_luts(None)[3]
+    words, temp, err = _payload_fields(payload)
+    return _concat([motor_events(mi, err[:, mi], temp[:, mi], cur_lut[words[:, mi, 2]], meta[:, 1])
+                    for mi in range(len(MOTOR_ORDER))])
+
+
+def events_from_frame(df):
+    """Events for the motors present in a decoded frame."""
+    if "Elapsed_us" in df.columns:
+        elapsed = df["Elapsed_us"].to_numpy(dtype=np.int64)
+    else:
+        elapsed = np.zeros(len(df), np.int64)
+    per_motor = []
+    for mi, m in enumerate(MOTOR_ORDER):
+        if f"{m}_err_code" not in df.columns:
+            continue
+        per_motor.append(motor_events(mi, df[f"{m}_err_code"].to_numpy(), df[f"{m}_temp_C"].to_numpy(),
+                                      df[f"{m}_current_A"].to_numpy(), elapsed))
+    return _concat(per_motor)
+
+
+# ---------- storage ----------
+def write_events(path, events, rows, source=None):
+    meta = {"version": EVENTS_VERSION, "rows": int(rows), "motors": MOTOR_ORDER,
+            "source": str(source) if source else ""}
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **events)
+    tmp.replace(path)
+    return path
+
+
+def read_events(path):
+    """(events dict, meta); ValueError for an index of another version."""
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta.get("version") != EVENTS_VERSION:
+            raise ValueError(f"{path}: unsupported event index version {meta.get('version')}")
+        return {f: z[f] for f in FIELDS}, meta
+
+
+def load_events(decoded_path, df=None, use_cache=True, write=True):
+    """Event index of a decoded session, via its cache when up to date."""
+    decoded_path = Path(decoded_path)
+    cache = events_path_for(decoded_path)
+    if use_cache and events_is_fresh(decoded_path):
+        try:
+            events, meta = read_events(cache)
+            if df is None or meta.get("rows") == len(df):
+                return events
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable/old index → rebuild
+    if df is None:
+        from gait_cache import load_decoded
+        df = load_decoded(decoded_path)
+    events = events_from_frame(df)
+    if use_cache and write:
+        try:
+            write_events(cache, events, len(df), source=decoded_path.name)
+        except OSError:
+            pass  # read-only location; the events are still usable
+    return events
+
+
+def events_table(events, session=None):
+    """DataFrame of an event dict, with motor names and error texts."""
+    out = pd.DataFrame(events)
+    out["motor"] = np.array(MOTOR_ORDER, dtype=object)[out["motor"].to_numpy(dtype=np.intp)]
+    out.insert(2, "text", [ERROR_MAP.get(int(c), f"Unknown({int(c)})") for c in out["code"]])
+    out.insert(3, "valid", out["code"].isin(list(ERROR_MAP)))
+    if session is not None:
+        out.insert(0, "session", session)
+    return out
+
+
+def find_sessions(roots):
+    found = set()
+    for root in roots:
+        root = Path(root)
+        cands = [root] if root.is_file() else root.rglob("*_decoded.csv")
+        found.update(p.resolve() for p in cands if p.name.endswith("_decoded.csv"))
+    return sorted(found)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query fault/error events across decoded sessions.")
+    ap.add_argument("roots", nargs="*", type=Path,
+                    help="Folders or decoded CSVs (default: Experiment*/)")
+    ap.add_argument("--motor", action="append", choices=MOTOR_ORDER, help="Only these motors")
+    ap.add_argument("--code", default=None, help="Only these codes, e.g. 1,2")
+    ap.add_argument("--min-duration", type=float, default=0.0, help="Only events at least this long (s)")
+    ap.add_argument("--all", action="store_true", help="Include codes outside ERROR_MAP (e.g. Unknown(255))")
+    ap.add_argument("--csv", type=Path, default=None, help="Write the matching events")
+    args = ap.parse_args()
+
+    sessions = find_sessions(args.roots or sorted(p for p in HERE.glob("Experiment*") if p.is_dir()))
+    tables = []
+    for s in sessions:
+        try:
+            label = str(s.relative_to(HERE))
+        except ValueError:
+            label = str(s)
+        tables.append(events_table(load_events(s), session=label))
+    if not tables:
+        print("No decoded sessions found.")
+        return
+    ev = pd.concat(tables, ignore_index=True)
+
+    keep = ev["duration_s"] >= args.min_duration
+    if not args.all:
+        keep &= ev["valid"]
+    if args.motor:
+        keep &= ev["motor"].isin(args.motor)
+    if args.code:
+        keep &= ev["code"].isin([int(c) for c in args.code.split(",") if c.strip()])
+    ev = ev[keep].reset_index(drop=True)
+
+    hidden = "" if args.all else " (codes outside ERROR_MAP hidden; --all to show)"
+    print(f"{len(sessions)} session(s), {len(ev)} matching event(s){hidden}")
+    if len(ev):
+        pd.set_option("display.width", 200)
+        print(ev.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if args.csv:
+        ev.to_csv(args.csv, index=False)
+        print(f"Saved → {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Binary columnar cache (compressed .npz) for decoded gait sessions.
+
+The cache sits next to the decoded CSV (X_decoded.csv → X_decoded.npz) and
+stores the CAN values at their native width instead of as text:
+
+  TimeStep int32, Elapsed_us int64, L/R_Gait_Index int16
+  <Motor>_pos_raw / _spd_raw / _cur_raw  int16  (raw CAN words)
+  <Motor>_temp_C int8, <Motor>_err_code uint8
+  error_codes / error_texts             ERROR_MAP, stored once
+  meta                                   JSON: version, pole_pairs, columns
+
+Scaled columns are rebuilt with the decoder's lookup tables, so a cached load
+returns exactly the values in the decoded CSV. load_decoded() uses the cache
+whenever it is at least as new as the CSV, and builds one otherwise.
+
+Usage:
+  python gait_cache.py Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python gait_cache.py Experiment*/*_decoded.csv --force
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from decode_exo_can_csv import ERROR_MAP, MOTOR_ORDER, _payload_fields, _scale_luts, decoded_header
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".npz"
+BASE_DTYPES = {
+    "TimeStep": np.int32,
+    "Elapsed_us": np.int64,
+    "L_Gait_Index": np.int16,
+    "R_Gait_Index": np.int16,
+}
+
+
+def cache_path_for(decoded_csv):
+    return Path(decoded_csv).with_suffix(CACHE_SUFFIX)
+
+
+def cache_is_fresh(decoded_csv):
+    """True if the cache exists and is at least as new as the decoded CSV."""
+    decoded_csv = Path(decoded_csv)
+    cache = cache_path_for(decoded_csv)
+    if not cache.exists():
+        return False
+    if not decoded_csv.exists():
+        return True
+    return cache.stat().st_mtime >= decoded_csv.stat().st_mtime
+
+
+def _save(cache, arrays, pole_pairs, source):
+    meta = {
+        "version": CACHE_VERSION,
+        "pole_pairs": int(pole_pairs or 0),
+        "columns": decoded_header(pole_pairs),
+        "source": str(source) if source else "",
+    }
+    codes = sorted(ERROR_MAP)
+    arrays["error_codes"] = np.array(codes, dtype=np.uint8)
+    arrays["error_texts"] = np.array([ERROR_MAP[c] for c in codes])
+    arrays["meta"] = np.array(json.dumps(meta))
+    tmp = cache.with_name(cache.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez_compressed(f, **arrays)
+    tmp.replace(cache)
+    return cache
+
+
+def write_cache(cache, meta, payload, pole_pairs, source=None):
+    """Write a cache from the decoder's (meta, payload) arrays."""
+    words, temp, err = _payload_fields(payload)
+    arrays = {c: meta[:, i].astype(dt) for i, (c, dt) in enumerate(BASE_DTYPES.items())}
+    for mi, m in enumerate(MOTOR_ORDER):
+        arrays[f"{m}_pos_raw"] = (words[:, mi, 0] - 0x8000).astype(np.int16)
+        arrays[f"{m}_spd_raw"] = (words[:, mi, 1] - 0x8000).astype(np.int16)
+        arrays[f"{m}_cur_raw"] = (words[:, mi, 2] - 0x8000).astype(np.int16)
+        arrays[f"{m}_temp_C"] = temp[:, mi].astype(np.int8)
+        arrays[f"{m}_err_code"] = err[:, mi].astype(np.uint8)
+    return _save(Path(cache), arrays, pole_pairs, source)
+
+
+def _raw_from_scaled(values, lut):
+    """Invert a decoder LUT; returns int16 raw values or None if not exact."""
+    raw = np.searchsorted(lut, values)
+    raw = np.clip(raw, 0, len(lut) - 1)
+    if not np.array_equal(lut[raw], values):
+        return None
+    return (raw - 0x8000).astype(np.int16)
+
+
+def _infer_pole_pairs(df):
+    """Pole pairs used for *_spd_mech_RPM in a decoded frame (0 if no mech columns)."""
+    m = MOTOR_ORDER[0]
+    if f"{m}_spd_mech_RPM" not in df.columns:
+        return 0
+    erpm = df[f"{m}_spd_eRPM"].to_numpy(dtype=float)
+    mech = df[f"{m}_spd_mech_RPM"].to_numpy(dtype=float)
+    nz = mech != 0
+    if not nz.any():
+        return 21
+    return int(round(np.median(erpm[nz] / mech[nz])))
+
+
+def cache_from_frame(df, cache, source=None):
+    """
+    Write a cache from an already-decoded DataFrame (e.g. an old _decoded.csv).
+    Returns the cache path, or None if the frame doesn't round-trip exactly.
+    """
+    if list(df.columns[:4]) != list(BASE_DTYPES) or df.empty:
+        return None
+    pole_pairs = _infer_pole_pairs(df)
+    if list(df.columns) != decoded_header(pole_pairs):
+        return None
+    pos_lut, erpm_lut, mech_lut, cur_lut = _scale_luts(pole_pairs)
+
+    arrays = {}
+    for c, dt in BASE_DTYPES.items():
+        v = df[c].to_numpy()
+        if not np.array_equal(v.astype(dt), v):
+            return None
+        arrays[c] = v.astype(dt)
+    for m in MOTOR_ORDER:
+        for key, col, lut in (("pos", "pos_deg", pos_lut), ("spd", "spd_eRPM", erpm_lut),
+                              ("cur", "current_A", cur_lut)):
+            raw = _raw_from_scaled(df[f"{m}_{col}"].to_numpy(dtype=float), lut)
+            if raw is None:
+                return None
+            arrays[f"{m}_{key}_raw"] = raw
+        if pole_pairs:
+            mech = mech_lut[arrays[f"{m}_spd_raw"].astype(np.int32) + 0x8000]
+            if not np.array_equal(mech, df[f"{m}_spd_mech_RPM"].to_numpy(dtype=float)):
+                return None
+        arrays[f"{m}_temp_C"] = df[f"{m}_temp_C"].to_numpy().astype(np.int8)
+        arrays[f"{m}_err_code"] = df[f"{m}_err_code"].to_numpy().astype(np.uint8)
+    return _save(Path(cache), arrays, pole_pairs, source)
+
+
+def cache_from_csv(decoded_csv, cache=None, source=None):
+    """cache_from_frame() for a decoded CSV on disk."""
+    decoded_csv = Path(decoded_csv)
+    cache = cache or cache_path_for(decoded_csv)
+    return cache_from_frame(pd.read_csv(decoded_csv), cache, source=source or decoded_csv.name)
+
+
+def read_cache(cache):
+    """Load a cache into a DataFrame with the decoded CSV's columns and values."""
+    with np.load(cache, allow_pickle=False) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta.get("version") != CACHE_VERSION:
+            raise ValueError(f"{cache}: unsupported cache version {meta.get('version')}")
+        pole_pairs = meta["pole_pairs"]
+        pos_lut, erpm_lut, mech_lut, cur_lut = _scale_luts(pole_pairs)
+        err_text = np.array([f"Unknown({e})" for e in range(256)], dtype=object)
+        err_text[z["error_codes"]] = z["error_texts"].astype(object)
+
+        cols = {c: z[c].astype(np.int64) for c in BASE_DTYPES}
+        for m in MOTOR_ORDER:
+            spd = z[f"{m}_spd_raw"].astype(np.int32) + 0x8000
+            cols[f"{m}_pos_deg"] = pos_lut[z[f"{m}_pos_raw"].astype(np.int32) + 0x8000]
+            cols[f"{m}_spd_eRPM"] = erpm_lut[spd]
+            if pole_pairs:
+                cols[f"{m}_spd_mech_RPM"] = mech_lut[spd]
+            cols[f"{m}_current_A"] = cur_lut[z[f"{m}_cur_raw"].astype(np.int32) + 0x8000]
+            err = z[f"{m}_err_code"]
+            cols[f"{m}_temp_C"] = z[f"{m}_temp_C"].astype(np.int64)
+            cols[f"{m}_err_code"] = err.astype(np.int64)
+            cols[f"{m}_err_text"] = err_text[err]
+    return pd.DataFrame(cols, columns=meta["columns"])
+
+
+def load_decoded(path, use_cache=True, write=True):
+    """
+    Load a decoded gait CSV, via its .npz cache when that is up to date.
+    With write=True a missing or stale cache is rebuilt after reading the CSV.
+    Files that aren't in the decoded layout are returned from read_csv as-is.
+    """
+    path = Path(path)
+    cache = cache_path_for(path)
+    if use_cache and cache_is_fresh(path):
+        try:
+            return read_cache(cache)
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable/old cache → fall back to the CSV
+    df = pd.read_csv(path)
+    if use_cache and write:
+        try:
+            cache_from_frame(df, cache, source=path.name)
+        except OSError:
+            pass  # read-only location; the CSV is still fine
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build .npz caches for decoded gait CSVs.")
+    ap.add_argument("decoded_csv", type=Path, nargs="+")
+    ap.add_argument("--force", action="store_true", help="Rebuild even if the cache is fresh")
+    args = ap.parse_args()
+
+    for p in args.decoded_csv:
+        cache = cache_path_for(p)
+        if cache_is_fresh(p) and not args.force:
+            print(f"Up to date: {cache}")
+            continue
+        out = cache_from_csv(p, cache)
+        if out is None:
+            print(f"Skipped (not an exact decoded layout): {p}")
+            continue
+        print(f"Wrote: {out}  ({out.stat().st_size / max(p.stat().st_size, 1):.0%} of CSV size)")
+
+
+if __name__ == "__main__":
+    main()
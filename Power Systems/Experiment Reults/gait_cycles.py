@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Per-gait-cycle segmentation index for decoded gait sessions.
+
+The firmware walks L_Gait_Index / R_Gait_Index through 0..GAIT_LENGTH-1 and
+prints every 5th step, so a walking row advances the index by a few counts
+and a new cycle starts where it wraps (e.g. 97 → 2). Between walking bouts
+the index holds still ("moving legs to start/zero", the 3 s hold) or jumps
+when the control loop restarts (L 50 → 0, R 0 → 50); neither is a cycle.
+
+For each leg the index stores the row range [start, stop) of every complete
+cycle: a run of forward steps that begins within one stride of index 0 and
+reaches the last stride before GAIT_LENGTH. Partial cycles at the ends of a
+walking bout are left out. Getting stride n is then a slice, and per-cycle
+statistics are one np.*.reduceat over the whole session:
+
+  duration_s          to the first row of the next cycle
+  <Motor>_peak_A      peak |current| of the leg's hip and knee
+  <Motor>_energy_J    mechanical energy Kt·I·ω (trapezoid over Elapsed_us)
+  <Motor>_rms_err_deg / _peak_err_deg  tracking error, when targets are given
+
+The index is cached next to the decoded file (X_decoded.csv →
+X_decoded.cycles.npz) and reused while it is at least as new as the source.
+
+Usage:
+  python gait_cycles.py Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python gait_cycles.py decoded.csv --leg L --stride 3
+  python gait_cycles.py decoded.csv --csv cycles.csv --kt 0.16
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+GAIT_LENGTH = 100
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".cycles.npz"
+LEGS = {"L": "L_Gait_Index", "R": "R_Gait_Index"}
+LEG_MOTORS = {"L": ("LeftHip", "LeftKnee"), "R": ("RightHip", "RightKnee")}
+
+
+# ---------- segmentation ----------
+def as_index(gait_index):
+    """Gait index as an integer array, keeping a compact dtype (int16 from the cache)."""
+    idx = np.asarray(gait_index)
+    return idx if idx.dtype.kind in "iu" and idx.itemsize > 1 else idx.astype(np.int64)
+
+
+def typical_step(gait_index, gait_length=GAIT_LENGTH):
+    """Largest ordinary forward step of the index (the firmware print stride)."""
+    d = np.diff(as_index(gait_index))
+    fwd = d[(d > 0) & (d < gait_length // 4)]
+    return int(fwd.max()) if len(fwd) else 1
+
+
+def find_cycles(gait_index, gait_length=GAIT_LENGTH, max_step=None):
+    """(starts, stops) row offsets of the complete cycles in one leg's gait index."""
+    idx = as_index(gait_index)
+    n = len(idx)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if max_step is None:
+        max_step = typical_step(idx, gait_length)
+    fwd = np.mod(np.diff(idx), gait_length)
+    moving = (fwd > 0) & (fwd <= max_step)
+    wrap = moving & (idx[1:] < idx[:-1])
+
+    # A piece of walking starts at every wrap and at the row before the first
+    # step of a run; it ends at the next wrap or at the end of the run.
+    first = np.flatnonzero(moving & ~np.r_[False, moving[:-1]])      # step i: rows i → i+1
+    last = np.flatnonzero(moving & ~np.r_[moving[1:], False])
+    starts = np.sort(np.concatenate([first, np.flatnonzero(wrap) + 1]))
+    run_end = np.concatenate([last + 1, np.flatnonzero(wrap)])
+    run_end.sort()
+    # stop of each piece = first run end / wrap row at or after its start
+    stops = run_end[np.searchsorted(run_end, starts, side="left")] + 1
+    complete = (idx[starts] < max_step) & (idx[stops - 1] >= gait_length - max_step)
+    return starts[complete], stops[complete]
+
+
+def build_index(df, gait_length=GAIT_LENGTH):
+    """{leg: (starts, stops)} for both legs of a decoded frame."""
+    return {leg: find_cycles(df[col].to_numpy(), gait_length)
+            for leg, col in LEGS.items() if col in df.columns}
+
+
+# ---------- cache ----------
+def index_path_for(decoded_path):
+    return Path(decoded_path).with_suffix(INDEX_SUFFIX)
+
+
+def index_is_fresh(decoded_path):
+    decoded_path = Path(decoded_path)
+    cache = index_path_for(decoded_path)
+    if not cache.exists():
+        return False
+    if not decoded_path.exists():
+        return True
+    return cache.stat().st_mtime >= decoded_path.stat().st_mtime
+
+
+def write_index(path, index, rows, gait_length=GAIT_LENGTH, source=None):
+    meta = {"version": INDEX_VERSION, "rows": int(rows), "gait_length": gait_length,
+            "source": str(source) if source else ""}
+    arrays = {}
+    for leg, (starts, stops) in index.items():
+        arrays[f"{leg}_start"] = starts.astype(np.int32 if rows < 2**31 else np.int64)
+        arrays[f"{leg}_stop"] = stops.astype(arrays[f"{leg}_start"].dtype)
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    tmp.replace(path)
+    return path
+
+
+def read_index(path, rows=None):
+    """{leg: (starts, stops)}; ValueError if the cache is old or for another row count."""
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path}: unsupported index version {meta.get('version')}")
+        if rows is not None and meta.get("rows") != rows:
+            raise ValueError(f"{path}: index is for {meta.get('rows')} rows, not {rows}")
+        return {leg: (z[f"{leg}_start"].astype(np.int64), z[f"{leg}_stop"].astype(np.int64))
+                for leg in LEGS if f"{leg}_start" in z.files}
+
+
+def load_index(decoded_path, df, use_cache=True, write=True):
+    """Cycle index for df (loaded from decoded_path), via its cache when up to date."""
+    decoded_path = Path(decoded_path)
+    cache = index_path_for(decoded_path)
+    if use_cache and index_is_fresh(decoded_path):
+        try:
+            return read_index(cache, rows=len(df))
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable/old index → rebuild
+    index = build_index(df)
+    if use_cache and write:
+        try:
+            write_index(cache, index, len(df), source=decoded_path.name)
+        except OSError:
+            pass  # read-only location; the index is still usable
+    return index
+
+
+def cycle_slice(index, leg, n):
+    """Row slice of stride n (negative n counts from the end) of one leg."""
+    starts, stops = index[leg]
+    return slice(int(starts[n]), int(stops[n]))
+
+
+# ---------- per-cycle statistics ----------
+def segment_reduce(ufunc, values, starts, stops):
+    """ufunc.reduceat over the row ranges [starts, stops); values is 1-D or rows × cols."""
+    values = np.asarray(values)
+    if not len(starts):
+        return np.zeros((0,) + values.shape[1:], dtype=values.dtype)
+    n = len(values)
+    if stops[-1] >= n:  # reduceat needs every boundary to be a valid row
+        values = np.concatenate([values, values[-1:]])
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2], bounds[1::2] = starts, stops
+    return ufunc.reduceat(values, bounds, axis=0)[0::2]
+
+
+def segment_error(err, starts, stops):
+    """(RMS, peak |err|) over each [start, stop); NaN rows (no target) are left out."""
+    ok = np.isfinite(err)
+    n_ok = segment_reduce(np.add, ok.astype(np.int64), starts, stops)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rms = np.sqrt(segment_reduce(np.add, np.where(ok, err * err, 0.0), starts, stops) / n_ok)
+    return rms, segment_reduce(np.fmax, np.abs(err), starts, stops)
+
+
+def mech_power(df, motor, kt=0.16, pole_pairs=21):
+    """P = Kt·I·ω (W) for one motor, ω from _spd_mech_RPM or eRPM / pole pairs."""
+    mech_col = f"{motor}_spd_mech_RPM"
+    if mech_col in df.columns:
+        rpm = df[mech_col].to_numpy(dtype=float)
+    else:
+        rpm = df[f"{motor}_spd_eRPM"].to_numpy(dtype=float) / float(pole_pairs)
+    return kt * df[f"{motor}_current_A"].to_numpy(dtype=float) * rpm * (2.0 * np.pi / 60.0)
+
+
+def cycle_stats(df, index, leg, kt=0.16, pole_pairs=21, targets=None):
+    """
+    One row per complete cycle of `leg`. targets maps motor → per-row target
+    position (deg, NaN where there is none) and adds <Motor>_rms_err_deg and
+    <Motor>_peak_err_deg for those motors.
+    """
+    starts, stops = index[leg]
+    t = df["Elapsed_us"].to_numpy(dtype=float) * 1e-6
+    n = len(t)
+    end = np.minimum(stops, n - 1)
+    out = {
+        "cycle": np.arange(len(starts)),
+        "start_row": starts,
+        "stop_row": stops,
+        "start_s": t[starts] - t[0] if n else np.zeros(0),
+        "duration_s": t[end] - t[starts],
+    }
+    for m in LEG_MOTORS[leg]:
+        if f"{m}_current_A" not in df.columns:
+            continue
+        cur = df[f"{m}_current_A"].to_numpy(dtype=float)
+        out[f"{m}_peak_A"] = segment_reduce(np.fmax, np.abs(cur), starts, stops)
+        # trapezoid slice i → i+1 belongs to row i, so a cycle runs up to the next one's start
+        p = mech_power(df, m, kt, pole_pairs)
+        incr = np.r_[0.5 * (p[1:] + p[:-1]) * np.diff(t), 0.0]
+        out[f"{m}_energy_J"] = segment_reduce(np.add, np.nan_to_num(incr), starts, end)
+    for m, target in (targets or {}).items():
+        if m not in LEG_MOTORS[leg] or f"{m}_pos_deg" not in df.columns:
+            continue
+        err = df[f"{m}_pos_deg"].to_numpy(dtype=float) - np.asarray(target, dtype=float)
+        out[f"{m}_rms_err_deg"], out[f"{m}_peak_err_deg"] = segment_error(err, starts, stops)
+    return pd.DataFrame(out)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Index gait cycles and summarise each one.")
+    ap.add_argument("decoded", type=Path, help="Decoded gait CSV (or its .npz cache)")
+    ap.add_argument("--leg", choices=list(LEGS), default=None, help="Only this leg")
+    ap.add_argument("--stride", type=int, default=None,
+                    help="Print the rows of this stride (negative counts from the end)")
+    ap.add_argument("--kt", type=float, default=0.16, help="Torque constant Kt (N·m/A)")
+    ap.add_argument("--pole-pairs", type=int, default=21,
+                    help="Pole pairs when only eRPM is in the file")
+    ap.add_argument("--force", action="store_true", help="Rebuild the index even if fresh")
+    ap.add_argument("--csv", type=Path, default=None,
+                    help="Write the per-cycle table (both legs, 'leg' column)")
+    args = ap.parse_args()
+
+    import gait_cache  # decoder LUTs are only needed when run as a script
+    df = gait_cache.load_decoded(args.decoded)
+    index = load_index(args.decoded, df, use_cache=not args.force)
+    if args.force:
+        write_index(index_path_for(args.decoded), index, len(df), source=args.decoded.name)
+    legs = [args.leg] if args.leg else list(index)
+
+    pd.set_option("display.width", 160)
+    tables = []
+    for leg in legs:
+        stats = cycle_stats(df, index, leg, args.kt, args.pole_pairs)
+        tables.append(pd.concat([pd.Series(leg, index=stats.index, name="leg"), stats], axis=1))
+        print(f"{leg}: {len(stats)} complete cycles")
+        if len(stats):
+            print(stats.drop(columns=["cycle", "start_row", "stop_row"])
+                  .describe().loc[["mean", "std", "min", "max"]]
+                  .to_string(float_format=lambda v: f"{v:.3f}"))
+        print()
+
+    if args.stride is not None:
+        leg = legs[0]
+        sl = cycle_slice(index, leg, args.stride)
+        cols = ["TimeStep", "Elapsed_us", LEGS[leg]] + [
+            f"{m}_{q}" for m in LEG_MOTORS[leg] for q in ("pos_deg", "current_A")
+            if f"{m}_{q}" in df.columns]
+        print(f"{leg} stride {args.stride}: rows {sl.start}–{sl.stop}")
+        print(df.iloc[sl][cols].to_string(index=False))
+
+    if args.csv:
+        pd.concat(tables, ignore_index=True).to_csv(args.csv, index=False)
+        print(f"Saved → {args.csv}")
+    print(f"Cycle index: {index_path_for(args.decoded)}")
+
+
+if __name__ == "__main__":
+    main()
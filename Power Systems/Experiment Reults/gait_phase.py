@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Phase-binned ensemble averages of every joint over any number of strides.
+
+Each sample inside a complete gait cycle (gait_cycles.find_cycles) is put in
+the phase bin given by its leg's gait index (100 bins = one per firmware
+table entry), and PhaseEnsemble accumulates per joint, quantity and bin:
+
+  count, sum, sum of squares      → mean / std
+  fixed-range histogram           → percentile envelopes (p5 … p95)
+
+for the quantities
+
+  pos_deg, current_A, torque_Nm (Kt·I), power_W (Kt·I·ω)
+
+All of it is integer/float sums filled with np.bincount, so update() is one
+pass over a session and ensembles add: a saved --state file can fold in new
+sessions later without touching the old ones (sessions already in the state
+are skipped). Kt and pole pairs are fixed by the state once it exists.
+Percentiles are read off the histograms, so they are exact to one histogram
+bin (HIST_RANGES / HIST_BINS); values outside the range are counted in the
+end bins.
+
+Usage:
+  python gait_phase.py Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python gait_phase.py Experiment*/gait_data_log_*_decoded.csv --state ensemble.npz --csv phase.csv
+  python gait_phase.py Experiment8/merged_decoded.csv --state ensemble.npz --plot phase.png
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from decode_exo_can_csv import MOTOR_ORDER
+from gait_cycles import GAIT_LENGTH, LEGS, find_cycles, mech_power
+
+STATE_VERSION = 1
+N_BINS = GAIT_LENGTH
+QUANTITIES = ["pos_deg", "current_A", "torque_Nm", "power_W"]
+HIST_BINS = 400
+HIST_RANGES = {                  # (low, high) of each quantity's histogram
+    "pos_deg": (-180.0, 180.0),
+    "current_A": (-40.0, 40.0),
+    "torque_Nm": (-8.0, 8.0),
+    "power_W": (-200.0, 200.0),
+}
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def motor_leg(motor):
+    return "L" if motor.startswith("Left") else "R"
+
+
+def cycle_mask(starts, stops, n):
+    """Boolean row mask of the union of [starts, stops)."""
+    mark = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(mark, starts, 1)
+    np.add.at(mark, stops, -1)
+    return np.cumsum(mark[:-1]) > 0
+
+
+def quantity_values(df, motor, kt=0.16, pole_pairs=21):
+    """{quantity: per-row array} for one motor."""
+    cur = df[f"{motor}_current_A"].to_numpy(dtype=float)
+    return {
+        "pos_deg": df[f"{motor}_pos_deg"].to_numpy(dtype=float),
+        "current_A": cur,
+        "torque_Nm": kt * cur,
+        "power_W": mech_power(df, motor, kt, pole_pairs),
+    }
+
+
+class PhaseEnsemble:
+    """Per (motor, quantity, phase bin) count / sum / sum² and histogram."""
+
+    def __init__(self, motors=MOTOR_ORDER, n_bins=N_BINS, kt=0.16, pole_pairs=21,
+                 hist_bins=HIST_BINS, hist_ranges=None):
+        self.motors = list(motors)
+        self.n_bins = n_bins
+        self.kt = float(kt)
+        self.pole_pairs = pole_pairs
+        self.hist_bins = hist_bins
+        self.hist_ranges = dict(hist_ranges or HIST_RANGES)
+        shape = (len(self.motors), len(QUANTITIES), n_bins)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.sum = np.zeros(shape)
+        self.sumsq = np.zeros(shape)
+        self.hist = np.zeros(shape + (hist_bins,), dtype=np.int64)
+        self.strides = {leg: 0 for leg in LEGS}
+        self.sessions = []
+
+    # ---------- accumulation ----------
+    def update(self, df, source=None):
+        """Fold one decoded session in; returns the number of strides per leg it added."""
+        n = len(df)
+        added = {leg: 0 for leg in LEGS}
+        for leg, col in LEGS.items():
+            if col not in df.columns:
+                continue
+            idx = df[col].to_numpy(dtype=np.int64)
+            starts, stops = find_cycles(idx, GAIT_LENGTH)
+            added[leg] = len(starts)
+            self.strides[leg] += len(starts)
+            rows = cycle_mask(starts, stops, n)
+            if not rows.any():
+                continue
+            phase = (np.mod(idx[rows], GAIT_LENGTH) * self.n_bins) // GAIT_LENGTH
+            for mi, m in enumerate(self.motors):
+                if motor_leg(m) != leg or f"{m}_pos_deg" not in df.columns:
+                    continue
+                vals = quantity_values(df, m, self.kt, self.pole_pairs)
+                for qi, q in enumerate(QUANTITIES):
+                    self._add(mi, qi, phase, vals[q][rows])
+        if source is not None:
+            self.sessions.append(str(source))
+        return added
+
+    def _add(self, mi, qi, phase, values):
+        ok = np.isfinite(values)
+        phase, values = phase[ok], values[ok]
+        nb = self.n_bins
+        self.count[mi, qi] += np.bincount(phase, minlength=nb)
+        self.sum[mi, qi] += np.bincount(phase, weights=values, minlength=nb)
+        self.sumsq[mi, qi] += np.bincount(phase, weights=values * values, minlength=nb)
+        lo, hi = self.hist_ranges[QUANTITIES[qi]]
+        h = ((values - lo) * (self.hist_bins / (hi - lo))).astype(np.int64)
+        h = np.clip(h, 0, self.hist_bins - 1)
+        flat = np.bincount(phase * self.hist_bins + h, minlength=nb * self.hist_bins)
+        self.hist[mi, qi] += flat.reshape(nb, self.hist_bins)
+
+    def merge(self, other):
+        """Add another ensemble with the same layout into this one."""
+        if (other.motors != self.motors or other.n_bins != self.n_bins
+                or other.hist_bins != self.hist_bins or other.hist_ranges != self.hist_ranges):
+            raise ValueError("ensembles have different motors / bins / histogram ranges")
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.hist += other.hist
+        for leg in self.strides:
+            self.strides[leg] += other.strides.get(leg, 0)
+        self.sessions += other.sessions
+        return self
+
+    # ---------- results ----------
+    def percentiles(self, pcts=PERCENTILES):
+        """motors × quantities × bins × len(pcts), interpolated within histogram bins."""
+        cum = np.cumsum(self.hist, axis=-1)
+        total = cum[..., -1:]
+        out = np.full(self.count.shape + (len(pcts),), np.nan)
+        for qi, q in enumerate(QUANTITIES):
+            lo, hi = self.hist_ranges[q]
+            width = (hi - lo) / self.hist_bins
+            for pi, p in enumerate(pcts):
+                target = total[:, qi] * (p / 100.0)                    # motors × bins × 1
+                k = (cum[:, qi] < target).sum(axis=-1, keepdims=True)  # first bin reaching it
+                k = np.minimum(k, self.hist_bins - 1)
+                below = np.where(k > 0, np.take_along_axis(cum[:, qi], np.maximum(k - 1, 0), -1), 0)
+                inbin = np.take_along_axis(self.hist[:, qi], k, -1)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    frac = np.clip((target - below) / inbin, 0.0, 1.0)
+                val = lo + (k + frac) * width
+                out[:, qi, :, pi] = np.where(total[:, qi] > 0, val, np.nan)[..., 0]
+        return out
+
+    def result(self, pcts=PERCENTILES):
+        """Long DataFrame: motor, quantity, phase, count, mean, std, p<pct>..."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sum / self.count
+            std = np.sqrt(np.maximum(self.sumsq / self.count - mean * mean, 0.0))
+        pct = self.percentiles(pcts)
+        mi, qi, bi = np.meshgrid(np.arange(len(self.motors)), np.arange(len(QUANTITIES)),
+                                 np.arange(self.n_bins), indexing="ij")
+        cols = {
+            "motor": np.array(self.motors)[mi.ravel()],
+            "quantity": np.array(QUANTITIES)[qi.ravel()],
+            "phase": bi.ravel(),
+            "count": self.count.ravel(),
+            "mean": mean.ravel(),
+            "std": std.ravel(),
+        }
+        for k, p in enumerate(pcts):
+            cols[f"p{p:g}"] = pct[..., k].ravel()
+        df = pd.DataFrame(cols)
+        return df[df["count"] > 0].reset_index(drop=True)
+
+    # ---------- persistence ----------
+    def save(self, path):
+        meta = {"version": STATE_VERSION, "motors": self.motors, "n_bins": self.n_bins,
+                "kt": self.kt, "pole_pairs": self.pole_pairs, "hist_bins": self.hist_bins,
+                "hist_ranges": self.hist_ranges, "strides": self.strides,
+                "sessions": self.sessions, "quantities": QUANTITIES}
+        tmp = Path(path).with_name(Path(path).name + ".tmp")
+        with tmp.open("wb") as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), count=self.count,
+                                sum=self.sum, sumsq=self.sumsq, hist=self.hist)
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            if meta.get("version") != STATE_VERSION or meta.get("quantities") != QUANTITIES:
+                raise ValueError(f"{path}: unsupported ensemble state")
+            ens = cls(meta["motors"], meta["n_bins"], meta["kt"], meta["pole_pairs"],
+                      meta["hist_bins"], {k: tuple(v) for k, v in meta["hist_ranges"].items()})
+            ens.count, ens.sum, ens.sumsq, ens.hist = z["count"], z["sum"], z["sumsq"], z["hist"]
+        ens.strides = meta["strides"]
+        ens.sessions = meta["sessions"]
+        return ens
+
+
+def plot_ensemble(res, out, quantity="pos_deg"):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    sub = res[res["quantity"] == quantity]
+    motors = list(dict.fromkeys(sub["motor"]))
+    fig, axes = plt.subplots(len(motors), 1, figsize=(10, 2.6 * len(motors)), sharex=True,
+                             squeeze=False)
+    for ax, m in zip(axes[:, 0], motors):
+        d = sub[sub["motor"] == m]
+        ax.fill_between(d["phase"], d["p5"], d["p95"], alpha=0.2, label="p5–p95")
+        ax.fill_between(d["phase"], d["p25"], d["p75"], alpha=0.35, label="p25–p75")
+        ax.plot(d["phase"], d["mean"], label="mean")
+        ax.plot(d["phase"], d["mean"] - d["std"], "k:", lw=0.8)
+        ax.plot(d["phase"], d["mean"] + d["std"], "k:", lw=0.8, label="±1 std")
+        ax.set_ylabel(f"{m}\n{quantity}")
+        ax.grid(True)
+    axes[0, 0].legend(loc="upper right", fontsize=8)
+    axes[-1, 0].set_xlabel("Gait phase (index)")
+    fig.tight_layout()
+    fig.savefig(out, dpi=150)
+    plt.close(fig)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Phase-binned ensemble averages over gait sessions.")
+    ap.add_argument("decoded", type=Path, nargs="*", help="Decoded gait CSVs (or .npz caches)")
+    ap.add_argument("--state", type=Path, default=None,
+                    help="Ensemble .npz to fold the inputs into (created if missing)")
+    ap.add_argument("--kt", type=float, default=None,
+                    help="Torque constant Kt (N·m/A; default 0.16, or the --state's)")
+    ap.add_argument("--pole-pairs", type=int, default=None,
+                    help="Pole pairs when only eRPM is in the file (default 21, or the --state's)")
+    ap.add_argument("--csv", type=Path, default=None, help="Write the per-phase table")
+    ap.add_argument("--plot", type=Path, default=None, help="Save a mean/envelope plot (PNG)")
+    ap.add_argument("--quantity", choices=QUANTITIES, default="pos_deg",
+                    help="Quantity for --plot (default: pos_deg)")
+    args = ap.parse_args()
+
+    if args.state and args.state.exists():
+        ens = PhaseEnsemble.load(args.state)
+        print(f"Loaded {args.state}: {len(ens.sessions)} session(s), strides {ens.strides}")
+        # mixing sessions computed with other constants would corrupt torque/power
+        for opt, given, stored in (("--kt", args.kt, ens.kt),
+                                   ("--pole-pairs", args.pole_pairs, ens.pole_pairs)):
+            if given is not None and given != stored:
+                ap.error(f"{args.state} was built with {opt} {stored:g}; "
+                         f"drop {opt} or use a new --state")
+    else:
+        ens = PhaseEnsemble(kt=0.16 if args.kt is None else args.kt,
+                            pole_pairs=21 if args.pole_pairs is None else args.pole_pairs)
+
+    if args.decoded:
+        import gait_cache  # decoder LUTs are only needed when there is something to load
+    for p in args.decoded:
+        key = str(p.resolve())
+        if key in ens.sessions:
+            print(f"Already in ensemble: {p}")
+            continue
+        added = ens.update(gait_cache.load_decoded(p), source=key)
+        print(f"Added {p.name}: strides {added}")
+
+    if args.state:
+        ens.save(args.state)
+        print(f"Saved ensemble → {args.state}")
+
+    res = ens.result()
+    if res.empty:
+        print("No complete strides.")
+        return
+    pd.set_option("display.width", 160)
+    print(f"\nStrides: {ens.strides}")
+    summary = res.groupby(["motor", "quantity"]).agg(
+        mean_min=("mean", "min"), mean_max=("mean", "max"), std_mean=("std", "mean"),
+        band_p5_p95=("p95", "mean"))
+    summary["band_p5_p95"] -= res.groupby(["motor", "quantity"])["p5"].mean()
+    print(summary.to_string(float_format=lambda v: f"{v:.3f}"))
+
+    if args.csv:
+        res.to_csv(args.csv, index=False)
+        print(f"Saved → {args.csv}")
+    if args.plot:
+        plot_ensemble(res, args.plot, args.quantity)
+        print(f"Saved → {args.plot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Stream decoded chunks straight from a raw gait_data_log_*.csv and reduce them
+chunk by chunk, so a full-day session can be analysed in bounded memory
+without first writing a _decoded.csv.
+
+Each chunk is a pandas DataFrame with the same columns as the decoded CSV
+(see decode_exo_can_csv.decoded_header).
+
+Running reductions:
+  RunningStats       – per-column count / min / max / mean
+  EnergyAccumulator  – per-motor mechanical energy τ·ω (Wh), integrated over
+                       Elapsed_us with the trapezoid rule across chunk edges
+
+Usage:
+  python gait_stream.py Experiment5/gait_data_log_20251120_151836.csv
+  python gait_stream.py raw.csv --chunk-rows 100000 --pole-pairs 21 --kt 0.16
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from decode_exo_can_csv import MOTOR_ORDER, decode_payload, iter_raw_chunks
+
+DEFAULT_CHUNK_ROWS = 100_000
+BASE_COLS = ["TimeStep", "Elapsed_us", "L_Gait_Index", "R_Gait_Index"]
+
+
+def iter_decoded_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, pole_pairs=21):
+    """Yield decoded DataFrames of up to chunk_rows rows from a raw gait log."""
+    with Path(path).open("r", newline="") as f_in:
+        for meta, payload in iter_raw_chunks(f_in, chunk_rows):
+            if not len(meta):
+                continue
+            cols = {c: meta[:, i] for i, c in enumerate(BASE_COLS)}
+            cols.update(decode_payload(payload, pole_pairs))
+            yield pd.DataFrame(cols)
+
+
+class RunningStats:
+    """Count / min / max / mean for every numeric column, updated per chunk."""
+
+    def __init__(self, columns=None):
+        self.columns = columns
+        self.count = None
+        self.min = None
+        self.max = None
+        self.sum = None
+
+    def update(self, df):
+        if self.columns is None:
+            self.columns = [c for c in df.columns
+                            if c not in BASE_COLS and pd.api.types.is_numeric_dtype(df[c])]
+        vals = df[self.columns].to_numpy(dtype=float)
+        if self.count is None:
+            n = len(self.columns)
+            self.count = np.zeros(n, dtype=np.int64)
+            self.min = np.full(n, np.inf)
+            self.max = np.full(n, -np.inf)
+            self.sum = np.zeros(n)
+        self.count += np.isfinite(vals).sum(axis=0)
+        self.min = np.fmin(self.min, np.nanmin(vals, axis=0, initial=np.inf))
+        self.max = np.fmax(self.max, np.nanmax(vals, axis=0, initial=-np.inf))
+        self.sum += np.nansum(vals, axis=0)
+
+    def result(self):
+        """DataFrame indexed by column with count, min, max, mean."""
+        if self.count is None:
+            return pd.DataFrame(columns=["count", "min", "max", "mean"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sum / self.count
+        return pd.DataFrame({"count": self.count, "min": self.min, "max": self.max, "mean": mean},
+                            index=self.columns)
+
+
+class EnergyAccumulator:
+    """
+    Cumulative mechanical energy per motor, P = Kt * Iq * ω_m, integrated over
+    Elapsed_us. The last sample of each chunk is carried so the trapezoid
+    spans chunk boundaries exactly as it would on the whole file.
+    """
+
+    def __init__(self, kt=0.16, pole_pairs=21, motors=MOTOR_ORDER):
+        if pole_pairs <= 0:
+            raise ValueError(f"pole_pairs must be > 0, got {pole_pairs}")
+        self.kt = float(kt)
+        self.pole_pairs = pole_pairs
+        self.motors = list(motors)
+        self.pos_J = np.zeros(len(self.motors))
+        self.neg_J = np.zeros(len(self.motors))
+        self.duration_s = 0.0
+        self._last_t = None
+        self._last_p = None
+
+    def _power(self, df):
+        p = np.empty((len(df), len(self.motors)))
+        for mi, m in enumerate(self.motors):
+            mech_col = f"{m}_spd_mech_RPM"
+            if mech_col in df.columns:
+                rpm = df[mech_col].to_numpy(dtype=float)
+            else:
+                rpm = df[f"{m}_spd_eRPM"].to_numpy(dtype=float) / float(self.pole_pairs)
+            omega = rpm * (2.0 * np.pi / 60.0)
+            p[:, mi] = self.kt * df[f"{m}_current_A"].to_numpy(dtype=float) * omega
+        return p
+
+    def update(self, df):
+        if df.empty:
+            return
+        t = df["Elapsed_us"].to_numpy(dtype=float) * 1e-6
+        p = self._power(df)
+        if self._last_t is not None:
+            t = np.concatenate(([self._last_t], t))
+            p = np.vstack((self._last_p, p))
+        if len(t) > 1:
+            dt = np.diff(t)[:, None]
+            incr = 0.5 * (p[1:] + p[:-1]) * dt
+            self.pos_J += np.where(incr > 0, incr, 0.0).sum(axis=0)
+            self.neg_J += np.where(incr < 0, incr, 0.0).sum(axis=0)
+            self.duration_s += float(t[-1] - t[0])
+        self._last_t = t[-1]
+        self._last_p = p[-1]
+
+    def result(self):
+        """DataFrame indexed by motor with positive, regen and net energy (Wh)."""
+        return pd.DataFrame({
+            "E_pos_Wh": self.pos_J / 3600.0,
+            "E_neg_Wh": self.neg_J / 3600.0,
+            "E_net_Wh": (self.pos_J + self.neg_J) / 3600.0,
+        }, index=self.motors)
+
+
+def summarize(path, chunk_rows=DEFAULT_CHUNK_ROWS, pole_pairs=21, kt=0.16):
+    """Run RunningStats and EnergyAccumulator over a raw log; returns (stats, energy, rows)."""
+    stats = RunningStats()
+    energy = EnergyAccumulator(kt=kt, pole_pairs=pole_pairs)
+    rows = 0
+    for df in iter_decoded_chunks(path, chunk_rows, pole_pairs):
+        stats.update(df)
+        energy.update(df)
+        rows += len(df)
+    return stats, energy, rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chunked streaming summary of a raw gait log.")
+    ap.add_argument("input_csv", type=Path, help="Raw gait_data_log_*.csv")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                    help="Rows per decoded chunk (default: 100000)")
+    ap.add_argument("--pole-pairs", type=int, default=21,
+                    help="Pole pairs for mechanical RPM conversion")
+    ap.add_argument("--kt", type=float, default=0.16, help="Torque constant Kt (N·m/A)")
+    args = ap.parse_args()
+    if args.pole_pairs <= 0:
+        ap.error("--pole-pairs must be > 0")
+
+    stats, energy, rows = summarize(args.input_csv, args.chunk_rows, args.pole_pairs, args.kt)
+
+    pd.set_option("display.width", 140)
+    print(f"File: {args.input_csv.name}")
+    print(f"Rows: {rows}   Duration: {energy.duration_s:.1f} s\n")
+    print(stats.result().to_string(float_format=lambda v: f"{v:.3f}"))
+    print()
+    e = energy.result()
+    print(e.to_string(float_format=lambda v: f"{v:.4f}"))
+    print(f"\nTotal mechanical energy: {e['E_pos_Wh'].sum():.4f} Wh positive, "
+          f"{e['E_net_Wh'].sum():.4f} Wh net")
+
+
+if __name__ == "__main__":
+    main()
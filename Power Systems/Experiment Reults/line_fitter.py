@@ -1,15 +1,16 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
+from gait_cache import load_decoded
+
 # ------------------ CONFIG ------------------
 CSV_PATH = r"Experiment2\gait_data_log_20251114_161409_decoded.csv"
 # Choose which joint to fit:
 JOINT_COL = "LeftKnee_pos_deg"   # change to "RightHip_pos_deg", "RightKnee_pos_deg", etc.
 
 # ------------------ LOAD CSV ------------------
-df = pd.read_csv(CSV_PATH)
+df = load_decoded(CSV_PATH)
 
 # Time in seconds from start (using Elapsed_us)
 t = (df["Elapsed_us"] - df["Elapsed_us"].iloc[0]) / 1_000_000.0
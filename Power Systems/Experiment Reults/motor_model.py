@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Shared motor model for the exo joints: torque, speed, mechanical power and
+battery power from decoded gait data.
+
+All four joints are CubeMars AK10-9 (MOTOR_PARAMS). Conventions:
+
+  Kt          rotor-side torque constant (N·m/A); output torque = Kt·gear·Iq
+  ω rotor     *_spd_mech_RPM, else *_spd_eRPM / pole_pairs
+  ω output    ω rotor / gear
+  P_mech      τ_out·ω_out = Kt·Iq·ω_rotor (gear cancels)
+
+Motor efficiency is an EfficiencyTable over |output torque| × |output speed|
+on a uniform grid, precomputed once and read by index arithmetic (linear
+along torque, bilinear when the map varies with speed), so every motor and
+sample is evaluated in one vectorized pass. The default
+table is the torque curve net_bat_power.py has always used (rises from
+eta_min to eta_peak at tau_peak, falls to 0.60 at tau_max) and is flat in
+speed; a measured map can be passed as a 2-D array instead.
+
+Battery power per motor: P_mech / (η_motor·η_conv_fwd) when driving,
+P_mech·η_motor·η_conv_regen when back-driven (0 if --unidirectional).
+
+Usage:
+  python motor_model.py Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python motor_model.py decoded.csv --v-batt 48 --unidirectional
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from decode_exo_can_csv import MOTOR_ORDER
+
+MOTOR_PARAMS = {
+    # Kt from the datasheet (KV 60 rpm/V → 0.159 N·m/A); 21 pole pairs; 9:1 planetary
+    "AK10-9": {"kt": 0.16, "pole_pairs": 21, "gear": 9.0},
+}
+JOINT_MOTORS = {m: "AK10-9" for m in MOTOR_ORDER}
+
+ETA_MIN = 0.20
+ETA_PEAK = 0.80
+ETA_END = 0.60
+TAU_PEAK = 11.0   # N·m at the output
+TAU_MAX = 55.0
+SPEED_MAX = 60.0  # rad/s at the output; table edge (values beyond are clamped)
+TABLE_STEP_TAU = 0.05
+TABLE_STEP_W = 1.0
+CHUNK_ROWS = 8192
+
+
+def eta_curve(tau_abs, eta_min=ETA_MIN, eta_peak=ETA_PEAK, tau_peak=TAU_PEAK, tau_max=TAU_MAX,
+              eta_end=ETA_END):
+    """Piecewise-linear efficiency vs |torque|, clamped to [eta_min, eta_peak]."""
+    tau_abs = np.asarray(tau_abs, dtype=float)
+    span = max(tau_max - tau_peak, 1e-6)
+    eta = np.interp(tau_abs, [0.0, max(tau_peak, 1e-6)], [eta_min, eta_peak])
+    falling = eta_peak - (eta_peak - eta_end) * ((tau_abs - tau_peak) / span)
+    return np.clip(np.where(tau_abs > tau_peak, falling, eta), eta_min, eta_peak)
+
+
+class EfficiencyTable:
+    """η on a uniform |τ| × |ω| grid (output side), bilinear lookup, clamped at the edges."""
+
+    def __init__(self, values, tau_step, w_step):
+        self.values = np.asarray(values, dtype=float)
+        if self.values.ndim != 2 or min(self.values.shape) < 2:
+            raise ValueError("efficiency table must be 2-D with at least 2×2 points")
+        self.tau_step = float(tau_step)
+        self.w_step = float(w_step)
+        # a map that doesn't change with speed is interpolated along torque only
+        self.speed_flat = bool(np.all(self.values == self.values[:, :1]))
+        self._eta_tau = np.ascontiguousarray(self.values[:, 0])
+
+    @classmethod
+    def from_curve(cls, eta_min=ETA_MIN, eta_peak=ETA_PEAK, tau_peak=TAU_PEAK, tau_max=TAU_MAX,
+                   tau_step=TABLE_STEP_TAU, w_max=SPEED_MAX, w_step=TABLE_STEP_W):
+        tau = np.arange(0.0, tau_max + tau_step, tau_step)
+        n_w = int(np.ceil(w_max / w_step)) + 1
+        eta = eta_curve(tau, eta_min, eta_peak, tau_peak, tau_max)
+        return cls(np.repeat(eta[:, None], n_w, axis=1), tau_step, w_step)
+
+    def lookup(self, tau, omega):
+        """η for |tau| (N·m) and |omega| (rad/s) arrays of any (broadcastable) shape."""
+        n_t, n_w = self.values.shape
+        x = np.abs(tau)
+        x *= 1.0 / self.tau_step
+        np.minimum(x, n_t - 1.000001, out=x)
+        if self.speed_flat:
+            v = self._eta_tau
+            i = x.astype(np.intp)
+            x -= i                      # fraction within the grid cell
+            lo = v.take(i)
+            i += 1
+            eta = v.take(i)
+            eta -= lo
+            eta *= x
+            eta += lo
+            return np.broadcast_to(eta, np.broadcast_shapes(eta.shape, np.shape(omega)))
+        y = np.minimum(np.abs(omega) * (1.0 / self.w_step), n_w - 1.000001)
+        i, j = x.astype(np.intp), y.astype(np.intp)
+        fx, fy = x - i, y - j
+        v = self.values.ravel()
+        k = i * n_w + j  # flat index of the lower corner
+        v00, v10 = v.take(k), v.take(k + n_w)
+        v01, v11 = v.take(k + 1), v.take(k + n_w + 1)
+        top = v00 + (v10 - v00) * fx
+        bot = v01 + (v11 - v01) * fx
+        return top + (bot - top) * fy
+
+
+class MotorModel:
+    """Per-joint AK10-9 parameters plus one efficiency table."""
+
+    def __init__(self, motors=MOTOR_ORDER, kt=None, pole_pairs=None, gear=None, eta_table=None):
+        self.motors = list(motors)
+        params = [MOTOR_PARAMS[JOINT_MOTORS[m]] for m in self.motors]
+        # explicit kt / pole_pairs / gear override every joint (CLI flags);
+        # stored as motors × 1 columns to broadcast over motors × rows arrays
+        self.kt = np.array([[p["kt"] if kt is None else kt] for p in params], dtype=float)
+        self.pole_pairs = np.array([[p["pole_pairs"] if pole_pairs is None else pole_pairs]
+                                    for p in params], dtype=float)
+        self.gear = np.array([[p["gear"] if gear is None else gear] for p in params], dtype=float)
+        self.eta_table = eta_table or EfficiencyTable.from_curve()
+
+    def currents(self, df):
+        """motors × rows Iq (A)."""
+        return np.vstack([df[f"{m}_current_A"].to_numpy(dtype=float) for m in self.motors])
+
+    def rotor_omega(self, df):
+        """motors × rows rotor speed (rad/s)."""
+        cols = []
+        for m, pp in zip(self.motors, self.pole_pairs[:, 0]):
+            if f"{m}_spd_mech_RPM" in df.columns:
+                rpm = df[f"{m}_spd_mech_RPM"].to_numpy(dtype=float)
+            elif f"{m}_spd_eRPM" in df.columns:
+                rpm = df[f"{m}_spd_eRPM"].to_numpy(dtype=float) / pp
+            else:
+                raise KeyError(f"no speed column for {m} (need _spd_mech_RPM or _spd_eRPM)")
+            cols.append(rpm)
+        return np.vstack(cols) * (2.0 * np.pi / 60.0)
+
+    def output_torque(self, current):
+        return current * (self.kt * self.gear)
+
+    def mech_power(self, df, current=None, omega=None):
+        """motors × rows τ·ω (W), signed: > 0 driving, < 0 back-driven."""
+        current = self.currents(df) if current is None else current
+        omega = self.rotor_omega(df) if omega is None else omega
+        return current * self.kt * omega
+
+    def efficiency(self, current, omega):
+        """motors × rows η_motor at the output torque / speed of each sample."""
+        w_out = 0.0 if self.eta_table.speed_flat else omega / self.gear
+        return self.eta_table.lookup(self.output_torque(current), w_out)
+
+    def battery_terms(self, current, omega, chunk_rows=CHUNK_ROWS):
+        """
+        (drive, regen) per row from motors × rows current / rotor speed:
+        Σ P_mech/η_motor over driving motors and Σ P_mech·η_motor (≤ 0) over
+        back-driven ones, so P_batt = drive/η_fwd + η_regen·regen.
+        """
+        n = current.shape[1]
+        drive, regen = np.empty(n), np.empty(n)
+        # cache-sized row blocks: the temporaries stay in L2 instead of
+        # streaming a dozen full-length arrays through memory
+        for a in range(0, n, chunk_rows):
+            cur, w = current[:, a:a + chunk_rows], omega[:, a:a + chunk_rows]
+            p = self.mech_power(None, cur, w)
+            eta = np.maximum(self.efficiency(cur, w), 1e-6)
+            driving = p > 0.0
+            drive[a:a + chunk_rows] = np.where(driving, p / eta, 0.0).sum(axis=0)
+            regen[a:a + chunk_rows] = np.where(driving, 0.0, p * eta).sum(axis=0)
+        return drive, regen
+
+    def battery_power(self, df, eta_fwd=0.90, eta_regen=0.90, unidirectional=False,
+                      chunk_rows=CHUNK_ROWS):
+        """(P_mech motors × rows, P_batt per row) in W."""
+        current, omega = self.currents(df), self.rotor_omega(df)
+        drive, regen = self.battery_terms(current, omega, chunk_rows)
+        p_batt = drive / max(eta_fwd, 1e-6)
+        if not unidirectional:
+            p_batt += max(eta_regen, 1e-6) * regen
+        return self.mech_power(None, current, omega), p_batt
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Battery power of a decoded session via the motor model.")
+    ap.add_argument("decoded", type=Path, help="Decoded gait CSV (or its .npz cache)")
+    ap.add_argument("--v-batt", type=float, default=48.0, help="Battery voltage (V)")
+    ap.add_argument("--eta-fwd", type=float, default=0.90, help="Converter efficiency forward")
+    ap.add_argument("--eta-regen", type=float, default=0.90, help="Converter efficiency on regen")
+    ap.add_argument("--unidirectional", action="store_true", help="No backflow to battery")
+    args = ap.parse_args()
+
+    import gait_cache  # decoder LUTs are only needed when run as a script
+    df = gait_cache.load_decoded(args.decoded)
+    model = MotorModel()
+    p_mech, p_batt = model.battery_power(df, args.eta_fwd, args.eta_regen, args.unidirectional)
+    t = df["Elapsed_us"].to_numpy(dtype=float) * 1e-6
+    e_wh = np.sum(0.5 * (p_batt[1:] + p_batt[:-1]) * np.diff(t)) / 3600.0
+
+    tau_peak = np.abs(model.output_torque(model.currents(df))).max(axis=1)
+    print(f"Rows: {len(df)}  Duration: {t[-1] - t[0]:.1f} s")
+    for mi, m in enumerate(model.motors):
+        print(f"  {m:9s} mean P_mech {p_mech[mi].mean():7.3f} W   "
+              f"peak |τ_out| {tau_peak[mi]:6.2f} N·m")
+    print(f"Battery: mean {p_batt.mean():.2f} W  ({p_batt.mean() / args.v_batt:.3f} A @ {args.v_batt:g} V), "
+          f"peak {p_batt.max():.1f} W, energy {e_wh:.4f} Wh")
+
+
+if __name__ == "__main__":
+    main()
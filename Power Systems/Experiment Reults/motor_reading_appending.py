@@ -1,58 +1,258 @@
 #!/usr/bin/env python3
 """
-Append two gait CSVs with cleaned debug lines and continuous Elapsed_us.
+Append any number of gait logs into one session with continuous Elapsed_us
+and TimeStep, streaming chunk by chunk (one segment at a time at most).
+
+Inputs can be mixed:
+  raw gait_data_log_*.csv      (serial_in.py layout; chatter/debug lines dropped)
+  *_decoded.csv                (decode_exo_can_csv.py layout)
+  *.bin                        (can_frame_store.py binary frames)
+  *_decoded.npz                (gait_cache.py columnar cache)
+
+Output kind follows --to, else the output suffix (.bin → binary frames), else
+"decoded" if any input is decoded, else "raw". Raw/binary inputs are decoded
+on the fly when the output is decoded; decoded inputs can't become raw/bin.
+
+Rebasing, for every segment after the first:
+  Elapsed_us  → first row lands --gap-us after the previous segment's last
+                row (default: add the previous last Elapsed_us, as before)
+  TimeStep    → continues --gap-steps after the previous last TimeStep
+
+Segment boundaries go to <output>.segments.json (source, row range, offsets,
+first/last rebased values) so later analyses can split the session again.
 
 Usage:
-  python temp.py first.csv second.csv -o merged.csv
+  python motor_reading_appending.py first.csv second.csv -o merged.csv
+  python motor_reading_appending.py Experiment8/gait_data_log_*.csv -o exp8.csv --gap-us 1000000
+  python motor_reading_appending.py a.bin b.bin c.bin -o abc.bin
+  python motor_reading_appending.py a_decoded.npz b.csv -o ab_decoded.csv --pole-pairs 21
 """
 
 import argparse
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
-def load_and_clean(path):
-    """
-    Load a CSV and drop any rows where Elapsed_us is not numeric.
-    This removes lines like:
-      'Moving legs to start,,,,,,,,,,,,,,,,,,,,,,,,,,,'
-      'finished control loop,restarting'
-    because their Elapsed_us column will be empty/non-numeric.
-    """
-    df = pd.read_csv(path)
+import can_frame_store
+from decode_exo_can_csv import decoded_header, iter_raw_chunks, write_decoded_chunk
+from serial_in import infer_header_for_width
 
-    if "Elapsed_us" not in df.columns:
-        raise SystemExit(f"{path} does not contain 'Elapsed_us' column.")
+CHUNK_ROWS = 65536
+GAP_STEPS = 5          # firmware prints every 5th TimeStep
 
-    # Force Elapsed_us to numeric, turning bad values into NaN
-    df["Elapsed_us"] = pd.to_numeric(df["Elapsed_us"], errors="coerce")
 
-    # Drop any rows where Elapsed_us is NaN (debug / junk lines)
-    df = df[df["Elapsed_us"].notna()].reset_index(drop=True)
+# ---------- inputs ----------
+def input_kind(path):
+    """'bin', 'npz', 'decoded' or 'raw' for one input file."""
+    suffix = path.suffix.lower()
+    if suffix == ".bin":
+        return "bin"
+    if suffix == ".npz":
+        return "npz"
+    with path.open("r", newline="", errors="replace") as f:
+        header = f.readline()
+    return "decoded" if "_pos_deg" in header else "raw"
 
-    return df
 
-def main():
-    ap = argparse.ArgumentParser(description="Append two gait CSVs with Elapsed_us continuity.")
-    ap.add_argument("first", help="First CSV file")
-    ap.add_argument("second", help="Second CSV file")
-    ap.add_argument("-o", "--output", default="merged.csv", help="Output filename")
-    args = ap.parse_args()
+def iter_frames(path, kind, chunk_rows=CHUNK_ROWS):
+    """(meta, payload) chunks from a raw CSV or a binary frame store."""
+    if kind == "bin":
+        if not can_frame_store.read_header(path)["has_elapsed"]:
+            raise SystemExit(f"{path}: legacy store without Elapsed_us; can't rebase.")
+        frames = can_frame_store.open_frames(path)
+        for i in range(0, len(frames), chunk_rows):
+            yield can_frame_store.frames_to_arrays(frames[i:i + chunk_rows])
+    else:
+        with path.open("r", newline="") as f_in:
+            for meta, payload in iter_raw_chunks(f_in, chunk_rows):
+                if len(meta):
+                    yield meta, payload
+
+
+def iter_decoded_frames(path, kind, chunk_rows=CHUNK_ROWS):
+    """Decoded DataFrame chunks from a decoded CSV or a .npz cache."""
+    if kind == "npz":
+        import gait_cache  # pulls in the decoder LUTs; only needed for .npz inputs
+        df = gait_cache.read_cache(path)
+        chunks = (df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_rows)
+    for df in chunks:
+        if "Elapsed_us" not in df.columns:
+            raise SystemExit(f"{path} does not contain 'Elapsed_us' column.")
+        # Drop debug / junk rows whose Elapsed_us isn't numeric
+        df = df.assign(Elapsed_us=pd.to_numeric(df["Elapsed_us"], errors="coerce"))
+        df = df[df["Elapsed_us"].notna()]
+        if df["Elapsed_us"].dtype.kind == "f" and (df["Elapsed_us"] % 1 == 0).all():
+            df = df.assign(Elapsed_us=df["Elapsed_us"].astype(np.int64))
+        if len(df):
+            yield df
+
+
+# ---------- rebasing ----------
+class Rebaser:
+    """Shifts each segment's TimeStep / Elapsed_us to follow the previous one."""
+
+    def __init__(self, gap_us=None, gap_steps=GAP_STEPS):
+        self.gap_us = gap_us
+        self.gap_steps = gap_steps
+        self.last_ts = None
+        self.last_us = None
+        self.ts_off = 0
+        self.us_off = 0
+
+    def start_segment(self, first_ts, first_us):
+        if self.last_ts is None:
+            self.ts_off = self.us_off = 0
+            return
+        self.ts_off = self.last_ts + self.gap_steps - first_ts
+        if self.gap_us is None:
+            self.us_off = self.last_us
+        else:
+            self.us_off = self.last_us + self.gap_us - first_us
 
-    # Load & clean both CSVs
-    df1 = load_and_clean(args.first)
-    df2 = load_and_clean(args.second)
+    def apply(self, ts, us):
+        """Rebased copies of the TimeStep / Elapsed_us arrays; remembers the last row."""
+        ts = ts + self.ts_off
+        us = us + self.us_off
+        self.last_ts, self.last_us = ts[-1], us[-1]
+        return ts, us
 
-    # Last timestamp of file 1
-    last_us = df1["Elapsed_us"].iloc[-1]
 
-    # Offset file 2's elapsed_us so it continues from file 1
-    df2["Elapsed_us"] = df2["Elapsed_us"] + last_us
+def _as_int(v):
+    v = float(v)
+    return int(v) if v.is_integer() else v
+
+
+# ---------- writers ----------
+def merge(inputs, output, to=None, gap_us=None, gap_steps=GAP_STEPS, pole_pairs=21,
+          chunk_rows=CHUNK_ROWS):
+    """Stream all inputs into output; returns the segment index (list of dicts)."""
+    kinds = [input_kind(p) for p in inputs]
+    if to is None:
+        if output.suffix.lower() == ".bin":
+            to = "bin"
+        elif any(k in ("decoded", "npz") for k in kinds):
+            to = "decoded"
+        else:
+            to = "raw"
+    if to in ("raw", "bin"):
+        bad = [str(p) for p, k in zip(inputs, kinds) if k in ("decoded", "npz")]
+        if bad:
+            raise SystemExit(f"Decoded inputs can't be written as {to}: {', '.join(bad)}")
+
+    rebase = Rebaser(gap_us, gap_steps)
+    segments = []
+    rows_out = 0
+    mode = "wb" if to == "bin" else "w"
+    with output.open(mode, **({} if to == "bin" else {"newline": ""})) as f_out:
+        header = None
+        if to == "bin":
+            can_frame_store.write_header(f_out, has_elapsed=True)
+        elif to == "raw":
+            header = infer_header_for_width(36)
+            csv.writer(f_out).writerow(header)
+
+        for path, kind in zip(inputs, kinds):
+            seg = {"index": len(segments), "source": str(path), "kind": kind,
+                   "start_row": rows_out, "rows": 0}
+            first = True
+
+            if kind in ("raw", "bin"):
+                for meta, payload in iter_frames(path, kind, chunk_rows):
+                    if first:
+                        rebase.start_segment(int(meta[0, 0]), int(meta[0, 1]))
+                        seg["first_TimeStep"], seg["first_Elapsed_us"] = (
+                            int(meta[0, 0] + rebase.ts_off), int(meta[0, 1] + rebase.us_off))
+                        first = False
+                    meta = meta.copy()
+                    meta[:, 0], meta[:, 1] = rebase.apply(meta[:, 0], meta[:, 1])
+                    if to == "bin":
+                        can_frame_store.append_records(f_out, meta, payload)
+                    elif to == "raw":
+                        vals = np.concatenate([meta, payload.reshape(len(meta), -1)], axis=1)
+                        f_out.write("".join(",".join(map(str, r)) + "\r\n" for r in vals.tolist()))
+                    else:
+                        if header is None:
+                            header = decoded_header(pole_pairs)
+                            csv.writer(f_out).writerow(header)
+                        elif header != decoded_header(pole_pairs):
+                            raise SystemExit(f"{path}: decoded columns differ from the first input "
+                                             f"(check --pole-pairs)")
+                        write_decoded_chunk(f_out, meta, payload, pole_pairs)
+                    seg["rows"] += len(meta)
+            else:
+                for df in iter_decoded_frames(path, kind, chunk_rows):
+                    ts = df["TimeStep"].to_numpy()
+                    us = df["Elapsed_us"].to_numpy()
+                    if first:
+                        rebase.start_segment(ts[0], us[0])
+                        seg["first_TimeStep"] = _as_int(ts[0] + rebase.ts_off)
+                        seg["first_Elapsed_us"] = _as_int(us[0] + rebase.us_off)
+                        first = False
+                    new_ts, new_us = rebase.apply(ts, us)
+                    df = df.assign(TimeStep=new_ts, Elapsed_us=new_us)
+                    if header is None:
+                        header = list(df.columns)
+                        csv.writer(f_out).writerow(header)
+                    elif list(df.columns) != header:
+                        raise SystemExit(f"{path}: columns differ from the first decoded input "
+                                         f"(different pole pairs?)")
+                    df.to_csv(f_out, header=False, index=False, lineterminator="\r\n")
+                    seg["rows"] += len(df)
+
+            if first:
+                print(f"[WARN] {path}: no rows with Elapsed_us; skipped")
+                continue
+            seg.update({
+                "end_row": rows_out + seg["rows"],
+                "last_TimeStep": _as_int(rebase.last_ts),
+                "last_Elapsed_us": _as_int(rebase.last_us),
+                "TimeStep_offset": _as_int(rebase.ts_off),
+                "Elapsed_us_offset": _as_int(rebase.us_off),
+            })
+            rows_out += seg["rows"]
+            segments.append(seg)
+
+    index = {"output": output.name, "kind": to, "gap_us": gap_us, "gap_steps": gap_steps,
+             "rows": rows_out, "segments": segments}
+    segments_path_for(output).write_text(json.dumps(index, indent=1))
+    return segments
+
+
+def segments_path_for(output):
+    return output.with_name(output.stem + ".segments.json")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Append gait logs with continuous Elapsed_us / TimeStep.")
+    ap.add_argument("inputs", nargs="+", type=Path, help="Gait logs in session order")
+    ap.add_argument("-o", "--output", type=Path, default=Path("merged.csv"), help="Output filename")
+    ap.add_argument("--to", choices=["raw", "decoded", "bin"], default=None,
+                    help="Output kind (default: from suffix / inputs)")
+    ap.add_argument("--gap-us", type=float, default=None,
+                    help="Elapsed_us between one segment's last row and the next one's first "
+                         "(default: add previous last Elapsed_us, as the two-file version did)")
+    ap.add_argument("--gap-steps", type=int, default=GAP_STEPS,
+                    help="TimeStep between segments (default: 5, the firmware print stride)")
+    ap.add_argument("--pole-pairs", type=int, default=21,
+                    help="Pole pairs when raw/binary inputs are decoded on the fly")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = ap.parse_args()
 
-    # Append
-    df_out = pd.concat([df1, df2], ignore_index=True)
+    gap_us = None if args.gap_us is None else int(args.gap_us)
+    segments = merge(args.inputs, args.output, args.to, gap_us, args.gap_steps,
+                     args.pole_pairs, args.chunk_rows)
+    print(f"Saved merged CSV to {args.output}" if args.output.suffix != ".bin"
+          else f"Saved merged frames to {args.output}")
+    for s in segments:
+        print(f"  [{s['index']}] rows {s['start_row']}–{s['end_row']}  "
+              f"Elapsed_us {s['first_Elapsed_us']} → {s['last_Elapsed_us']}  {Path(s['source']).name}")
+    print(f"Segment index: {segments_path_for(args.output)}")
 
-    # Save
-    df_out.to_csv(args.output, index=False)
-    print(f"Saved merged CSV to {args.output}")
 
 if __name__ == "__main__":
     main()
@@ -8,9 +8,13 @@ Uses torque × motor-speed:
   omega_m = motor mech RPM * 2π/60
   P_mech_sum = sum_i (tau_i * omega_m_i)
 
-Speeds are taken from decoded CSV:
-  - Prefer *_spd_mech_RPM (already motor mechanical RPM)
-  - Else use *_spd_eRPM / pole_pairs
+Timebase: Elapsed_us mapped to host time through the clock-drift model
+(clock_sync.py) when a gait_sync_<stamp>.csv sits next to the input or
+--sync is given; otherwise TimeStep * --dt as before.
+
+Torque, speed and efficiency come from motor_model.MotorModel (AK10-9):
+  - Speeds: *_spd_mech_RPM (rotor RPM), else *_spd_eRPM / pole_pairs
+  - Efficiency looked up at the output torque Kt * gear * Iq
 
 Motor efficiency curve (from your image):
   - Rises quickly to ~0.80 at ~11 N·m
@@ -21,14 +25,27 @@ Shows:
   2) Battery power (W)
   3) Battery current (A) [estimated]  + average line
   4) Cumulative battery energy (Wh)
+
+--headless draws the four plots as one stacked PNG with the Agg backend
+instead of opening windows (default <stem>_battery.png next to the input),
+with traces min/max-decimated to the pixel width of their axes (render.py),
+and skips the redraw when that PNG is already up to date.
+
+Usage:
+  python net_bat_power.py -i Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python net_bat_power.py -i decoded.csv --headless -o battery.png
 """
 
 from pathlib import Path
 import argparse
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from clock_sync import load_model, sync_path_for
+from gait_cache import load_decoded
+from motor_model import MOTOR_PARAMS, EfficiencyTable, MotorModel
+from render import headless, is_fresh, output_for, plot_minmax, save_figure
+
 DEFAULT_CSV = Path(__file__).parent / "Experiment2" / "gait_data_log_20251114_163330_decoded.csv"
 MOTORS = ["RightHip", "LeftHip", "RightKnee", "LeftKnee"]
 
@@ -46,63 +63,34 @@ def cumulative_trapezoid_np(y, x):
     incr = avg * dt
     return np.concatenate(([0.0], np.cumsum(incr)))
 
-def build_timebase(df, dt):
+def build_timebase(df, dt, model=None):
+    if model is not None and "Elapsed_us" in df.columns:
+        epoch = model.to_epoch(df["Elapsed_us"].to_numpy())
+        return epoch - epoch[0]
     if "time_s" in df.columns:
         return df["time_s"].to_numpy(dtype=float)
     if "TimeStep" in df.columns:
         return df["TimeStep"].to_numpy(dtype=float) * float(dt)
     return np.arange(len(df), dtype=float) * float(dt)
 
-def get_motor_omega_rad_s(df, motor, pole_pairs):
-    """Return motor mechanical angular speed ω [rad/s] for a given motor name."""
-    mech_col = f"{motor}_spd_mech_RPM"
-    erpm_col = f"{motor}_spd_eRPM"
-    if mech_col in df.columns:
-        mech_rpm = df[mech_col].astype(float).to_numpy()
-    elif erpm_col in df.columns and pole_pairs:
-        mech_rpm = (df[erpm_col].astype(float) / float(pole_pairs)).to_numpy()
-    else:
-        return None
-    return mech_rpm * (2.0 * np.pi / 60.0)
-
-def motor_eta_from_tau(tau_abs, eta_min=0.60, eta_peak=0.80, tau_peak=11.0, tau_max=55.0):
-    """
-    Approximate motor efficiency curve based on your provided plot:
-      - Rises ~linearly from eta_min at 0 N·m to eta_peak at tau_peak (~11 N·m)
-      - Then declines ~linearly from eta_peak at tau_peak to ~0.60 at tau_max (~55 N·m)
-    """
-    tau_abs = np.asarray(tau_abs, dtype=float)
-    eta = np.zeros_like(tau_abs)
-
-    # Rising section (0 → tau_peak)
-    rise_mask = tau_abs <= tau_peak
-    if np.any(rise_mask):
-        eta[rise_mask] = eta_min + (eta_peak - eta_min) * (tau_abs[rise_mask] / max(tau_peak, 1e-6))
-
-    # Falling section (tau_peak → tau_max)
-    fall_mask = tau_abs > tau_peak
-    if np.any(fall_mask):
-        span = max(tau_max - tau_peak, 1e-6)
-        eta_fall = eta_peak - (eta_peak - 0.60) * ((tau_abs[fall_mask] - tau_peak) / span)
-        eta[fall_mask] = eta_fall
-
-    # Clamp to [eta_min, eta_peak] for safety
-    eta = np.clip(eta, eta_min, eta_peak)
-    return eta
-
 # ---------- main ----------
-def main():
+def build_parser():
     ap = argparse.ArgumentParser()
     ap.add_argument("-i", "--input", type=Path, default=DEFAULT_CSV, help="Path to decoded CSV")
     ap.add_argument("--v_batt", type=float, default=48.0, help="Battery voltage (V)")
     ap.add_argument("--eta_fwd", type=float, default=0.90, help="Converter efficiency forward")
     ap.add_argument("--eta_regen", type=float, default=0.90, help="Converter efficiency on regen")
     ap.add_argument("--unidirectional", action="store_true", help="No backflow to battery (clamp regen)")
-    ap.add_argument("--dt", type=float, default=0.04, help="Sample period (s)")
+    ap.add_argument("--dt", type=float, default=0.04, help="Sample period (s), without a drift model")
+    ap.add_argument("--sync", type=Path, default=None,
+                    help="gait_sync CSV or drift model JSON (default: gait_sync_<stamp>.csv next to input)")
     ap.add_argument("--downsample", type=int, default=1, help="Plot every Nth sample")
     # Motor parameters
-    ap.add_argument("--kt", type=float, default=0.16, help="Torque constant Kt (N·m/A)")
-    ap.add_argument("--pole-pairs", type=int, default=7, help="Motor pole pairs for eRPM→mech RPM")
+    ak10 = MOTOR_PARAMS["AK10-9"]
+    ap.add_argument("--kt", type=float, default=ak10["kt"], help="Torque constant Kt (N·m/A)")
+    ap.add_argument("--pole-pairs", type=int, default=ak10["pole_pairs"],
+                    help="Motor pole pairs for eRPM→mech RPM")
+    ap.add_argument("--gear", type=float, default=ak10["gear"], help="Gear ratio (output torque = Kt·gear·Iq)")
     # Motor efficiency curve tuning
     ap.add_argument("--eta-motor-peak", type=float, default=0.80, help="Motor efficiency at τ_peak")
     ap.add_argument("--eta-motor-min", type=float, default=0.2, help="Motor efficiency near zero torque")
@@ -111,10 +99,21 @@ def main():
     # DMM overlay
     ap.add_argument("--dmm-constant", type=float, default=None, help="Overlay constant DMM current (A)")
     ap.add_argument("--dmm-col", type=str, default=None, help="CSV column for measured battery current (A)")
-    args = ap.parse_args()
-
-    df = pd.read_csv(args.input)
-    t = build_timebase(df, args.dt)
+    # Headless output
+    ap.add_argument("--headless", action="store_true",
+                    help="Save one PNG with the Agg backend instead of opening windows")
+    ap.add_argument("-o", "--output", type=Path, default=None,
+                    help="PNG for --headless (default: <stem>_battery.png next to the input)")
+    ap.add_argument("--force", action="store_true", help="With --headless, redraw even if up to date")
+    return ap
+
+
+def estimate(df, args):
+    """Adds P_sum_mech_W / P_batt_W / I_batt_est_A to df; returns (t, energy_Wh)."""
+    model = load_model(args.input, args.sync)
+    if model is not None:
+        print(f"Timebase: Elapsed_us through drift model ({len(model.knots_s)} knots)")
+    t = build_timebase(df, args.dt, model)
 
     # --- ensure currents exist ---
     cur_cols = [f"{m}_current_A" for m in MOTORS]
@@ -122,62 +121,32 @@ def main():
     if missing:
         raise ValueError(f"Missing columns: {missing}")
 
-    # --- gather speeds (ω) ---
-    omegas = {}
-    have_speed = True
-    for m in MOTORS:
-        om = get_motor_omega_rad_s(df, m, args.pole_pairs)
-        if om is None:
-            have_speed = False
-            break
-        omegas[m] = om
-    if not have_speed:
-        raise RuntimeError("Speed columns missing; τ·ω method unavailable. Need *_spd_mech_RPM or *_spd_eRPM.")
-
-    # --- torques, mechanical power per motor ---
-    torques = {m: args.kt * df[f"{m}_current_A"].astype(float).to_numpy() for m in MOTORS}
-    p_mech = {m: torques[m] * omegas[m] for m in MOTORS}
-    df["P_sum_mech_W"] = np.sum(list(p_mech.values()), axis=0)
-
-    # --- motor efficiency vs |τ| (from your curve) ---
-    eta_mot = {
-        m: motor_eta_from_tau(
-            np.abs(torques[m]),
+    # --- τ·ω per motor and battery power, all motors in one pass ---
+    motor = MotorModel(
+        MOTORS, kt=args.kt, pole_pairs=args.pole_pairs, gear=args.gear,
+        eta_table=EfficiencyTable.from_curve(
             eta_min=args.eta_motor_min,
             eta_peak=args.eta_motor_peak,
             tau_peak=args.tau_peak,
             tau_max=args.tau_max,
-        )
-        for m in MOTORS
-    }
-
-    # --- map to battery power (per motor), then sum ---
-    eta_conv_fwd, eta_conv_regen = float(args.eta_fwd), float(args.eta_regen)
-    P_batt_total = np.zeros_like(df["P_sum_mech_W"], dtype=float)
-
-    for m in MOTORS:
-        Pm = p_mech[m]           # mechanical power (W), signed
-        em = eta_mot[m]          # motor efficiency array (0..1)
-
-        if args.unidirectional:
-            # Forward only: negative mech power doesn't reduce battery power
-            P_elec_in = np.where(Pm > 0.0, Pm / np.maximum(em, 1e-6), 0.0)
-            P_batt = P_elec_in / max(eta_conv_fwd, 1e-6)
-        else:
-            # Bidirectional path
-            P_elec_in  = np.where(Pm > 0.0, Pm / np.maximum(em, 1e-6), 0.0)
-            P_elec_out = np.where(Pm < 0.0, Pm * np.maximum(em, 1e-6), 0.0)  # negative
-            P_batt = (P_elec_in / max(eta_conv_fwd, 1e-6)) + (P_elec_out * max(eta_conv_regen, 1e-6))
-
-        P_batt_total += P_batt
-
+        ),
+    )
+    try:
+        p_mech, P_batt_total = motor.battery_power(
+            df, args.eta_fwd, args.eta_regen, args.unidirectional)
+    except KeyError:
+        raise RuntimeError("Speed columns missing; τ·ω method unavailable. Need *_spd_mech_RPM or *_spd_eRPM.")
+    df["P_sum_mech_W"] = p_mech.sum(axis=0)
     df["P_batt_W"] = P_batt_total
 
     # --- battery current & energy ---
     df["I_batt_est_A"] = df["P_batt_W"] / float(args.v_batt)
     energy_J = cumulative_trapezoid_np(df["P_batt_W"].to_numpy(), t)
-    energy_Wh = energy_J / 3600.0
+    return t, energy_J / 3600.0
+
 
+def draw(axes, df, t, energy_Wh, args, decimate=False):
+    """The four plots, one per axes (decimate: min/max per pixel, for saved images)."""
     # --- downsample for plotting ---
     ds = max(1, args.downsample)
     t_p = t[::ds]
@@ -196,34 +165,79 @@ def main():
         dmm_series = np.full_like(Ibat_p, float(args.dmm_constant), dtype=float)
         dmm_label = f"DMM constant = {args.dmm_constant} A"
 
-    # ---------- plots ----------
-    plt.figure(figsize=(12, 6))
-    plt.plot(t_p, Pmech_p, label="Σ Mechanical Power τ·ω (W)")
-    plt.xlabel("Time (s)"); plt.ylabel("Power (W)")
-    plt.title("Σ Mechanical Power τ·ω (W)"); plt.legend(); plt.tight_layout()
-
-    plt.figure(figsize=(12, 6))
-    plt.plot(t_p, Pbat_p, label="P_batt (W)")
-    plt.xlabel("Time (s)"); plt.ylabel("Power (W)")
+    ax = axes[0]
+    plot_minmax(ax, t_p, Pmech_p, decimate=decimate, label="Σ Mechanical Power τ·ω (W)")
+    ax.set_xlabel("Time (s)"); ax.set_ylabel("Power (W)")
+    ax.set_title("Σ Mechanical Power τ·ω (W)"); ax.legend()
+
+    ax = axes[1]
+    plot_minmax(ax, t_p, Pbat_p, decimate=decimate, label="P_batt (W)")
+    ax.set_xlabel("Time (s)"); ax.set_ylabel("Power (W)")
     topo = "Unidirectional" if args.unidirectional else "Bidirectional"
-    plt.title(f"Battery Power vs Time ({topo})"); plt.legend(); plt.tight_layout()
+    ax.set_title(f"Battery Power vs Time ({topo})"); ax.legend()
 
-    plt.figure(figsize=(12, 6))
-    plt.plot(t_p, Ibat_p, label="I_batt_est (A)")
+    ax = axes[2]
+    plot_minmax(ax, t_p, Ibat_p, decimate=decimate, label="I_batt_est (A)")
     Iavg = np.mean(Ibat_p)
-    plt.axhline(Iavg, color="red", linestyle="--", label=f"Average = {Iavg:.3f} A")
+    ax.axhline(Iavg, color="red", linestyle="--", label=f"Average = {Iavg:.3f} A")
     if dmm_series is not None:
-        plt.plot(t_p, dmm_series, linestyle="--", label=dmm_label)
-    plt.xlabel("Time (s)"); plt.ylabel("Current (A)")
-    plt.title(
+        plot_minmax(ax, t_p, dmm_series, decimate=decimate, linestyle="--", label=dmm_label)
+    ax.set_xlabel("Time (s)"); ax.set_ylabel("Current (A)")
+    ax.set_title(
         f"Battery Current vs Time  (η_peak={args.eta_motor_peak}, τ_peak={args.tau_peak} N·m → η≈0.60@{args.tau_max} N·m)"
     )
-    plt.legend(); plt.tight_layout()
+    ax.legend()
+
+    ax = axes[3]
+    plot_minmax(ax, t_p, EWh_p, decimate=decimate, label="Energy (Wh)")
+    ax.set_xlabel("Time (s)"); ax.set_ylabel("Energy (Wh)")
+    ax.set_title("Cumulative Battery Energy vs Time"); ax.legend()
+
+
+def render(args, out_path, force=False):
+    """Headless: all four plots stacked in one PNG; False if the cached PNG is current."""
+    inputs = [args.input]
+    sync = args.sync if args.sync is not None else sync_path_for(args.input)
+    if sync is not None and Path(sync).exists():
+        inputs.append(sync)
+    params = {k: v for k, v in vars(args).items()
+              if k not in ("input", "output", "headless", "force")}
+    if not force and is_fresh(out_path, inputs, params):
+        return False
+
+    df = load_decoded(args.input)
+    t, energy_Wh = estimate(df, args)
+    fig, axes = plt.subplots(4, 1, figsize=(12, 20), sharex=True)
+    draw(axes, df, t, energy_Wh, args, decimate=True)
+    fig.tight_layout()
+    save_figure(fig, out_path, inputs, params, dpi=100)
+    plt.close(fig)
+    return True
+
 
-    plt.figure(figsize=(12, 6))
-    plt.plot(t_p, EWh_p, label="Energy (Wh)")
-    plt.xlabel("Time (s)"); plt.ylabel("Energy (Wh)")
-    plt.title("Cumulative Battery Energy vs Time"); plt.legend(); plt.tight_layout()
+def main():
+    args = build_parser().parse_args()
+
+    if args.headless:
+        headless()
+        out_path = args.output or output_for(args.input, "battery")
+        if render(args, out_path, force=args.force):
+            print(f"Saved → {out_path}")
+        else:
+            print(f"Up to date: {out_path}")
+        return
+
+    df = load_decoded(args.input)
+    t, energy_Wh = estimate(df, args)
+
+    # ---------- plots ----------
+    axes = []
+    for _ in range(4):
+        plt.figure(figsize=(12, 6))
+        axes.append(plt.gca())
+    draw(axes, df, t, energy_Wh, args)
+    for ax in axes:
+        ax.figure.tight_layout()
 
     plt.show()
 
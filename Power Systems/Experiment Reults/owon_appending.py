@@ -1,56 +1,131 @@
 #!/usr/bin/env python3
 """
-Merge two OWON logger CSVs (epoch_s, iso_time, value, raw).
+Merge any number of OWON logger CSVs (epoch_s, iso_time, value[, raw][, latency_s])
+into one time-ordered log, streaming in constant memory.
 
 - Drops any rows where epoch_s is not numeric (e.g. junk/debug lines)
-- Appends second CSV after the first
-- Preserves epoch_s and iso_time (no offset applied)
+- k-way merges the files by epoch_s (heapq), whatever order they're given in
+- Drops duplicate samples where logs overlap: a row at most --dedupe-ms
+  after the last written one (20 Hz polling leaves ~50 ms between real samples)
+- Preserves epoch_s, iso_time and the other fields exactly as logged
+- Writes gaps longer than --gap-s to <output>.gaps.json (meter restarts,
+  cable drops) so later analyses know where the current trace is missing
+
+Each input is expected to be time-ordered already (the logger appends rows
+as they arrive), and the merge keeps that order without sorting. A row that
+steps back in time is still written and counted as a backstep; the output is
+then only ordered piecewise around it.
 
 Usage:
-  python merge_owon_logs.py first.csv second.csv -o merged.csv
+  python owon_appending.py first.csv second.csv -o merged.csv
+  python owon_appending.py Experiment5/owon_log_*.csv -o exp5_owon.csv --gap-s 0.5
 """
 
 import argparse
-import pandas as pd
+import csv
+import heapq
+import json
+from pathlib import Path
+
+BASE_COLUMNS = ["epoch_s", "iso_time", "value", "raw"]
+DEDUPE_MS = 1.0
+GAP_S = 1.0
 
-def load_and_clean_owon(path):
-    """
-    Load an OWON CSV and drop any rows where epoch_s is non-numeric.
-    """
-    df = pd.read_csv(path)
 
-    if "epoch_s" not in df.columns:
+def read_header(path):
+    with Path(path).open("r", newline="") as f:
+        header = next(csv.reader(f), None)
+    if not header or "epoch_s" not in header:
         raise SystemExit(f"{path} does not contain 'epoch_s' column.")
+    return header
+
+
+def iter_owon_rows(path, columns, src, stats):
+    """(epoch_s, src, row) for each numeric-epoch row, with fields reordered to `columns`."""
+    with Path(path).open("r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        pos = [header.index(c) if c in header else None for c in columns]
+        i_epoch = header.index("epoch_s")
+        for row in reader:
+            try:
+                t = float(row[i_epoch])
+            except (IndexError, ValueError):
+                stats["junk"] += 1
+                continue
+            yield t, src, [row[p] if p is not None and p < len(row) else "" for p in pos]
+
+
+def merge_owon(inputs, output, dedupe_s=DEDUPE_MS / 1e3, gap_s=GAP_S):
+    """Stream-merge inputs into output; returns (stats, gaps)."""
+    headers = [read_header(p) for p in inputs]
+    extra = [c for h in headers for c in h if c not in BASE_COLUMNS]
+    columns = BASE_COLUMNS + list(dict.fromkeys(extra))
+
+    stats = {"rows": 0, "duplicates": 0, "junk": 0, "backsteps": 0,
+             "per_source": [0] * len(inputs)}
+    gaps = []
+    streams = [iter_owon_rows(p, columns, i, stats) for i, p in enumerate(inputs)]
+
+    last_t = last_src = None
+    with Path(output).open("w", newline="") as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(columns)
+        for t, src, row in heapq.merge(*streams, key=lambda r: (r[0], r[1])):
+            if last_t is not None:
+                dt = t - last_t
+                if dt < 0:
+                    stats["backsteps"] += 1     # written as is, see module docstring
+                elif dt <= dedupe_s:
+                    stats["duplicates"] += 1
+                    continue
+                elif dt > gap_s:
+                    gaps.append({"row": stats["rows"], "start_epoch_s": last_t, "end_epoch_s": t,
+                                 "gap_s": round(dt, 6),
+                                 "before": Path(inputs[last_src]).name,
+                                 "after": Path(inputs[src]).name})
+            writer.writerow(row)
+            stats["rows"] += 1
+            stats["per_source"][src] += 1
+            last_t, last_src = t, src
+    return stats, gaps
 
-    # Force epoch_s to numeric; bad values become NaN
-    df["epoch_s"] = pd.to_numeric(df["epoch_s"], errors="coerce")
 
-    # Drop rows with NaN epoch_s (junk/debug lines)
-    df = df[df["epoch_s"].notna()].reset_index(drop=True)
+def gaps_path_for(output):
+    output = Path(output)
+    return output.with_name(output.stem + ".gaps.json")
 
-    return df
 
 def main():
-    ap = argparse.ArgumentParser(description="Merge two OWON CSV logs.")
-    ap.add_argument("first", help="First OWON CSV file")
-    ap.add_argument("second", help="Second OWON CSV file")
+    ap = argparse.ArgumentParser(description="Merge OWON CSV logs in time order.")
+    ap.add_argument("inputs", nargs="+", help="OWON CSV files (any order)")
     ap.add_argument("-o", "--output", default="merged_owon.csv",
                     help="Output filename (default: merged_owon.csv)")
+    ap.add_argument("--dedupe-ms", type=float, default=DEDUPE_MS,
+                    help="Rows at most this long after the previous one are duplicates (default: 1 ms)")
+    ap.add_argument("--gap-s", type=float, default=GAP_S,
+                    help="Report gaps longer than this (default: 1 s)")
     args = ap.parse_args()
 
-    # Load & clean both
-    df1 = load_and_clean_owon(args.first)
-    df2 = load_and_clean_owon(args.second)
+    stats, gaps = merge_owon(args.inputs, args.output, args.dedupe_ms / 1e3, args.gap_s)
 
-    # Concatenate (optionally sort by time)
-    df_out = pd.concat([df1, df2], ignore_index=True)
+    gaps_path_for(args.output).write_text(json.dumps(
+        {"output": Path(args.output).name, "threshold_s": args.gap_s,
+         "sources": [str(p) for p in args.inputs], "gaps": gaps}, indent=1))
 
-    # If you want to ensure strict time ordering, uncomment:
-    # df_out = df_out.sort_values("epoch_s").reset_index(drop=True)
+    print(f"Saved merged OWON CSV to {args.output} ({stats['rows']} rows)")
+    for p, n in zip(args.inputs, stats["per_source"]):
+        print(f"  {n:8d} rows from {Path(p).name}")
+    print(f"Dropped {stats['duplicates']} duplicate and {stats['junk']} non-numeric rows")
+    if stats["backsteps"]:
+        print(f"[WARN] {stats['backsteps']} rows went back in time (input not time-ordered); "
+              f"kept, so the output is only piecewise ordered")
+    print(f"{len(gaps)} gap(s) > {args.gap_s:g} s → {gaps_path_for(args.output)}")
+    for g in gaps[:10]:
+        print(f"  row {g['row']}: {g['gap_s']:.2f} s  ({g['before']} → {g['after']})")
+    if len(gaps) > 10:
+        print(f"  ... {len(gaps) - 10} more")
 
-    # Save result
-    df_out.to_csv(args.output, index=False)
-    print(f"Saved merged OWON CSV to {args.output}")
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,9 @@
 import serial
 import time
 import csv
+import argparse
+import threading
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 
@@ -9,69 +12,297 @@ PORT = "COM5"            # change to your actual port
 BAUD = 115200            # default from the manual
 CMD  = "MEAS:CURR?"      # or MEAS:VOLT? / MEAS?
 SAMPLE_PERIOD = 0.05     # 50 ms between polls (~20 Hz)
-TIMEOUT = 0.1            # serial read timeout (s)   
+TIMEOUT = 0.1            # serial read timeout (s)
 # ------------------------------------------------
 
-# Create a dated log file
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_path = Path(f"owon_log_{timestamp}.csv")
-
-# Open serial port
-ser = serial.Serial(
-    port=PORT,
-    baudrate=BAUD,
-    bytesize=serial.EIGHTBITS,
-    parity=serial.PARITY_NONE,
-    stopbits=serial.STOPBITS_ONE,
-    timeout=TIMEOUT,
-    xonxoff=False,
-    rtscts=False,
-    dsrdtr=False,
-)
-ser.setDTR(True)
-ser.setRTS(True)
-ser.reset_input_buffer()
-ser.reset_output_buffer()
-
-print(f"Connected to {ser.name}")
-print(f"Logging to {log_path}")
-
-# Open CSV file for logging
-with open(log_path, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["epoch_s", "iso_time", "value", "raw"])
-
-    print("Starting capture (Ctrl+C to stop)...")
+# --- Pipelined mode (--pipelined) ---
+DEPTH = 2                # max commands in flight before a deadline is skipped
+FLUSH_INTERVAL_S = 1.0   # flush the CSV this often instead of per sample
+STATUS_INTERVAL_S = 5.0  # one console line this often instead of per sample
+
+
+def open_port(port=PORT, baud=BAUD):
+    ser = serial.Serial(
+        port=port,
+        baudrate=baud,
+        bytesize=serial.EIGHTBITS,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        timeout=TIMEOUT,
+        xonxoff=False,
+        rtscts=False,
+        dsrdtr=False,
+    )
     try:
-        next_t = time.perf_counter()
-        while True:
-            next_t += SAMPLE_PERIOD
+        ser.setDTR(True)
+        ser.setRTS(True)
+    except OSError:
+        pass  # no modem lines (e.g. serial_replay.py pty)
+    ser.reset_input_buffer()
+    ser.reset_output_buffer()
+    return ser
+
+
+def parse_value(txt):
+    try:
+        return float(txt)
+    except ValueError:
+        return None
+
+
+def log_simple(ser, writer, f):
+    """Original loop: write, flush, readline, print — one sample at a time."""
+    next_t = time.perf_counter()
+    while True:
+        next_t += SAMPLE_PERIOD
+
+        # Send command
+        ser.write((CMD + "\r\n").encode("ascii"))
+        ser.flush()
+
+        # Read response line
+        raw = ser.readline()
+        if raw:
+            txt = raw.decode("ascii", errors="replace").strip()
+            val = parse_value(txt)
+            now = time.time()
+            writer.writerow([now, datetime.fromtimestamp(now).isoformat(), val, txt])
+            f.flush()
+
+            print(f"{datetime.now().strftime('%H:%M:%S.%f')[:-3]}  {val}")
+
+        # Sleep until next sample
+        delay = next_t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# ---------- pipelined mode ----------
+def percentile(sorted_vals, p):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_vals:
+        return None
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+class PollStats:
+    """Per-sample timing collected by the pipelined poller."""
+
+    def __init__(self, period):
+        self.period = period
+        self.sent = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.missed = 0
+        self.resyncs = 0
+        self.unmatched = 0
+        self.error = None         # exception that ended the reader thread
+        self.send_lateness = []   # actual send time - scheduled deadline (s)
+        self.latency = []         # request → response (s)
+        self.reply_times = []     # perf_counter at each reply
+        self.t_start = time.perf_counter()
+
+    def summary(self):
+        dur = time.perf_counter() - self.t_start
+        lines = [f"Duration: {dur:.1f} s   sent {self.sent}   replies {self.replies}   "
+                 f"timeouts {self.timeouts}   missed deadlines {self.missed}"]
+        if self.resyncs:
+            lines.append(f"Resyncs after a timeout: {self.resyncs}   "
+                         f"replies written without latency: {self.unmatched}")
+        if dur > 0:
+            lines.append(f"Achieved rate: {self.replies / dur:.2f} Hz "
+                         f"(target {1.0 / self.period:.2f} Hz)")
+        gaps = sorted(b - a for a, b in zip(self.reply_times, self.reply_times[1:]))
+        for name, vals, scale in (("Send lateness", sorted(self.send_lateness), 1e3),
+                                  ("Latency", sorted(self.latency), 1e3),
+                                  ("Reply interval", gaps, 1e3)):
+            if not vals:
+                continue
+            p = [percentile(vals, q) * scale for q in (50, 90, 99)]
+            lines.append(f"{name:15s} ms: p50 {p[0]:7.2f}  p90 {p[1]:7.2f}  p99 {p[2]:7.2f}  "
+                         f"max {vals[-1] * scale:7.2f}")
+        if gaps:
+            jitter = sorted(abs(g - self.period) for g in gaps)
+            lines.append(f"Interval jitter ms: p50 {percentile(jitter, 50) * 1e3:7.2f}  "
+                         f"p90 {percentile(jitter, 90) * 1e3:7.2f}  "
+                         f"p99 {percentile(jitter, 99) * 1e3:7.2f}")
+        return "\n".join(lines)
+
+
+class Pipeline:
+    """
+    Send times of the requests in flight, shared by the poller and the reader.
+    Replies carry no id, so they are matched FIFO. When a request times out,
+    a late reply to it would be paired with the next request, so the pipe is
+    resynced instead: all in-flight requests are given up, and nothing is sent
+    until the line has been quiet for `drop_after` seconds. Replies that
+    arrive meanwhile are written without a latency.
+    """
+
+    def __init__(self, drop_after):
+        self.inflight = deque()
+        self.lock = threading.Lock()
+        self.drop_after = drop_after
+        self.quiet_until = 0.0
 
-            # Send command
-            ser.write((CMD + "\r\n").encode("ascii"))
-            ser.flush()
+    def try_send(self, now, depth):
+        """Reserve a slot for a request sent at `now`; False if full or resyncing."""
+        with self.lock:
+            if len(self.inflight) >= depth or now < self.quiet_until:
+                return False
+            self.inflight.append(now)
+            return True
 
-            # Read response line
+    def match(self, t_rx, got_reply, stats):
+        """Send time of the request a reply at `t_rx` answers (None if unknown)."""
+        with self.lock:
+            if self.inflight and t_rx - self.inflight[0] > self.drop_after:
+                # oldest request unanswered: give up on everything in flight
+                stats.timeouts += len(self.inflight)
+                stats.resyncs += 1
+                self.inflight.clear()
+                self.quiet_until = t_rx + self.drop_after
+            if not got_reply:
+                return None
+            if self.inflight:
+                return self.inflight.popleft()
+            # nothing in flight: a late reply from before a resync
+            self.quiet_until = max(self.quiet_until, t_rx + self.drop_after)
+            stats.unmatched += 1
+            return None
+
+
+def response_reader(ser, pipe, writer, f, stats, stop, flush_interval=FLUSH_INTERVAL_S):
+    """
+    Match reply lines to in-flight requests and write rows. This thread owns
+    the CSV file: it is the only one writing or flushing it. An exception
+    (e.g. SerialException from readline) is kept in stats.error for the poller.
+    """
+    last_flush = time.perf_counter()
+    try:
+        while not stop.is_set():
             raw = ser.readline()
+            t_rx = time.perf_counter()
+            now = time.time()
+            t_tx = pipe.match(t_rx, bool(raw), stats)
             if raw:
                 txt = raw.decode("ascii", errors="replace").strip()
-                try:
-                    val = float(txt)
-                except ValueError:
-                    val = None
-                now = time.time()
-                writer.writerow([now, datetime.fromtimestamp(now).isoformat(), val, txt])
+                latency = t_rx - t_tx if t_tx is not None else None
+                writer.writerow([now, datetime.fromtimestamp(now).isoformat(), parse_value(txt),
+                                 txt, f"{latency:.6f}" if latency is not None else ""])
+                stats.replies += 1
+                stats.reply_times.append(t_rx)
+                if latency is not None:
+                    stats.latency.append(latency)
+            if t_rx - last_flush >= flush_interval:
                 f.flush()
+                last_flush = t_rx
+    except Exception as e:
+        stats.error = e
+    finally:
+        f.flush()
+
 
-                print(f"{datetime.now().strftime('%H:%M:%S.%f')[:-3]}  {val}")
+def log_pipelined(ser, writer, f, period=SAMPLE_PERIOD, depth=DEPTH):
+    """
+    High-rate loop: commands go out on an absolute schedule from this thread
+    while a reader thread collects replies, so a slow reply doesn't push back
+    the next request. Up to `depth` commands may be in flight; a deadline that
+    finds the pipe full (or resyncing after a timeout) is skipped and counted
+    as missed. The reader thread does all writes and flushes of `f`; it has
+    stopped by the time this returns.
+    """
+    stats = PollStats(period)
+    pipe = Pipeline(drop_after=TIMEOUT + period * depth)
+    stop = threading.Event()
+    reader = threading.Thread(target=response_reader, args=(ser, pipe, writer, f, stats, stop),
+                              name="owon-reader", daemon=True)
+    reader.start()
+    cmd = (CMD + "\r\n").encode("ascii")
 
-            # Sleep until next sample
+    next_t = time.perf_counter()
+    last_status = next_t
+    try:
+        while True:
+            if not reader.is_alive():
+                # nothing is being logged any more; don't keep polling into the void
+                print(f"\n[ERROR] Reader stopped: {stats.error!r}")
+                raise stats.error or RuntimeError("owon-reader stopped")
+            now = time.perf_counter()
+            if pipe.try_send(now, depth):
+                ser.write(cmd)
+                stats.sent += 1
+                stats.send_lateness.append(now - next_t)
+            else:
+                stats.missed += 1
+
+            if now - last_status >= STATUS_INTERVAL_S:
+                rate = len([t for t in stats.reply_times[-400:] if t > now - STATUS_INTERVAL_S])
+                print(f"[STAT] {rate / STATUS_INTERVAL_S:5.1f} Hz  replies {stats.replies}  "
+                      f"missed {stats.missed}  timeouts {stats.timeouts}  resyncs {stats.resyncs}")
+                last_status = now
+
+            next_t += period
             delay = next_t - time.perf_counter()
             if delay > 0:
                 time.sleep(delay)
-
-    except KeyboardInterrupt:
-        print("\nStopped by user.")
+            else:
+                # Fell behind by whole periods: count them rather than bursting
+                behind = int(-delay // period)
+                stats.missed += behind
+                next_t += behind * period
     finally:
-        ser.close()
-        print("Serial port closed.")
+        # readline() returns within TIMEOUT, so the reader is done before f is closed
+        stop.set()
+        reader.join()
+        print("\n" + stats.summary())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Log OWON meter readings over serial.")
+    ap.add_argument("--port", default=PORT)
+    ap.add_argument("--baud", type=int, default=BAUD)
+    ap.add_argument("--pipelined", action="store_true",
+                    help="High-rate mode: pipelined polling, no per-sample print/flush, "
+                         "latency column and timing report")
+    ap.add_argument("--period", type=float, default=SAMPLE_PERIOD,
+                    help="Pipelined mode: poll period in seconds")
+    ap.add_argument("--depth", type=int, default=DEPTH,
+                    help="Pipelined mode: max commands in flight")
+    args = ap.parse_args()
+
+    # Create a dated log file
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_path = Path(f"owon_log_{timestamp}.csv")
+
+    # Open serial port
+    ser = open_port(args.port, args.baud)
+
+    print(f"Connected to {ser.name}")
+    print(f"Logging to {log_path}")
+
+    # Open CSV file for logging
+    with open(log_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        header = ["epoch_s", "iso_time", "value", "raw"]
+        if args.pipelined:
+            header.append("latency_s")
+        writer.writerow(header)
+
+        print("Starting capture (Ctrl+C to stop)...")
+        try:
+            if args.pipelined:
+                log_pipelined(ser, writer, f, args.period, args.depth)
+            else:
+                log_simple(ser, writer, f)
+
+        except KeyboardInterrupt:
+            print("\nStopped by user.")
+        finally:
+            ser.close()
+            print("Serial port closed.")
+
+
+if __name__ == "__main__":
+    main()
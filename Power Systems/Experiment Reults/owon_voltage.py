@@ -10,14 +10,26 @@ Adds:
  - Battery drain rate (W, A)
  - Horizontal lines for averages
  - Linear regression fits
+
+--headless saves the figure with the Agg backend instead of opening a window,
+with traces min/max-decimated to the pixel width of their axes (render.py).
 """
 
 import argparse
+import json
+from datetime import datetime
 from pathlib import Path
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+import stream_align
+from bms_log import load_bms
+from decode_exo_can_csv import MOTOR_ORDER
+from gait_cache import load_decoded
+from motor_model import MotorModel
+from render import headless, plot_minmax
+
 
 def parse_hhmmss(hhmmss_str: str):
     s = hhmmss_str.strip()
@@ -44,13 +56,24 @@ def main():
     ap.add_argument("current_csv", type=Path)
     ap.add_argument("--save", action="store_true")
     ap.add_argument("--output", type=Path, default=None)
+    ap.add_argument("--session", type=Path, default=None,
+                    help="session.json from acquire.py; its gait start time replaces the HHMMSS prompt")
+    ap.add_argument("--auto-align", action="store_true",
+                    help="Find the gait start by cross-correlating gait and OWON current "
+                         "(stream_align.py) instead of prompting")
+    ap.add_argument("--align-bms", action="store_true",
+                    help="Also shift the BMS clock by its cross-correlated offset to the OWON log")
+    ap.add_argument("--headless", action="store_true",
+                    help="Agg backend: save the plot (as --save) without opening a window")
     args = ap.parse_args()
+    if args.headless:
+        headless()
+        args.save = True
 
     # ----------------------- LOAD BMS -----------------------
-    bms = pd.read_csv(args.bms_csv)
-    bms.columns = [c.strip() for c in bms.columns]
-
-    if "Date & Time" not in bms.columns:
+    try:
+        bms = load_bms(args.bms_csv)     # typed columns + DateTime, cached per export
+    except ValueError:
         raise SystemExit("BMS CSV missing 'Date & Time' column")
 
     # find voltage column
@@ -62,17 +85,11 @@ def main():
     if v_col is None:
         raise SystemExit("No voltage column found in BMS CSV")
 
-    bms["DateTime"] = pd.to_datetime(
-        bms["Date & Time"].astype(str).str.strip(), errors="coerce"
-    )
-    if bms["DateTime"].isna().all():
+    if bms.empty:
         raise SystemExit("Cannot parse BMS timestamps")
 
-    # ensure naive datetimes (no timezone)
-    bms["DateTime"] = bms["DateTime"].astype("datetime64[ns]")
-
     # ----------------------- LOAD GAIT -----------------------
-    gait = pd.read_csv(args.gait_csv)
+    gait = load_decoded(args.gait_csv)
     gait.columns = [c.strip() for c in gait.columns]
 
     if "Elapsed_us" not in gait.columns:
@@ -102,16 +119,48 @@ def main():
         raise SystemExit("Current CSV missing 'value' (amps)")
 
     # ----------------------- USER INPUT TIME -----------------------
-    hhmmss_str = input("Enter start time HHMMSS: ")
-    hh, mm, ss = parse_hhmmss(hhmmss_str)
-    target_sod = hh * 3600 + mm * 60 + ss  # seconds of day
+    start = source = None
+    if args.session is not None:
+        start_epoch = json.loads(args.session.read_text()).get("gait_start_epoch_s")
+        if start_epoch is not None:
+            start, source = datetime.fromtimestamp(start_epoch), "session"
+    if start is None and args.auto_align:
+        hint = stream_align.stamp_hint(args.gait_csv, args.current_csv, cur)
+        res = stream_align.align_gait(
+            gait, cur, hint_epoch=hint,
+            max_lag=stream_align.STAMP_MAX_LAG_S if hint is not None else None)
+        print(f"Alignment: r = {res['confidence']:.3f}, peak ratio {res['peak_ratio']:.3f}")
+        if res["peak_ratio"] > 0.9:
+            print("[WARN] Gait/OWON alignment is ambiguous; check the sync window")
+        # gait_start is on the OWON iso_time clock, which sec_of_day below uses
+        start, source = datetime.fromisoformat(res["gait_start"]), "cross-correlation"
+    if args.align_bms:
+        b = stream_align.align_bms(bms, cur)
+        if b is None or b["confidence"] < stream_align.MIN_CONFIDENCE:
+            print("BMS alignment: no confident match; BMS clock left as is")
+        else:
+            bms["DateTime"] -= pd.to_timedelta(b["offset_s"], unit="s")
+            print(f"BMS clock shifted by {-b['offset_s']:+.1f} s (r = {b['confidence']:.3f})")
+    if start is not None:
+        # keep the sub-second part (SessionClock / cross-correlation resolve it)
+        hh, mm, ss = start.hour, start.minute, start.second
+        frac = start.microsecond * 1e-6
+        start_label = start.strftime("%H:%M:%S.%f")
+        print(f"Start time from {source}: {start_label}")
+    else:
+        hhmmss_str = input("Enter start time HHMMSS: ")
+        hh, mm, ss = parse_hhmmss(hhmmss_str)
+        frac = 0.0
+        start_label = f"{hh:02d}:{mm:02d}:{ss:02d}"
+    target_sod = hh * 3600 + mm * 60 + ss + frac  # seconds of day
 
-    # compute seconds-of-day for BMS and current
+    # compute seconds-of-day (with fractions) for BMS and current
     for df in (bms, cur):
         df["sec_of_day"] = (
             df["DateTime"].dt.hour * 3600
             + df["DateTime"].dt.minute * 60
             + df["DateTime"].dt.second
+            + df["DateTime"].dt.microsecond * 1e-6
         )
 
     # first BMS sample at/after requested time
@@ -122,13 +171,13 @@ def main():
     if cand_bms.empty:
         print(f"BMS log range: {bms['DateTime'].min()} → {bms['DateTime'].max()}")
         raise SystemExit(
-            f"No BMS samples at or after {hh:02d}:{mm:02d}:{ss:02d}. "
+            f"No BMS samples at or after {start_label}. "
             f"Check the time you entered against the BMS log."
         )
     if cand_cur.empty:
         print(f"Current log range: {cur['DateTime'].min()} → {cur['DateTime'].max()}")
         raise SystemExit(
-            f"No current samples at or after {hh:02d}:{mm:02d}:{ss:02d}. "
+            f"No current samples at or after {start_label}. "
             f"Check the time you entered against the current log."
         )
 
@@ -167,32 +216,14 @@ def main():
     merged["Power_W"] = merged[v_col] * merged["value"]
 
     # ----------------------- MECHANICAL ENERGY -----------------------
-    # Use per-motor mechanical speed and current, sum power across joints,
-    # and clip negative power (regeneration / resisting phases) to zero.
-    mech_cols = [c for c in gait.columns if c.endswith("_spd_mech_RPM")]
-    cur_cols  = [c for c in gait.columns if c.endswith("_current_A")]
-
-    if mech_cols and cur_cols:
-        # Extract motor names, e.g. "RightHip" from "RightHip_spd_mech_RPM"
-        motors = sorted({c.replace("_spd_mech_RPM", "") for c in mech_cols})
-
-        Kt  = 0.159   # Nm/A  (adjust if needed for your motor)
-        gear = 9.0    # gear ratio
-        eta  = 0.8    # mechanical efficiency guess
-
-        # Total mechanical power across all motors
-        P_mech_total = np.zeros(len(gait), dtype=float)
-
-        for m in motors:
-            spd_col = f"{m}_spd_mech_RPM"
-            cur_col = f"{m}_current_A"
-            if spd_col not in gait.columns or cur_col not in gait.columns:
-                continue
-
-            omega  = gait[spd_col].to_numpy(dtype=float) * (2.0 * np.pi / 60.0)  # rad/s
-            torque = gait[cur_col].to_numpy(dtype=float) * Kt * gear * eta       # Nm
+    # Per-motor τ·ω from the shared motor model (motor_model.py), summed
+    # across joints, with negative power (regeneration / resisting phases)
+    # clipped to zero.
+    motors = [m for m in MOTOR_ORDER
+              if f"{m}_spd_mech_RPM" in gait.columns and f"{m}_current_A" in gait.columns]
 
-            P_mech_total += omega * torque  # W for this motor, summed across motors
+    if motors:
+        P_mech_total = MotorModel(motors).mech_power(gait).sum(axis=0)
 
         # Only count *positive* mechanical power (assistive work)
         P_mech_total = np.maximum(P_mech_total, 0.0)
@@ -245,7 +276,7 @@ def main():
     fig, axes = plt.subplots(3, 1, figsize=(12, 14), sharex=True)
 
     # Voltage
-    axes[0].plot(bms_slice["t_rel_s"], bms_slice[v_col], label="Voltage")
+    plot_minmax(axes[0], bms_slice["t_rel_s"], bms_slice[v_col], decimate=args.headless, label="Voltage")
     axes[0].axhline(avg_voltage, color="red", linestyle="--",
                     label=f"Avg {avg_voltage:.2f} V")
     axes[0].plot(
@@ -261,7 +292,7 @@ def main():
     axes[0].grid(True)
 
     # Current
-    axes[1].plot(cur_slice["t_rel_s"], cur_slice["value"], label="Current")
+    plot_minmax(axes[1], cur_slice["t_rel_s"], cur_slice["value"], decimate=args.headless, label="Current")
     axes[1].axhline(avg_current, color="red", linestyle="--",
                     label=f"Avg {avg_current:.2f} A")
     axes[1].plot(
@@ -277,7 +308,7 @@ def main():
     axes[1].grid(True)
 
     # Power
-    axes[2].plot(merged["t_rel_s"], merged["Power_W"], label="Power")
+    plot_minmax(axes[2], merged["t_rel_s"], merged["Power_W"], decimate=args.headless, label="Power")
     axes[2].axhline(avg_power, color="red", linestyle="--",
                     label=f"Avg {avg_power:.2f} W")
     axes[2].plot(
@@ -322,7 +353,8 @@ def main():
         plt.savefig(out, dpi=100, bbox_inches="tight")
         print(f"Saved plot → {out}")
 
-    plt.show()
+    if not args.headless:
+        plt.show()
 
 
 if __name__ == "__main__":
@@ -10,6 +10,10 @@ Now generates ONE combined PNG with 10 subplots arranged as:
   [6] Hip Position    [7] Knee Position   [8] Hip Torque
   [9] Knee Torque     [10] (unused)       [11] (unused)
 
+Traces are min/max-decimated to the pixel width of their axes and drawn
+with the Agg backend (render.py), and the PNG is only redrawn when the
+decoded data or the options change (--force to redraw anyway).
+
 Usage examples:
   python plot_joint_pairs_grid.py
   python plot_joint_pairs_grid.py -i Experiment1/input_decoded.csv
@@ -20,10 +24,20 @@ Usage examples:
 from pathlib import Path
 import argparse
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # only ever saves a PNG
 import matplotlib.pyplot as plt
 
+from gait_cache import load_decoded
+from render import is_fresh, plot_minmax, save_figure
+
 DEFAULT_INPUT  = Path(__file__).parent / "Experiment1" / "gait_data_log_20251119_152238_decoded.csv"
 DEFAULT_OUTDIR = Path(__file__).parent
+DEFAULT_NAME   = "Experiment8Results.png"
+
+# === LIMIT TO A TIME WINDOW (seconds) ===
+START_T = 50.0   # change as needed
+END_T   = 150.0  # change as needed
 
 MOTOR_NAMES = {
     "hip":  ("RightHip", "LeftHip"),
@@ -76,7 +90,7 @@ def shift_series(s, n):
     return s.shift(n) if n else s
 
 
-def main():
+def build_parser():
     ap = argparse.ArgumentParser()
     ap.add_argument("-i", "--input", type=Path, default=DEFAULT_INPUT,
                     help="Path to decoded CSV (default: ./Experiment1/input_decoded.csv)")
@@ -92,13 +106,20 @@ def main():
                     help="Shift LeftHip by N samples (+N forward, -N backward)")
     ap.add_argument("--phase-knee", type=int, default=0,
                     help="Shift LeftKnee by N samples (+N forward, -N backward)")
-    args = ap.parse_args()
+    ap.add_argument("--start", type=float, default=START_T, help="Window start (s)")
+    ap.add_argument("--end", type=float, default=END_T, help="Window end (s)")
+    ap.add_argument("--name", default=DEFAULT_NAME, help="Output PNG name inside --outdir")
+    ap.add_argument("--force", action="store_true", help="Redraw even if the PNG is up to date")
+    return ap
+
 
-    df = pd.read_csv(args.input)
+def render(args, out_path, force=False):
+    """Draw the grid for args.input into out_path; False if the cached PNG is current."""
+    params = {k: v for k, v in vars(args).items() if k not in ("input", "outdir", "name", "force")}
+    if not force and is_fresh(out_path, [args.input], params):
+        return False
 
-    # === LIMIT TO A TIME WINDOW (seconds) ===
-    START_T = 50.0   # change as needed
-    END_T   = 150.0  # change as needed
+    df = load_decoded(args.input)
 
     # Build a seconds timeline from available columns
     if "Elapsed_us" in df.columns:
@@ -114,7 +135,7 @@ def main():
         t_sec = None
 
     if t_sec is not None:
-        mask = (t_sec >= START_T) & (t_sec <= END_T)
+        mask = (t_sec >= args.start) & (t_sec <= args.end)
         df = df.loc[mask].reset_index(drop=True)
 
     # ==== X-axis: prefer Elapsed_us (→ seconds), else TimeStep, else index ====
@@ -156,7 +177,6 @@ def main():
     #               BUILD ALL PLOTS INTO ONE GRID
     #            (4 rows × 3 columns = 12 subplots)
     # ================================================================
-    args.outdir.mkdir(parents=True, exist_ok=True)
     fig, axes = plt.subplots(4, 3, figsize=(24, 16))
     axes = axes.flatten()
 
@@ -189,8 +209,8 @@ def main():
                 if phase:
                     l = shift_series(l, phase)
 
-                ax.plot(x, r[idx], label=right)
-                ax.plot(x, l[idx], label=left)
+                plot_minmax(ax, x, r[idx], label=right)
+                plot_minmax(ax, x, l[idx], label=left)
                 ax.set_title(f"{group_key.capitalize()} {speed_label}")
                 ax.set_ylabel("RPM")
                 ax.set_xlabel(x_label)
@@ -209,8 +229,8 @@ def main():
         ax = axes[2 + i]  # 2: hip current, 3: knee current
 
         if rcol in df.columns and lcol in df.columns:
-            ax.plot(x, df[rcol][idx], label=right)
-            ax.plot(x, df[lcol][idx], label=left)
+            plot_minmax(ax, x, df[rcol][idx], label=right)
+            plot_minmax(ax, x, df[lcol][idx], label=left)
             ax.set_title(f"{group_key.capitalize()} Current")
             ax.set_ylabel("Current (A)")
             ax.set_xlabel(x_label)
@@ -227,8 +247,8 @@ def main():
         ax = axes[4 + i]  # 4: hip temp, 5: knee temp
 
         if rcol in df.columns and lcol in df.columns:
-            ax.plot(x, df[rcol][idx], label=right)
-            ax.plot(x, df[lcol][idx], label=left)
+            plot_minmax(ax, x, df[rcol][idx], label=right)
+            plot_minmax(ax, x, df[lcol][idx], label=left)
             ax.set_title(f"{group_key.capitalize()} Temperature")
             ax.set_ylabel("Temperature (°C)")
             ax.set_xlabel(x_label)
@@ -245,8 +265,8 @@ def main():
         ax = axes[6 + i]  # 6: hip pos, 7: knee pos
 
         if rcol in df.columns and lcol in df.columns:
-            ax.plot(x, df[rcol][idx], label=right)
-            ax.plot(x, df[lcol][idx], label=left)
+            plot_minmax(ax, x, df[rcol][idx], label=right)
+            plot_minmax(ax, x, df[lcol][idx], label=left)
             ax.set_title(f"{group_key.capitalize()} Position")
             ax.set_ylabel("Position (deg)")
             ax.set_xlabel(x_label)
@@ -265,8 +285,8 @@ def main():
         if rcur in df.columns and lcur in df.columns:
             r_tau = df[rcur] * Kt * gearRatio * motorEfficiency
             l_tau = df[lcur] * Kt * gearRatio * motorEfficiency
-            ax.plot(x_sec[idx], r_tau[idx], label=right)
-            ax.plot(x_sec[idx], l_tau[idx], label=left)
+            plot_minmax(ax, x_sec, r_tau[idx], label=right)
+            plot_minmax(ax, x_sec, l_tau[idx], label=left)
             ax.set_title(f"{group_key.capitalize()} Torque")
             ax.set_ylabel("Torque (N·m)")
             ax.set_xlabel("Time (s)")
@@ -280,10 +300,18 @@ def main():
         axes[j].axis("off")
 
     plt.tight_layout()
-    out_path = args.outdir / "Experiment8Results.png"
-    plt.savefig(out_path, dpi=75)
-    plt.close()
-    print(f"Saved combined figure: {out_path}")
+    save_figure(fig, out_path, [args.input], params, dpi=75)
+    plt.close(fig)
+    return True
+
+
+def main():
+    args = build_parser().parse_args()
+    out_path = args.outdir / args.name
+    if render(args, out_path, force=args.force):
+        print(f"Saved combined figure: {out_path}")
+    else:
+        print(f"Up to date: {out_path}")
 
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ from pathlib import Path
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from render import headless, plot_minmax
+
 def main():
     ap = argparse.ArgumentParser(description="Plot OWON CSV logs + torque estimation")
     ap.add_argument("csv", help="Path to owon_log_YYYYMMDD_HHMMSS.csv")
@@ -13,7 +15,12 @@ def main():
                     help="Optional rolling-window size (in samples) for smoothing (default: 0 = off)")
     ap.add_argument("--save", action="store_true",
                     help="Save the plot as a PNG next to the CSV")
+    ap.add_argument("--headless", action="store_true",
+                    help="Agg backend: save the PNG (as --save) without opening a window")
     args = ap.parse_args()
+    if args.headless:
+        headless()
+        args.save = True
 
     csv_path = Path(args.csv)
     if not csv_path.exists():
@@ -48,12 +55,13 @@ def main():
     # --- Plot: two stacked subplots ---
     fig, axs = plt.subplots(2, 1, sharex=True, figsize=(10, 6))
 
-    axs[0].plot(x, current, label="Current (A)")
+    # headless: traces decimated to the axes' pixel width (min/max per pixel column)
+    plot_minmax(axs[0], x, current, decimate=args.headless, label="Current (A)")
     axs[0].set_ylabel("Amperage [A]")
     axs[0].grid(True)
     axs[0].legend(loc="upper right")
 
-    axs[1].plot(x, torque, color="orange", label=f"Torque (N·m) = {Kt:.3f} × Current(A)")
+    plot_minmax(axs[1], x, torque, decimate=args.headless, color="orange", label=f"Torque (N·m) = {Kt:.3f} × Current(A)")
     axs[1].set_xlabel(x_label)
     axs[1].set_ylabel("Torque [N·m]")
     axs[1].grid(True)
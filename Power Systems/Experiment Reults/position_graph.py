@@ -17,9 +17,10 @@ X-axis uses elapsed time (converted from microseconds → seconds).
 """
 
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from gait_cache import load_decoded
+
 # === CHANGE THIS TO YOUR FILE ===
 CSV_PATH = r"Experiment2\gait_data_log_20251114_161409_decoded.csv"
 
@@ -100,7 +101,7 @@ def build_repeated_gait(target_array, t_min, t_max, gait_period, phase_shift=0.0
 
 def main():
     # Load CSV
-    df = pd.read_csv(CSV_PATH)
+    df = load_decoded(CSV_PATH)
 
     # Convert elapsed µs → seconds
     df["Elapsed_s"] = df["Elapsed_us"] / 1_000_000.0
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Multi-resolution min/max/mean pyramid of every decoded channel, for zooming
+through long sessions without touching the full CSV.
+
+Level 0 is the raw samples. Each level above it merges FACTOR (4) blocks of
+the one below it into one block and stores that block's min, max and mean.
+Levels are added until a level has at most MIN_BLOCKS (~1k) blocks. A block
+at level k covers rows [b·4^k, (b+1)·4^k).
+
+The pyramid sits next to the decoded file (X_decoded.csv →
+X_decoded.pyramid.npz) and is rebuilt when it is older than the source. The
+.npz is written uncompressed, so Pyramid opens each array as a read-only
+memmap. A query reads only the blocks inside its window. It first
+binary-searches the window [t0, t1] in the row times. Then it picks the
+finest level with at most `pixels` blocks in the window (2 pixels per block
+when drawing min and max). So a query's cost depends on the pixel budget,
+not on the length of the log.
+
+Time axis: Elapsed_us in seconds from the first row (TimeStep·dt, else the
+row number, when it is missing). It is made non-decreasing so that an ESP32
+reset cannot break the search.
+
+Usage:
+  python pyramid.py Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python pyramid.py Experiment*/*_decoded.csv --force
+  python pyramid.py decoded.csv --query RightHip_current_A --t0 300 --t1 420 --pixels 1200
+"""
+
+import argparse
+import json
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+PYRAMID_VERSION = 1
+PYRAMID_SUFFIX = ".pyramid.npz"
+FACTOR = 4
+MIN_BLOCKS = 1024
+STATS = ("min", "max", "mean")
+TIME_COLUMNS = ("Elapsed_us", "TimeStep")
+
+
+def pyramid_path_for(decoded_path):
+    return Path(decoded_path).with_suffix(PYRAMID_SUFFIX)
+
+
+def pyramid_is_fresh(decoded_path):
+    decoded_path = Path(decoded_path)
+    cache = pyramid_path_for(decoded_path)
+    if not cache.exists():
+        return False
+    if not decoded_path.exists():
+        return True
+    return cache.stat().st_mtime >= decoded_path.stat().st_mtime
+
+
+# ---------- building ----------
+def session_time(df, dt=0.04):
+    """Non-decreasing seconds from the first row."""
+    if "Elapsed_us" in df.columns:
+        t = df["Elapsed_us"].to_numpy(dtype=np.float64) * 1e-6
+    elif "TimeStep" in df.columns:
+        t = df["TimeStep"].to_numpy(dtype=np.float64) * dt
+    else:
+        t = np.arange(len(df), dtype=np.float64) * dt
+    if len(t):
+        t = np.maximum.accumulate(t - t[0])
+    return t
+
+
+def channels_of(df):
+    """Numeric, non-time columns."""
+    return [c for c in df.columns
+            if c not in TIME_COLUMNS and df[c].dtype.kind in "iufb"]
+
+
+def merge_level(lo, hi, total, count, factor=FACTOR):
+    """One channel's (min, max, sum, count) blocks merged `factor` at a time."""
+    n = len(lo)
+    blocks = -(-n // factor)
+    pad = blocks * factor - n
+
+    def fold(a, fill, reduce):
+        return reduce(np.concatenate([a, np.full(pad, fill, a.dtype)]).reshape(blocks, factor), axis=1)
+
+    return (fold(lo, np.nan, np.fmin.reduce), fold(hi, np.nan, np.fmax.reduce),
+            fold(total, 0.0, np.sum), fold(count, 0, np.sum))
+
+
+def build_pyramid(df, factor=FACTOR, min_blocks=MIN_BLOCKS):
+    """(meta, arrays) for all numeric channels of a decoded frame."""
+    t = session_time(df)
+    channels = channels_of(df)
+    rows = len(df)
+    arrays = {"t": t,
+              "L0": np.vstack([df[c].to_numpy(dtype=np.float32) for c in channels])
+              if channels else np.empty((0, rows), np.float32)}
+
+    n_levels, n = 1, rows
+    while n > min_blocks:
+        n = -(-n // factor)
+        n_levels += 1
+    for k in range(1, n_levels):
+        arrays[f"L{k}_t"] = t[::factor ** k]
+    for stat in STATS:
+        for k in range(1, n_levels):
+            arrays[f"L{k}_{stat}"] = np.empty((len(channels), len(arrays[f"L{k}_t"])), np.float32)
+
+    # one channel at a time keeps the float64 sums to a few row-length arrays
+    for ci in range(len(channels)):
+        v = arrays["L0"][ci].astype(np.float64)
+        ok = ~np.isnan(v)
+        lo, hi, total, count = v, v, np.where(ok, v, 0.0), ok.astype(np.int64)
+        for k in range(1, n_levels):
+            lo, hi, total, count = merge_level(lo, hi, total, count, factor)
+            arrays[f"L{k}_min"][ci] = lo
+            arrays[f"L{k}_max"][ci] = hi
+            with np.errstate(invalid="ignore", divide="ignore"):
+                arrays[f"L{k}_mean"][ci] = total / count
+
+    meta = {"version": PYRAMID_VERSION, "rows": rows, "factor": factor, "levels": n_levels,
+            "channels": channels}
+    return meta, arrays
+
+
+def write_pyramid(path, meta, arrays, source=None):
+    meta = dict(meta, source=str(source) if source else "")
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    with tmp.open("wb") as f:
+        # uncompressed, so Pyramid can memmap the members
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    tmp.replace(path)
+    return path
+
+
+# ---------- reading ----------
+def _npz_memmaps(path):
+    """{name: read-only memmap} for the members of an uncompressed .npz."""
+    out = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed")
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), "<u2")
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+            major, _ = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if major == 1
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran, dtype = read_header(f)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if dtype.hasobject:
+                raise ValueError(f"{path}: {name} holds Python objects")
+            if not shape:   # scalars (meta) are read, not mapped
+                out[name] = np.frombuffer(f.read(dtype.itemsize), dtype).reshape(())
+                continue
+            if 0 in shape:
+                out[name] = np.zeros(shape, dtype)
+                continue
+            out[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                  order="F" if fortran else "C")
+    return out
+
+
+class Pyramid:
+    """Memmapped pyramid with window / pixel-budget queries."""
+
+    def __init__(self, meta, arrays, path=None):
+        self.path = Path(path) if path else None
+        self._arrays = arrays
+        self.rows = meta["rows"]
+        self.factor = meta["factor"]
+        self.levels = meta["levels"]
+        self.channels = list(meta["channels"])
+        self._col = {c: i for i, c in enumerate(self.channels)}
+        self.t = self._arrays["t"]
+        # block start times per level, finest first (level 0 = every row)
+        self._times = [self.t] + [self._arrays[f"L{k}_t"] for k in range(1, self.levels)]
+
+    @classmethod
+    def open(cls, path):
+        arrays = _npz_memmaps(path)
+        meta = json.loads(str(np.asarray(arrays.pop("meta"))[()]))
+        if meta.get("version") != PYRAMID_VERSION:
+            raise ValueError(f"{path}: unsupported pyramid version {meta.get('version')}")
+        return cls(meta, arrays, path)
+
+    @property
+    def t_range(self):
+        return (float(self.t[0]), float(self.t[-1])) if self.rows else (0.0, 0.0)
+
+    def _search(self, v, side):
+        """np.searchsorted(self.t, v, side), narrowed level by level from the top.
+
+        Each step copies at most factor + 1 times, so the memmapped row times
+        (not necessarily aligned inside the .npz) are never scanned whole.
+        """
+        lo, hi = 0, len(self._times[-1])
+        for k in range(self.levels - 1, -1, -1):
+            j = lo + int(np.searchsorted(np.array(self._times[k][lo:hi]), v, side=side))
+            if k == 0:
+                return j
+            # block j-1 starts before v, block j at/after it
+            lo = max(j - 1, 0) * self.factor
+            hi = min(j * self.factor + 1, len(self._times[k - 1]))
+        return 0
+
+    def rows_in(self, t0=None, t1=None):
+        """Row range [i0, i1) with t0 <= t <= t1."""
+        i0 = 0 if t0 is None else self._search(t0, "left")
+        i1 = self.rows if t1 is None else self._search(t1, "right")
+        return i0, max(i0, i1)
+
+    def level_for(self, n_rows, pixels):
+        """Finest level with at most `pixels` blocks over n_rows rows."""
+        pixels = max(1, int(pixels))
+        k = 0
+        while k < self.levels - 1 and -(-n_rows // self.factor ** k) > pixels:
+            k += 1
+        return k
+
+    def query(self, channel, t0=None, t1=None, pixels=1000):
+        """
+        {"level", "t", "min", "max", "mean"} for one channel over [t0, t1], at
+        most ~`pixels` points (more only when even the top level is finer).
+        t is each block's first sample time; at level 0 min/max/mean are the samples.
+        """
+        ci = self._col[channel]
+        i0, i1 = self.rows_in(t0, t1)
+        k = self.level_for(i1 - i0, pixels)
+        if k == 0:
+            v = np.array(self._arrays["L0"][ci, i0:i1])
+            return {"level": 0, "t": np.array(self.t[i0:i1]), "min": v, "max": v, "mean": v}
+        size = self.factor ** k
+        b0, b1 = i0 // size, -(-i1 // size)
+        out = {"level": k, "t": np.array(self._arrays[f"L{k}_t"][b0:b1])}
+        for stat in STATS:
+            out[stat] = np.array(self._arrays[f"L{k}_{stat}"][ci, b0:b1])
+        return out
+
+
+def load_pyramid(decoded_path, df=None, use_cache=True, write=True):
+    """Pyramid for a decoded session, rebuilt (from df or the file) when stale."""
+    decoded_path = Path(decoded_path)
+    cache = pyramid_path_for(decoded_path)
+    if use_cache and pyramid_is_fresh(decoded_path):
+        try:
+            p = Pyramid.open(cache)
+            if df is None or p.rows == len(df):
+                return p
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable/old pyramid → rebuild
+    if df is None:
+        from gait_cache import load_decoded
+        df = load_decoded(decoded_path)
+    meta, arrays = build_pyramid(df)
+    if use_cache and write:
+        try:
+            write_pyramid(cache, meta, arrays, source=decoded_path.name)
+            return Pyramid.open(cache)
+        except OSError:
+            pass  # read-only location; use the in-memory pyramid
+    return Pyramid(meta, arrays)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / query min-max-mean pyramids of decoded sessions.")
+    ap.add_argument("decoded", type=Path, nargs="+", help="Decoded gait CSV(s) (or their .npz caches)")
+    ap.add_argument("--force", action="store_true", help="Rebuild even if the pyramid is fresh")
+    ap.add_argument("--query", default=None, help="Channel to query, e.g. RightHip_current_A")
+    ap.add_argument("--t0", type=float, default=None, help="Window start (s from first row)")
+    ap.add_argument("--t1", type=float, default=None, help="Window end (s)")
+    ap.add_argument("--pixels", type=int, default=1000, help="Point budget of the query")
+    args = ap.parse_args()
+
+    for p in args.decoded:
+        t0 = time.perf_counter()
+        fresh = pyramid_is_fresh(p) and not args.force
+        if not fresh:
+            from gait_cache import load_decoded
+            meta, arrays = build_pyramid(load_decoded(p))
+            write_pyramid(pyramid_path_for(p), meta, arrays, source=Path(p).name)
+        pyr = Pyramid.open(pyramid_path_for(p))
+        dt = time.perf_counter() - t0
+        print(f"{'Up to date' if fresh else 'Wrote'}: {pyr.path}  ({pyr.rows} rows, "
+              f"{len(pyr.channels)} channels, {pyr.levels} levels, {dt:.2f} s)")
+        if args.query:
+            t0 = time.perf_counter()
+            q = pyr.query(args.query, args.t0, args.t1, args.pixels)
+            dt = time.perf_counter() - t0
+            lo, hi = pyr.t_range
+            print(f"  {args.query} [{args.t0 if args.t0 is not None else lo:.1f}, "
+                  f"{args.t1 if args.t1 is not None else hi:.1f}] s: level {q['level']} "
+                  f"({pyr.factor ** q['level']} rows/point), {len(q['t'])} points, "
+                  f"min {np.nanmin(q['min']) if len(q['t']) else np.nan:.3f}, "
+                  f"max {np.nanmax(q['max']) if len(q['t']) else np.nan:.3f} in {dt * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Headless figure rendering: Agg backend, min/max decimation to the axes'
+pixel width, a per-figure cache, and a parallel batch renderer.
+
+Decimation: a trace of n samples drawn into an axes w pixels wide is cut
+into w equal-count buckets and each bucket keeps its min and max sample, in
+time order (2·w points). The drawn envelope is the same as plotting every
+sample - single-sample spikes (faults, current peaks) survive - but
+matplotlib only strokes a few thousand points. It is only right for a saved
+image: in a window, zooming in would show the envelope of the full view, so
+interactive plots pass decimate=False and draw every sample.
+
+Cache: every saved PNG gets a sidecar <name>.png.render.json holding the
+size/mtime and SHA-1 of its input files plus the render parameters. A figure
+is redrawn only when a parameter or the input data changes; a file that was
+touched but whose content hash is the same is not redrawn.
+
+Batch mode renders the plot_params.py grid over the whole session
+(<stem>_params.png) and the net_bat_power.py figures (<stem>_battery.png)
+for every decoded session, one ProcessPoolExecutor task per figure.
+
+Usage:
+  python render.py                                  # Experiment*/ *_decoded.csv
+  python render.py Experiment5 Experiment8 -j 4
+  python render.py --kind battery --force
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+HERE = Path(__file__).resolve().parent
+RENDER_VERSION = 1
+SIDECAR_SUFFIX = ".render.json"
+KINDS = ("params", "battery")
+
+
+def headless():
+    """Draw with Agg (no windows); safe after importing pyplot while no figure is open."""
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+
+# ---------- decimation ----------
+def minmax_decimate(x, y, buckets):
+    """(x, y) reduced to the min and max sample of each of `buckets` equal-count buckets."""
+    x, y = np.asarray(x), np.asarray(y, dtype=float)
+    n = len(y)
+    if buckets < 1 or n <= 2 * buckets:
+        return x, y
+    width = -(-n // buckets)
+    buckets = -(-n // width)
+    pad = buckets * width - n
+    lo_src = np.concatenate([np.where(np.isnan(y), np.inf, y), np.full(pad, np.inf)])
+    hi_src = np.concatenate([np.where(np.isnan(y), -np.inf, y), np.full(pad, -np.inf)])
+    base = np.arange(buckets) * width
+    i_lo = base + lo_src.reshape(buckets, width).argmin(axis=1)
+    i_hi = base + hi_src.reshape(buckets, width).argmax(axis=1)
+    # keep each bucket's pair in time order so the line doesn't double back
+    keep = np.column_stack([np.minimum(i_lo, i_hi), np.maximum(i_lo, i_hi)]).ravel()
+    return x[keep], y[keep]
+
+
+def axes_pixels(ax):
+    """Width of the axes in device pixels."""
+    fig = ax.figure
+    return max(1, int(round(ax.get_position().width * fig.get_figwidth() * fig.dpi)))
+
+
+def plot_minmax(ax, x, y, *fmt, px=None, decimate=True, **kwargs):
+    """ax.plot() of the min/max-decimated trace (px defaults to the axes width)."""
+    if not decimate:
+        return ax.plot(x, y, *fmt, **kwargs)
+    xd, yd = minmax_decimate(x, y, px or axes_pixels(ax))
+    return ax.plot(xd, yd, *fmt, **kwargs)
+
+
+# ---------- figure cache ----------
+def sidecar_for(out):
+    out = Path(out)
+    return out.with_name(out.name + SIDECAR_SUFFIX)
+
+
+def _sig(path):
+    st = Path(path).stat()
+    return {"path": str(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def data_hash(inputs):
+    """SHA-1 over the bytes of all input files, in order."""
+    h = hashlib.sha1()
+    for p in inputs:
+        with Path(p).open("rb") as f:
+            for buf in iter(lambda: f.read(1 << 20), b""):
+                h.update(buf)
+    return h.hexdigest()
+
+
+def _params(params):
+    return json.loads(json.dumps(params or {}, sort_keys=True, default=str))
+
+
+def is_fresh(out, inputs, params=None):
+    """True if `out` was rendered from these inputs (same content) with these params."""
+    out, side = Path(out), sidecar_for(out)
+    if not out.exists() or not side.exists():
+        return False
+    try:
+        meta = json.loads(side.read_text())
+    except ValueError:
+        return False
+    if meta.get("version") != RENDER_VERSION or meta.get("params") != _params(params):
+        return False
+    try:
+        sigs = [_sig(p) for p in inputs]
+    except OSError:
+        return False
+    if sigs == meta.get("inputs"):
+        return True
+    if [s["size"] for s in sigs] != [s["size"] for s in meta.get("inputs", [])]:
+        return False
+    return data_hash(inputs) == meta.get("hash")
+
+
+def save_figure(fig, out, inputs=(), params=None, **savefig_kw):
+    """fig.savefig(out) (atomically) and record the inputs/params it was drawn from."""
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.stem + ".tmp" + out.suffix)
+    fig.savefig(tmp, **savefig_kw)
+    tmp.replace(out)
+    meta = {"version": RENDER_VERSION, "params": _params(params),
+            "inputs": [_sig(p) for p in inputs], "hash": data_hash(inputs)}
+    sidecar_for(out).write_text(json.dumps(meta, indent=1))
+    return out
+
+
+# ---------- batch ----------
+def find_sessions(roots):
+    found = set()
+    for root in roots:
+        root = Path(root)
+        cands = [root] if root.is_file() else root.rglob("*_decoded.csv")
+        found.update(p.resolve() for p in cands if p.name.endswith("_decoded.csv"))
+    return sorted(found)
+
+
+def output_for(decoded_csv, kind, outdir=None):
+    decoded_csv = Path(decoded_csv)
+    stem = decoded_csv.stem[:-len("_decoded")] if decoded_csv.stem.endswith("_decoded") else decoded_csv.stem
+    return (Path(outdir) if outdir else decoded_csv.parent) / f"{stem}_{kind}.png"
+
+
+def render_job(kind, decoded_csv, out, force=False):
+    """Render one figure in a worker; returns ("cached" | "rendered", seconds)."""
+    headless()
+    t = time.perf_counter()
+    argv = ["-i", str(decoded_csv)]
+    if kind == "params":
+        import plot_params as mod
+        argv += ["--start=-inf", "--end=inf"]   # whole session, not the 50-150 s default
+    else:
+        import net_bat_power as mod
+    args = mod.build_parser().parse_args(argv)
+    drawn = mod.render(args, out, force=force)
+    return ("rendered" if drawn else "cached"), time.perf_counter() - t
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Render session figures headlessly, in parallel, with a cache.")
+    ap.add_argument("roots", nargs="*", type=Path,
+                    help="Folders or decoded CSVs (default: Experiment*/)")
+    ap.add_argument("--kind", choices=KINDS + ("all",), default="all")
+    ap.add_argument("-o", "--outdir", type=Path, default=None,
+                    help="Where to write PNGs (default: next to each session)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--force", action="store_true", help="Re-render even if cached")
+    args = ap.parse_args()
+
+    sessions = find_sessions(args.roots or sorted(p for p in HERE.glob("Experiment*") if p.is_dir()))
+    kinds = KINDS if args.kind == "all" else (args.kind,)
+    jobs = [(k, s, output_for(s, k, args.outdir)) for s in sessions for k in kinds]
+    if not jobs:
+        print("No decoded sessions found.")
+        return
+
+    t0 = time.perf_counter()
+    counts = {"rendered": 0, "cached": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(render_job, k, s, out, args.force): out for k, s, out in jobs}
+        for fut in as_completed(futures):
+            out = futures[fut]
+            try:
+                status, dt = fut.result()
+            except Exception as e:  # one bad session shouldn't stop the batch
+                counts["failed"] += 1
+                print(f"  FAILED: {out.name}: {e}")
+                continue
+            counts[status] += 1
+            print(f"  {status}: {out.name} ({dt:.1f} s)")
+    print(f"{len(jobs)} figure(s): {counts['rendered']} rendered, {counts['cached']} cached, "
+          f"{counts['failed']} failed in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
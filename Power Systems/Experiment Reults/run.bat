@@ -3,6 +3,7 @@ REM ==========================================================
 REM launch_scripts_parallel.bat
 REM Runs serial_in.py and owon_logger.py at the same time
 REM Each opens in its own Command Prompt window and closes when stopped
+REM On Linux, use acquire.py instead: one process, one clock, one session folder
 REM ==========================================================
 
 REM Change directory to where this batch file is located
@@ -2,11 +2,22 @@ import serial
 import time
 import csv
 import os
+import argparse
+import queue
+import threading
 
 # --- Configuration ---
 COM_PORT = 'COM3'                     # Change to your ESP32 port
 BAUD_RATE = 921600                    # Must match Serial.begin() baud
 OUTPUT_FILENAME = 'gait_data_log_' + time.strftime("%Y%m%d_%H%M%S") + '.csv'
+SYNC_PERIOD_S = 1.0                   # gait_sync_*.csv: one host↔Elapsed_us pair per period (s)
+
+# --- Threaded mode (--threaded) ---
+FLUSH_INTERVAL_S = 1.0                # flush the CSV at least this often
+FLUSH_BYTES = 64 * 1024               # ...or once this much text is batched
+RING_CHUNKS = 4096                    # reader → writer queue depth (read() chunks)
+STATUS_INTERVAL_S = 5.0               # print throughput counters this often
+POLE_PAIRS = 21                       # for *_spd_mech_RPM in live-decoded output
 
 def looks_like_data(fields):
     if len(fields) < 4:
@@ -53,85 +64,169 @@ def infer_header_for_width(ncols):
                make_byte_labels("LK", 8) + make_byte_labels("LH", 8)
     return None
 
-def log_serial_data():
+class GaitLineHandler:
+    """
+    Turns decoded text lines from the ESP32 into CSV rows: skips startup
+    chatter, expands/infers the header and warns once on width mismatches.
+    Shared by the simple and threaded loggers.
+    """
+
+    def __init__(self):
+        self.header_written = False
+        self.expected_cols = None
+        self.warned_once = False
+        self.malformed = 0
+
+    def handle(self, line):
+        """Return a list of rows to write for this line (possibly empty)."""
+        line = line.strip()
+        if not line:
+            return []
+
+        # Skip startup chatter
+        if "Multi-joint gait tracking started" in line:
+            return []
+
+        fields = [f.strip() for f in line.split(',') if f != ""]
+
+        # Accept explicit header (compact or expanded) only if it starts with TimeStep
+        if not self.header_written and fields and fields[0].lower() == "timestep":
+            # If compact tokens like RH[8] are present, expand them to 32 columns
+            if any(tok.endswith("[8]") for tok in fields):
+                expanded = expand_compact_header(fields)
+                print(f"[HEADER] (expanded) {','.join(expanded)}")
+                fields = expanded
+            else:
+                print(f"[HEADER] {line}")
+            self.expected_cols = len(fields)
+            self.header_written = True
+            return [fields]
+
+        rows = []
+        # If no header yet, infer one from the first numeric row
+        if not self.header_written:
+            if not looks_like_data(fields):
+                # Not a header, not data → skip
+                return []
+            inferred = infer_header_for_width(len(fields))
+            if not inferred:
+                # Unexpected width; wait for a proper row/header
+                return []
+            rows.append(inferred)
+            self.header_written = True
+            self.expected_cols = len(inferred)
+            print(f"[HEADER] (inferred) {','.join(inferred)}")
+            # fall through to write this row below
+
+        # Now we have a header; write rows and only warn once if width mismatches
+        if self.expected_cols is not None and len(fields) != self.expected_cols:
+            self.malformed += 1
+            if not self.warned_once:
+                print(f"[WARN] Column count {len(fields)} != expected {self.expected_cols}. "
+                      f"Suppressing further warnings.")
+                self.warned_once = True
+            # Still write the row to avoid data loss
+        rows.append(fields)
+        return rows
+
+def sync_filename(output_filename):
+    """gait_data_log_<stamp>.csv → gait_sync_<stamp>.csv (read by clock_sync.py)."""
+    head, name = os.path.split(output_filename)
+    return os.path.join(head, name.replace('gait_data_log_', 'gait_sync_', 1))
+
+class SyncRecorder:
+    """
+    Host-time ↔ Elapsed_us pairs for the clock-drift model (clock_sync.py).
+    Of the rows offered during each period, only the one with the smallest
+    host - Elapsed offset is written: it waited least in USB/OS buffers.
+    host_mono is absolute time.monotonic(). start_epoch is the offset of the
+    first written pair, i.e. the host time at Elapsed_us = 0.
+    """
+    HEADER = ["host_epoch_s", "host_mono_s", "TimeStep", "Elapsed_us"]
+
+    def __init__(self, writerows, period=SYNC_PERIOD_S, flush=None):
+        self.writerows = writerows
+        self.period = period
+        self.flush = flush
+        self.best = None
+        self.t_next = None
+        self.pairs = 0
+        self.start_epoch = None
+
+    def offer(self, host_epoch, host_mono, row):
+        try:
+            ts, elapsed = int(row[0]), int(row[1])
+        except (ValueError, IndexError):
+            return
+        key = host_epoch - elapsed * 1e-6
+        if self.best is None or key < self.best[0]:
+            self.best = (key, host_epoch, host_mono, ts, elapsed)
+        if self.t_next is None:
+            self.t_next = host_mono + self.period
+        if host_mono >= self.t_next:
+            self._write()
+            self.t_next = max(self.t_next + self.period, host_mono)
+
+    def _write(self):
+        if self.best is None:
+            return
+        key, host_epoch, host_mono, ts, elapsed = self.best
+        if self.start_epoch is None:
+            self.start_epoch = key
+        self.writerows([[f"{host_epoch:.6f}", f"{host_mono:.6f}", ts, elapsed]])
+        self.best = None
+        self.pairs += 1
+        if self.flush:
+            self.flush()
+
+    def close(self):
+        self._write()
+
+def open_sync_file(output_filename, period):
+    """(file, SyncRecorder) for the gait log, or (None, None) when period < 0."""
+    if period is None or period < 0:
+        return None, None
+    f = open(sync_filename(output_filename), 'w', newline='', encoding='utf-8')
+    writer = csv.writer(f)
+    writer.writerow(SyncRecorder.HEADER)
+    return f, SyncRecorder(writer.writerows, period, f.flush)
+
+def open_port():
+    ser = serial.Serial(COM_PORT, BAUD_RATE, timeout=1)
+    time.sleep(2)  # Allow ESP32 boot
+    print(f"Connected to {COM_PORT} at {BAUD_RATE} baud.\nPress Ctrl+C to stop.\n")
+
+    dir_name = os.path.dirname(OUTPUT_FILENAME)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    return ser
+
+def log_serial_data(sync_period=SYNC_PERIOD_S):
     print(f"Starting serial logger...\nSaving to: {OUTPUT_FILENAME}")
-    
-    try:
-        ser = serial.Serial(COM_PORT, BAUD_RATE, timeout=1)
-        time.sleep(2)  # Allow ESP32 boot
-        print(f"Connected to {COM_PORT} at {BAUD_RATE} baud.\nPress Ctrl+C to stop.\n")
+    sync_f = None
 
-        dir_name = os.path.dirname(OUTPUT_FILENAME)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
+    try:
+        ser = open_port()
+        sync_f, sync = open_sync_file(OUTPUT_FILENAME, sync_period)
 
         with open(OUTPUT_FILENAME, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            header_written = False
-            expected_cols = None
-            warned_once = False
+            handler = GaitLineHandler()
 
             while True:
                 raw = ser.readline()
                 if not raw:
                     continue
+                t_epoch, t_mono = time.time(), time.monotonic()
 
-                line = raw.decode(errors='ignore').strip()
-                if not line:
+                line = raw.decode(errors='ignore')
+                rows = handler.handle(line)
+                if not rows:
                     continue
-
-                # Skip startup chatter
-                if "Multi-joint gait tracking started" in line:
-                    continue
-
-                fields = [f.strip() for f in line.split(',') if f != ""]
-
-                # Accept explicit header (compact or expanded) only if it starts with TimeStep
-                if not header_written and fields and fields[0].lower() == "timestep":
-                    # If compact tokens like RH[8] are present, expand them to 32 columns
-                    if any(tok.endswith("[8]") for tok in fields):
-                        expanded = expand_compact_header(fields)
-                        writer.writerow(expanded)
-                        expected_cols = len(expanded)
-                        print(f"[HEADER] (expanded) {','.join(expanded)}")
-                    else:
-                        writer.writerow(fields)
-                        expected_cols = len(fields)
-                        print(f"[HEADER] {line}")
-                    csvfile.flush()
-                    header_written = True
-                    continue
-
-                # If no header yet, infer one from the first numeric row
-                if not header_written:
-                    if looks_like_data(fields):
-                        inferred = infer_header_for_width(len(fields))
-                        if inferred:
-                            writer.writerow(inferred)
-                            csvfile.flush()
-                            header_written = True
-                            expected_cols = len(inferred)
-                            print(f"[HEADER] (inferred) {','.join(inferred)}")
-                            # fall through to write this row below
-                        else:
-                            # Unexpected width; wait for a proper row/header
-                            continue
-                    else:
-                        # Not a header, not data → skip
-                        continue
-
-                # Now we have a header; write rows and only warn once if width mismatches
-                if expected_cols is not None and len(fields) != expected_cols:
-                    if not warned_once:
-                        print(f"[WARN] Column count {len(fields)} != expected {expected_cols}. "
-                              f"Suppressing further warnings.")
-                        warned_once = True
-                    # Still write the row to avoid data loss
-                    writer.writerow(fields)
-                else:
-                    writer.writerow(fields)
-
+                writer.writerows(rows)
                 csvfile.flush()
+                if sync and handler.expected_cols == 36:
+                    sync.offer(t_epoch, t_mono, rows[-1])
                 # Optional: comment out to reduce console spam
                 # print(f"[LOG] {line}")
 
@@ -146,7 +241,300 @@ def log_serial_data():
         if 'ser' in locals() and ser.is_open:
             ser.close()
             print("Serial connection closed.")
+        if sync_f:
+            sync.close()
+            sync_f.close()
+            print(f"Clock sync pairs: {sync.pairs} → {sync_filename(OUTPUT_FILENAME)}")
+        print(f"Data saved to {OUTPUT_FILENAME}")
+
+# ---------- threaded mode ----------
+class LoggerStats:
+    """Counters shared by the reader/writer threads (simple ints; GIL-safe)."""
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.lines = 0
+        self.rows_written = 0
+        self.dropped_bytes = 0
+        self.malformed = 0
+        self.flushes = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        # live decode (--decode)
+        self.decoding = False
+        self.rows_decoded = 0
+        self.decode_backlog = 0       # batches written but not yet decoded
+        self.decode_lag_s = 0.0
+        self.latest = ""
+        self.error = None             # first exception that ended a worker thread
+
+    def report(self, prev, dt):
+        """One status line with rates since the previous snapshot."""
+        bps = (self.bytes_in - prev[0]) / dt if dt > 0 else 0.0
+        lps = (self.lines - prev[1]) / dt if dt > 0 else 0.0
+        msg = (f"[STAT] {bps / 1024:7.1f} KiB/s  {lps:7.1f} lines/s  "
+               f"queue {self.queue_depth}/{self.max_queue_depth}  "
+               f"rows {self.rows_written}  dropped {self.dropped_bytes} B  "
+               f"malformed {self.malformed}")
+        if self.decoding:
+            msg += (f"\n[DECODE] decoded {self.rows_decoded}  lag {self.decode_lag_s:.2f} s  "
+                    f"backlog {self.decode_backlog}  {self.latest}")
+        return msg
+
+def stop_on_error(target, stats, stop):
+    """Thread body for target that records its exception and stops the logger."""
+    def run(*args):
+        try:
+            target(*args)
+        except Exception as e:
+            if stats.error is None:
+                stats.error = e
+            print(f"\n[ERROR] {threading.current_thread().name} failed: {e!r}")
+            stop.set()
+    return run
+
+def serial_reader(ser, ring, stats, stop):
+    """Producer: only pulls (epoch, monotonic, bytes) chunks off the port into the ring buffer."""
+    while not stop.is_set():
+        try:
+            data = ser.read(ser.in_waiting or 1)
+        except serial.SerialException as e:
+            print(f"\n[ERROR] Serial read failed: {e}")
+            stop.set()
+            break
+        if not data:
+            continue
+        stats.bytes_in += len(data)
+        try:
+            ring.put_nowait((time.time(), time.monotonic(), data))
+        except queue.Full:
+            # Never block the port; the writer sees a broken line and counts it
+            stats.dropped_bytes += len(data)
+        stats.queue_depth = ring.qsize()
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+def batch_writer(ring, csvfile, handler, stats, stop, flush_interval, flush_bytes, decode_q=None,
+                 sync=None):
+    """
+    Consumer: splits lines and writes them in batches, flushing on time or size.
+    If decode_q is given, each written batch is also queued for the live
+    decoder. The queue is unbounded, so a slow decoder falls behind and
+    catches up later but never misses rows or blocks the writer.
+    If sync is given, the last row completed by each read is offered to it
+    with that read's host time.
+    """
+    writer = csv.writer(csvfile)
+    pending = bytearray()
+    batch = []
+    batch_bytes = 0
+    last_flush = time.monotonic()
+
+    def emit(rows):
+        writer.writerows(rows)
+        stats.rows_written += len(rows)
+        if decode_q is not None and rows:
+            decode_q.put((time.monotonic(), rows))
+            stats.decode_backlog = decode_q.qsize()
+
+    try:
+        while True:
+            try:
+                t_epoch, t_mono, data = ring.get(timeout=0.05)
+            except queue.Empty:
+                data = None
+                if stop.is_set():
+                    break
+            if data:
+                pending += data
+                stats.queue_depth = ring.qsize()
+                *lines, rest = pending.split(b"\n")
+                pending = bytearray(rest)
+                n_before = len(batch)
+                for raw in lines:
+                    stats.lines += 1
+                    batch.extend(handler.handle(raw.decode(errors='ignore')))
+                    batch_bytes += len(raw) + 1
+                stats.malformed = handler.malformed
+                if sync and len(batch) > n_before and handler.expected_cols == 36:
+                    sync.offer(t_epoch, t_mono, batch[-1])
+
+            now = time.monotonic()
+            if batch and (batch_bytes >= flush_bytes or now - last_flush >= flush_interval):
+                emit(batch)
+                batch, batch_bytes = [], 0
+            if now - last_flush >= flush_interval:
+                csvfile.flush()
+                stats.flushes += 1
+                last_flush = now
+
+        # Drain: trailing partial line and anything still batched
+        if pending.strip():
+            stats.lines += 1
+            batch.extend(handler.handle(pending.decode(errors='ignore')))
+        emit(batch)
+        stats.malformed = handler.malformed
+        csvfile.flush()
+    finally:
+        if decode_q is not None:
+            decode_q.put(None)  # end of stream for the live decoder, also after a write error
+
+def live_decoder(decode_q, stats, decode_to, pole_pairs, flush_interval):
+    """
+    Decode written raw rows with the batch decoder and write them as a
+    decoded CSV and/or binary frame store next to the raw log. Runs in its own
+    thread off the writer's queue, so it can fall behind but never stalls reads;
+    every written row is decoded, at the latest when the logger stops.
+    """
+    # Imported here so the plain logger doesn't need numpy
+    from decode_exo_can_csv import (MOTOR_ORDER, decode_payload, decoded_header,
+                                    iter_raw_chunks, write_decoded_chunk)
+    import can_frame_store
+
+    stem = os.path.splitext(OUTPUT_FILENAME)[0]
+    csv_out = bin_out = None
+    if decode_to in ("csv", "both"):
+        csv_out = open(stem + "_decoded.csv", 'w', newline='', encoding='utf-8')
+        csv.writer(csv_out).writerow(decoded_header(pole_pairs))
+        print(f"Live-decoding to: {csv_out.name}")
+    if decode_to in ("bin", "both"):
+        bin_out = open(stem + ".bin", 'wb')
+        can_frame_store.write_header(bin_out, has_elapsed=True)
+        print(f"Live-decoding to: {bin_out.name}")
+
+    last_flush = time.monotonic()
+    try:
+        while True:
+            item = decode_q.get()
+            stats.decode_backlog = decode_q.qsize()
+            if item is None:
+                break
+            t_in, rows = item
+            lines = [",".join(r) for r in rows]
+            for meta, payload in iter_raw_chunks(lines):
+                if not len(meta):
+                    continue
+                if csv_out:
+                    write_decoded_chunk(csv_out, meta, payload, pole_pairs)
+                if bin_out:
+                    can_frame_store.append_records(bin_out, meta, payload)
+                stats.rows_decoded += len(meta)
+                last = decode_payload(payload[-1:], pole_pairs)
+                stats.latest = "  ".join(
+                    f"{m}: {last[f'{m}_current_A'][0]:.2f} A {last[f'{m}_temp_C'][0]} C "
+                    f"{last[f'{m}_err_text'][0]}" for m in MOTOR_ORDER)
+            stats.decode_lag_s = time.monotonic() - t_in
+
+            now = time.monotonic()
+            if now - last_flush >= flush_interval:
+                for f in (csv_out, bin_out):
+                    if f:
+                        f.flush()
+                last_flush = now
+    finally:
+        for f in (csv_out, bin_out):
+            if f:
+                f.close()
+
+def log_serial_data_threaded(flush_interval=FLUSH_INTERVAL_S, flush_bytes=FLUSH_BYTES,
+                             ring_chunks=RING_CHUNKS, status_interval=STATUS_INTERVAL_S,
+                             decode_to=None, pole_pairs=POLE_PAIRS, sync_period=SYNC_PERIOD_S):
+    """
+    Producer/consumer logger: a reader thread only moves bytes from the port
+    into a bounded ring buffer; a writer thread splits lines and writes CSV
+    rows in batches, so file I/O never stalls ser.read().
+
+    decode_to ("csv", "bin" or "both") adds a third thread that decodes the
+    written rows as they arrive; the raw CSV is always kept.
+
+    sync_period >= 0 also writes gait_sync_<stamp>.csv host↔Elapsed_us pairs.
+
+    If any thread fails (e.g. an OSError writing the CSV), all threads are
+    stopped and the error is raised from here instead of logging on silently.
+    """
+    print(f"Starting threaded serial logger...\nSaving to: {OUTPUT_FILENAME}")
+    stats = LoggerStats()
+    stop = threading.Event()
+    ring = queue.Queue(maxsize=ring_chunks)
+    decode_q = queue.Queue() if decode_to else None
+    stats.decoding = bool(decode_to)
+    sync_f = None
+
+    try:
+        ser = open_port()
+        ser.reset_input_buffer()
+        sync_f, sync = open_sync_file(OUTPUT_FILENAME, sync_period)
+
+        with open(OUTPUT_FILENAME, 'w', newline='', encoding='utf-8') as csvfile:
+            reader_t = threading.Thread(target=stop_on_error(serial_reader, stats, stop),
+                                        args=(ser, ring, stats, stop),
+                                        name="serial-reader", daemon=True)
+            writer_t = threading.Thread(target=stop_on_error(batch_writer, stats, stop),
+                                        args=(ring, csvfile, GaitLineHandler(), stats, stop,
+                                              flush_interval, flush_bytes, decode_q, sync),
+                                        name="batch-writer", daemon=True)
+            threads = [reader_t, writer_t]
+            if decode_to:
+                threads.append(threading.Thread(target=stop_on_error(live_decoder, stats, stop),
+                                                args=(decode_q, stats, decode_to, pole_pairs,
+                                                      flush_interval),
+                                                name="live-decoder", daemon=True))
+            for t in threads:
+                t.start()
+
+            t_prev, prev = time.monotonic(), (0, 0)
+            try:
+                while not stop.wait(status_interval):
+                    now = time.monotonic()
+                    print(stats.report(prev, now - t_prev))
+                    t_prev, prev = now, (stats.bytes_in, stats.lines)
+            except KeyboardInterrupt:
+                print("\nLogging stopped by user (Ctrl+C).")
+            finally:
+                stop.set()
+                for t in threads:
+                    t.join()
+                print(stats.report(prev, time.monotonic() - t_prev))
+            if stats.error is not None:
+                # e.g. disk full: nothing more is being saved, so don't look like a clean stop
+                raise SystemExit(f"[ERROR] Logging stopped early: {stats.error!r}")
+
+    except serial.SerialException as e:
+        print(f"\n[ERROR] Could not open port {COM_PORT}. "
+              f"Check port number and close Arduino Serial Monitor.\nDetails: {e}")
+
+    finally:
+        if 'ser' in locals() and ser.is_open:
+            ser.close()
+            print("Serial connection closed.")
+        if sync_f:
+            sync.close()
+            sync_f.close()
+            print(f"Clock sync pairs: {sync.pairs} → {sync_filename(OUTPUT_FILENAME)}")
         print(f"Data saved to {OUTPUT_FILENAME}")
 
 if __name__ == '__main__':
-    log_serial_data()
+    ap = argparse.ArgumentParser(description="Log ESP32 gait CSV from serial.")
+    ap.add_argument("--port", default=COM_PORT, help="Serial port (e.g. COM3, /dev/ttyUSB0)")
+    ap.add_argument("--baud", type=int, default=BAUD_RATE)
+    ap.add_argument("--threaded", action="store_true",
+                    help="Reader/writer threads with batched writes (no per-line flush)")
+    ap.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL_S,
+                    help="Threaded mode: flush at least this often (s)")
+    ap.add_argument("--flush-bytes", type=int, default=FLUSH_BYTES,
+                    help="Threaded mode: write the batch once it reaches this many bytes")
+    ap.add_argument("--decode", choices=["csv", "bin", "both"], default=None,
+                    help="Also decode frames as they arrive (implies --threaded); raw CSV is kept")
+    ap.add_argument("--pole-pairs", type=int, default=POLE_PAIRS,
+                    help="Pole pairs for mechanical RPM in the live-decoded CSV")
+    ap.add_argument("--sync-period", type=float, default=SYNC_PERIOD_S,
+                    help="Seconds between host↔Elapsed_us pairs in gait_sync_*.csv "
+                         "(0 = every read, -1 = don't write the file)")
+    args = ap.parse_args()
+    COM_PORT, BAUD_RATE = args.port, args.baud
+
+    if args.threaded or args.decode:
+        log_serial_data_threaded(args.flush_interval, args.flush_bytes,
+                                 decode_to=args.decode, pole_pairs=args.pole_pairs,
+                                 sync_period=args.sync_period)
+    else:
+        log_serial_data(args.sync_period)
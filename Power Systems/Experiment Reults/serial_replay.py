@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Hardware-free stand-in for the ESP32 and the OWON meter (Linux).
+
+Replays a recorded gait_data_log_*.csv and/or owon_log_*.csv over
+pseudo-terminals, so serial_in.py, owon_logger.py and acquire.py can be run
+and load-tested without the exo or the meter on the bench.
+
+ESP32 (--gait): emits the firmware's text protocol with \\r\\n line endings,
+
+  Multi-joint gait tracking started
+  Moving legs to start
+  TimeStep,Elapsed_us,L_Gait_Index,R_Gait_Index,RH[8],RK[8],LK[8],LH[8]
+  <data rows and in-stream chatter exactly as logged>
+
+In-stream chatter ("Moving legs to zero", "finished control loop,restarting",
+... printed by the firmware every cycle) is sent at its logged position.
+
+paced by Elapsed_us (legacy 35-column logs: --row-period). --speed 10 plays
+10x faster; --speed 0 writes as fast as the reader takes it.
+
+OWON (--owon): answers MEAS...? queries with the logged reading at the
+current replay time (and *IDN?), so the meter "moves" at --speed too.
+
+Each pty's path is printed on start; point the loggers at it:
+  python serial_replay.py --gait Experiment5/gait_data_log_20251120_151836.csv --speed 10
+  python serial_in.py --threaded --port /dev/pts/3
+  python serial_replay.py --owon Experiment5/owon_log_20251120_151836.csv --loop
+  python owon_logger.py --pipelined --port /dev/pts/4
+"""
+
+import argparse
+import bisect
+import csv
+import os
+import pty
+import threading
+import time
+import tty
+from pathlib import Path
+
+CHATTER = ["Multi-joint gait tracking started", "Moving legs to start"]
+COMPACT_HEADER = {
+    36: "TimeStep,Elapsed_us,L_Gait_Index,R_Gait_Index,RH[8],RK[8],LK[8],LH[8]",
+    35: "TimeStep,L_Gait_Index,R_Gait_Index,RH[8],RK[8],LK[8],LH[8]",
+}
+ROW_PERIOD_S = 0.011        # ~90 printed rows/s, as the current firmware
+IDN = "OWON,XDM1041,REPLAY,1.0"
+
+
+def open_pty(link=None):
+    """Raw pty pair; returns (master_fd, slave_fd, slave_path). Optionally symlinks the slave."""
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if link:
+        link = Path(link)
+        if link.is_symlink():
+            link.unlink()
+        link.symlink_to(path)
+        path = f"{link} -> {path}"
+    return master, slave, path
+
+
+# ---------- ESP32 ----------
+def load_gait_lines(path):
+    """
+    Data and chatter lines of a raw gait log as logged, with replay times in
+    seconds, plus the data width. Header lines in the file are dropped (the
+    preamble sends one); chatter lines keep their place and are timed at the
+    data row before them. Rows that aren't 36 wide advance by ROW_PERIOD_S.
+    """
+    lines, times = [], []
+    width = None
+    t = 0.0
+    e0 = None
+    seen_data = False
+    with Path(path).open("r", newline="") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.lower().startswith("timestep"):
+                continue
+            if not line[:1].isdigit():
+                lines.append(line)      # firmware chatter, e.g. "Moving legs to zero"
+                times.append(t)
+                continue
+            ncols = line.count(",") + 1
+            if width is None and ncols in COMPACT_HEADER:
+                width = ncols
+            if ncols == 36:
+                try:
+                    e = int(line.split(",", 2)[1])
+                except ValueError:
+                    e = None
+                if e is not None:
+                    e0 = e if e0 is None else e0
+                    t = max(t, (e - e0) * 1e-6)
+                else:
+                    t += ROW_PERIOD_S
+            elif seen_data:
+                t += ROW_PERIOD_S
+            seen_data = True
+            lines.append(line)
+            times.append(t)
+    return lines, times, width or 36
+
+
+def replay_gait(master, lines, times, width, speed, loop, row_period, stats):
+    """Write the firmware protocol to the pty master at the requested speed."""
+    if width != 36 and row_period != ROW_PERIOD_S:
+        # one period per data row; chatter stays at the time of the row before it
+        times, k = [], -1
+        for ln in lines:
+            k += ln[:1].isdigit()
+            times.append(max(k, 0) * row_period)
+    preamble = "\r\n".join(CHATTER + [COMPACT_HEADER[width]]) + "\r\n"
+    while True:
+        os.write(master, preamble.encode("ascii"))
+        start = time.monotonic()
+        i, n = 0, len(lines)
+        while i < n:
+            now = (time.monotonic() - start) * speed if speed > 0 else float("inf")
+            j = bisect.bisect_right(times, now, lo=i) if speed > 0 else min(n, i + 256)
+            if j == i:
+                time.sleep(min(0.001, max(0.0, (times[i] - now) / speed)))
+                continue
+            os.write(master, ("\r\n".join(lines[i:j]) + "\r\n").encode("ascii"))
+            stats["rows"] += j - i
+            i = j
+        stats["passes"] += 1
+        if not loop:
+            break
+
+
+# ---------- OWON ----------
+def load_owon(path):
+    """(times relative to the first sample, raw reply strings) from an OWON CSV."""
+    times, raws = [], []
+    with Path(path).open("r", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                t = float(row["epoch_s"])
+            except (TypeError, ValueError):
+                continue
+            raw = (row.get("raw") or row.get("value") or "").strip()
+            if not raw:
+                continue
+            times.append(t)
+            raws.append(raw)
+    t0 = times[0] if times else 0.0
+    return [t - t0 for t in times], raws
+
+
+def serve_owon(master, times, raws, speed, loop, stats):
+    """Answer SCPI-style queries line by line, like the meter."""
+    start = time.monotonic()
+    span = times[-1] if times else 0.0
+    buf = b""
+    while True:
+        try:
+            data = os.read(master, 1024)
+        except OSError:
+            return
+        buf += data
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            cmd = line.strip().decode("ascii", errors="replace").upper()
+            if cmd == "*IDN?":
+                reply = IDN
+            elif cmd.startswith("MEAS") and cmd.endswith("?") and raws:
+                t = (time.monotonic() - start) * (speed if speed > 0 else 1.0)
+                if t > span:
+                    if not loop:
+                        stats["done"] = True
+                        return
+                    t %= span if span > 0 else 1.0
+                k = max(0, bisect.bisect_right(times, t) - 1)
+                reply = raws[k]
+            else:
+                continue
+            os.write(master, (reply + "\r\n").encode("ascii"))
+            stats["replies"] += 1
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay gait / OWON logs over pseudo-terminals.")
+    ap.add_argument("--gait", type=Path, default=None, help="Raw gait_data_log_*.csv to replay")
+    ap.add_argument("--owon", type=Path, default=None, help="owon_log_*.csv to serve")
+    ap.add_argument("--speed", type=float, default=1.0,
+                    help="Replay speed (1 = real time, 10 = 10x, 0 = as fast as possible)")
+    ap.add_argument("--loop", action="store_true", help="Start over at the end of the log")
+    ap.add_argument("--row-period", type=float, default=ROW_PERIOD_S,
+                    help="Seconds between rows for logs without Elapsed_us")
+    ap.add_argument("--gait-link", default=None, help="Also symlink the gait pty here")
+    ap.add_argument("--owon-link", default=None, help="Also symlink the OWON pty here")
+    ap.add_argument("--no-wait", action="store_true", help="Start replaying immediately")
+    args = ap.parse_args()
+    if not args.gait and not args.owon:
+        ap.error("give --gait and/or --owon")
+
+    threads = []
+    gait_stats = {"rows": 0, "passes": 0}
+    owon_stats = {"replies": 0, "done": False}
+    keep = []   # slave fds stay open so the ptys survive between reader opens
+
+    if args.gait:
+        lines, times, width = load_gait_lines(args.gait)
+        master, slave, path = open_pty(args.gait_link)
+        keep.append(slave)
+        print(f"ESP32 replay ({len(lines)} rows, {width} cols) on {path}")
+        threads.append(threading.Thread(
+            target=replay_gait, daemon=True,
+            args=(master, lines, times, width, args.speed, args.loop, args.row_period, gait_stats)))
+    if args.owon:
+        times, raws = load_owon(args.owon)
+        master, slave, path = open_pty(args.owon_link)
+        keep.append(slave)
+        print(f"OWON replay ({len(raws)} samples) on {path}")
+        threads.append(threading.Thread(
+            target=serve_owon, daemon=True,
+            args=(master, times, raws, args.speed, args.loop, owon_stats)))
+
+    if not args.no_wait:
+        input("Start the logger(s), then press Enter to begin replay...")
+    t_start = time.monotonic()
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    dt = time.monotonic() - t_start
+    if args.gait:
+        print(f"Gait: {gait_stats['rows']} rows in {dt:.1f} s ({gait_stats['rows'] / max(dt, 1e-9):.0f} rows/s)")
+    if args.owon:
+        print(f"OWON: {owon_stats['replies']} replies in {dt:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Estimate the clock offset between a decoded gait log, the OWON current log
+and (optionally) the BMS log by cross-correlating their current traces.
+
+Traces, resampled to a common rate (--fs) by bin-averaging:
+  gait  sum of |<Motor>_current_A| over all motors, on the Elapsed_us clock
+  OWON  value (battery current, A), on the host clock (epoch_s)
+  BMS   -Battery Current (discharge is negative), on the BMS wall clock
+
+Correlation runs through np.fft (zero-padded rfft), so a whole session is
+one O(n log n) pass. Results:
+
+  offset_s            host epoch = Elapsed_us * 1e-6 + offset_s
+  gait_start_epoch_s  host time of the first gait row (what owon_voltage.py
+                      otherwise asks for as HHMMSS)
+  confidence          Pearson r of the two traces over the overlap at the peak
+  peak_ratio          next-best peak (outside ±--exclude-s) / best peak;
+                      near 1 means the match is ambiguous (periodic gait) —
+                      narrow it with --hint-epoch / --max-lag
+                      (by default the logger filename stamps give the hint)
+  segments, drift_ppm offset re-estimated per --segment-s window of the gait
+                      log (±--search-s around the global offset) and the
+                      slope of those offsets, i.e. Elapsed_us clock drift
+
+Usage:
+  python stream_align.py Experiment5/gait_data_log_20251120_151836_decoded.csv Experiment5/owon_log_20251120_151836.csv
+  python stream_align.py gait_decoded.csv owon.csv --bms logs/detaillogs-20251120155732.txt --json align.json
+  python stream_align.py gait_decoded.csv owon.csv --hint-epoch 1763612316 --max-lag 30
+"""
+
+import argparse
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FS = 20.0            # Hz, the OWON poll rate
+EXCLUDE_S = 1.0      # half-width around the best peak ignored for peak_ratio
+SEGMENT_S = 60.0
+SEARCH_S = 2.0
+MIN_CONFIDENCE = 0.3
+STAMP_MAX_LAG_S = 5.0  # search window around the filename-stamp hint
+
+
+# ---------- traces ----------
+def gait_current_trace(gait):
+    """(t_s since the first row, summed |current|) from a decoded gait frame."""
+    cols = [c for c in gait.columns if c.endswith("_current_A")]
+    if not cols or "Elapsed_us" not in gait.columns:
+        raise SystemExit("Gait log needs Elapsed_us and *_current_A columns")
+    us = gait["Elapsed_us"].to_numpy(dtype=np.int64)
+    y = np.abs(gait[cols].to_numpy(dtype=float)).sum(axis=1)
+    return (us - us[0]) * 1e-6, y, us[0] * 1e-6
+
+
+def wall_seconds(dt):
+    """Naive datetimes → seconds on their own wall clock (no timezone applied)."""
+    return (pd.to_datetime(dt) - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+
+
+def owon_trace(cur, clock="epoch"):
+    """(t, value) from an OWON frame; clock 'epoch' uses epoch_s, 'wall' iso_time."""
+    if clock == "epoch" and "epoch_s" in cur.columns:
+        t = pd.to_numeric(cur["epoch_s"], errors="coerce").to_numpy(dtype=float)
+    elif "iso_time" in cur.columns:
+        t = wall_seconds(pd.to_datetime(cur["iso_time"], errors="coerce"))
+    else:
+        raise SystemExit("Current CSV must contain epoch_s or iso_time")
+    y = pd.to_numeric(cur["value"], errors="coerce").to_numpy(dtype=float)
+    ok = np.isfinite(t) & np.isfinite(y)
+    return t[ok], y[ok]
+
+
+def owon_wall_time(cur, epoch):
+    """Host epoch → naive datetime on the OWON log's iso_time clock (its local time)."""
+    if "iso_time" in cur.columns and "epoch_s" in cur.columns:
+        ot, _ = owon_trace(cur, "epoch")
+        wt, _ = owon_trace(cur, "wall")
+        if len(ot) == len(wt) and len(ot):
+            wall = epoch + float(np.median(wt - ot))
+            return pd.Timestamp(round(wall * 1e6), unit="us").to_pydatetime()
+    return datetime.fromtimestamp(epoch)
+
+
+def bms_trace(bms, time_col="DateTime"):
+    """(wall seconds, -Battery Current) from a BMS frame with parsed DateTime."""
+    if "Battery Current" not in bms.columns:
+        return None
+    t = wall_seconds(bms[time_col])
+    y = -pd.to_numeric(bms["Battery Current"], errors="coerce").to_numpy(dtype=float)
+    ok = np.isfinite(t) & np.isfinite(y)
+    return t[ok], y[ok]
+
+
+def resample(t, y, t0, fs, n):
+    """Bin-average y onto n samples starting at t0; empty bins are interpolated."""
+    idx = np.floor((t - t0) * fs).astype(np.int64)
+    keep = (idx >= 0) & (idx < n)
+    cnt = np.bincount(idx[keep], minlength=n)
+    tot = np.bincount(idx[keep], weights=y[keep], minlength=n)
+    have = cnt > 0
+    out = np.empty(n)
+    out[have] = tot[have] / cnt[have]
+    if not have.all() and have.any():
+        grid = np.arange(n)
+        out[~have] = np.interp(grid[~have], grid[have], out[have])
+    return out
+
+
+# ---------- correlation ----------
+def _zscore(x):
+    s = x.std()
+    return (x - x.mean()) / s if s > 0 else x - x.mean()
+
+
+def xcorr(sig, ref, lo=None, hi=None):
+    """
+    FFT cross-correlation c[L] = sum_i sig[i] * ref[i + L] for lags L in [lo, hi]
+    (default: every lag with any overlap). Returns (lags, c).
+    """
+    n, m = len(sig), len(ref)
+    lo = -(n - 1) if lo is None else max(lo, -(n - 1))
+    hi = m - 1 if hi is None else min(hi, m - 1)
+    size = 1 << (n + m - 1).bit_length()
+    c = np.fft.irfft(np.fft.rfft(ref, size) * np.conj(np.fft.rfft(sig, size)), size)
+    lags = np.arange(lo, hi + 1)
+    return lags, c[lags % size]
+
+
+def _overlap_r(sig, ref, lag):
+    """Pearson r of sig against ref shifted by an integer lag, over the overlap."""
+    i0, i1 = max(0, -lag), min(len(sig), len(ref) - lag)
+    if i1 - i0 < 3:
+        return float("nan")
+    a, b = sig[i0:i1], ref[i0 + lag:i1 + lag]
+    if a.std() == 0 or b.std() == 0:
+        return float("nan")
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+def best_lag(sig, ref, fs, lo=None, hi=None, exclude_s=EXCLUDE_S):
+    """Best lag (samples, parabolic sub-sample) plus confidence and peak_ratio."""
+    a, b = _zscore(sig), _zscore(ref)
+    lags, c = xcorr(a, b, lo, hi)
+    if not len(lags):
+        return None
+    k = int(np.argmax(c))
+    lag = float(lags[k])
+    if 0 < k < len(c) - 1:
+        den = c[k - 1] - 2 * c[k] + c[k + 1]
+        if den < 0:
+            lag += 0.5 * (c[k - 1] - c[k + 1]) / den
+    far = np.abs(lags - lags[k]) > exclude_s * fs
+    ratio = float(c[far].max() / c[k]) if far.any() and c[k] > 0 else float("nan")
+    return {"lag": lag, "confidence": _overlap_r(a, b, int(lags[k])), "peak_ratio": ratio}
+
+
+def align(sig_t, sig_y, ref_t, ref_y, fs=FS, hint=None, max_lag=None, exclude_s=EXCLUDE_S):
+    """
+    Offset d such that ref clock = sig clock + d, from two (t, y) traces.
+    hint/max_lag restrict the search to |d - hint| <= max_lag (seconds).
+    """
+    s0, r0 = sig_t[0], ref_t[0]
+    sig = resample(sig_t, sig_y, s0, fs, int((sig_t[-1] - s0) * fs) + 1)
+    ref = resample(ref_t, ref_y, r0, fs, int((ref_t[-1] - r0) * fs) + 1)
+    lo = hi = None
+    if max_lag is not None:
+        centre = (hint if hint is not None else r0 - s0) - (r0 - s0)
+        lo, hi = int(np.floor((centre - max_lag) * fs)), int(np.ceil((centre + max_lag) * fs))
+    res = best_lag(sig, ref, fs, lo, hi, exclude_s)
+    if res is None:
+        return None
+    res["offset_s"] = r0 - s0 + res.pop("lag") / fs
+    return res
+
+
+def segment_offsets(sig_t, sig_y, ref_t, ref_y, offset_s, fs=FS,
+                    segment_s=SEGMENT_S, search_s=SEARCH_S):
+    """Per-window offsets around offset_s, and the drift (ppm) fitted through them."""
+    segs = []
+    for start in np.arange(sig_t[0], sig_t[-1], segment_s):
+        m = (sig_t >= start) & (sig_t < start + segment_s)
+        if m.sum() < 3:
+            continue
+        st, sy = sig_t[m], sig_y[m]
+        if st[-1] - st[0] < 0.5 * segment_s:
+            continue              # short tail window: too few cycles to trust
+        mr = (ref_t >= st[0] + offset_s - search_s) & (ref_t <= st[-1] + offset_s + search_s)
+        if mr.sum() < 3:
+            continue
+        res = align(st, sy, ref_t[mr], ref_y[mr], fs, hint=offset_s, max_lag=search_s)
+        if res is None or not np.isfinite(res["confidence"]):
+            continue
+        segs.append({"t_s": float(st[0] + 0.5 * (st[-1] - st[0])),
+                     "offset_s": float(res["offset_s"]),
+                     "confidence": round(res["confidence"], 4)})
+    drift_ppm = None
+    good = [s for s in segs if s["confidence"] >= MIN_CONFIDENCE]
+    if len(good) >= 2:
+        t = np.array([s["t_s"] for s in good])
+        d = np.array([s["offset_s"] for s in good])
+        w = np.array([s["confidence"] for s in good])
+        drift_ppm = float(np.polyfit(t, d, 1, w=w)[0] * 1e6)
+    return segs, drift_ppm
+
+
+# ---------- high level ----------
+def stamp_hint(gait_path, owon_path, cur):
+    """
+    Host epoch of the first gait row guessed from the _YYYYMMDD_HHMMSS stamps
+    the loggers put in both filenames (relative to the OWON log's first
+    epoch_s, so the recording machine's timezone doesn't matter).
+    """
+    stamps = []
+    for p in (gait_path, owon_path):
+        m = re.search(r"_(\d{8}_\d{6})", Path(p).name)
+        if not m:
+            return None
+        stamps.append(datetime.strptime(m.group(1), "%Y%m%d_%H%M%S"))
+    ot, _ = owon_trace(cur, "epoch")
+    if not len(ot):
+        return None
+    return float(ot[0]) + (stamps[0] - stamps[1]).total_seconds()
+
+
+def align_gait(gait, cur, fs=FS, hint_epoch=None, max_lag=None,
+               segment_s=SEGMENT_S, search_s=SEARCH_S):
+    """Gait Elapsed_us clock → OWON host clock (see module docstring)."""
+    gt, gy, e0 = gait_current_trace(gait)
+    ot, oy = owon_trace(cur, "epoch")
+    res = align(gt, gy, ot, oy, fs, hint=hint_epoch, max_lag=max_lag)
+    if res is None:
+        raise SystemExit("No overlap to correlate gait and OWON traces")
+    start = res["offset_s"]                     # host epoch of the first gait row
+    segs, drift = segment_offsets(gt, gy, ot, oy, start, fs, segment_s, search_s)
+    return {
+        "offset_s": start - e0,
+        "gait_start_epoch_s": start,
+        "gait_start": owon_wall_time(cur, start).isoformat(),
+        "confidence": round(res["confidence"], 4),
+        "peak_ratio": round(res["peak_ratio"], 4),
+        "fs_hz": fs,
+        "segments": [dict(s, offset_s=s["offset_s"] - e0) for s in segs],
+        "drift_ppm": drift,
+    }
+
+
+def align_bms(bms, cur, fs=1.0, max_lag=None):
+    """BMS wall clock − OWON wall clock (s), from the two battery-current traces."""
+    tr = bms_trace(bms)
+    if tr is None or len(tr[0]) < 3 or np.std(tr[1]) == 0:
+        return None
+    ot, oy = owon_trace(cur, "wall")
+    bt, by = tr
+    m = (bt >= ot[0] - 600) & (bt <= ot[-1] + 600)   # BMS logs span days
+    if m.sum() < 3:
+        return None
+    res = align(ot, oy, bt[m], by[m], fs, hint=0.0 if max_lag else None, max_lag=max_lag)
+    if res is None:
+        return None
+    return {"offset_s": res["offset_s"], "confidence": round(res["confidence"], 4),
+            "peak_ratio": round(res["peak_ratio"], 4)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Cross-correlate gait / OWON / BMS current to align clocks.")
+    ap.add_argument("gait_csv", type=Path, help="Decoded gait CSV (or .npz cache)")
+    ap.add_argument("current_csv", type=Path, help="OWON CSV")
+    ap.add_argument("--bms", type=Path, nargs="+", default=None,
+                    help="BMS detaillogs export(s) to align too")
+    ap.add_argument("--fs", type=float, default=FS, help="Resample rate for correlation (Hz)")
+    ap.add_argument("--hint-epoch", type=float, default=None,
+                    help="Expected host epoch of the first gait row (e.g. from session.json)")
+    ap.add_argument("--max-lag", type=float, default=None,
+                    help="Only search ±this many seconds around the hint "
+                         "(default: 5 s around a filename-stamp hint, else all lags)")
+    ap.add_argument("--no-stamp-hint", action="store_true",
+                    help="Don't derive a hint from the _YYYYMMDD_HHMMSS filename stamps")
+    ap.add_argument("--segment-s", type=float, default=SEGMENT_S, help="Drift window length (s)")
+    ap.add_argument("--search-s", type=float, default=SEARCH_S, help="Per-window search half-width (s)")
+    ap.add_argument("--json", type=Path, default=None, help="Write the result here")
+    args = ap.parse_args()
+
+    from bms_log import load_bms
+    from gait_cache import load_decoded
+    gait = load_decoded(args.gait_csv)
+    cur = pd.read_csv(args.current_csv)
+    hint, max_lag = args.hint_epoch, args.max_lag
+    if hint is None and not args.no_stamp_hint:
+        hint = stamp_hint(args.gait_csv, args.current_csv, cur)
+        if hint is not None and max_lag is None:
+            max_lag = STAMP_MAX_LAG_S
+            print(f"Hint from filename stamps: epoch {hint:.3f} ±{max_lag:g} s")
+    res = align_gait(gait, cur, args.fs, hint, max_lag, args.segment_s, args.search_s)
+
+    print(f"Gait start:   {res['gait_start']}  (epoch {res['gait_start_epoch_s']:.3f})")
+    print(f"Offset:       host epoch = Elapsed_us*1e-6 + {res['offset_s']:.3f} s")
+    print(f"Confidence:   r = {res['confidence']:.3f}   peak ratio {res['peak_ratio']:.3f}")
+    if res["peak_ratio"] > 0.9:
+        print("[WARN] Other lags match almost as well; use --hint-epoch/--max-lag to pick one")
+    for s in res["segments"]:
+        print(f"  t={s['t_s']:8.1f} s  offset {s['offset_s']:.3f} s  r {s['confidence']:.3f}")
+    if res["drift_ppm"] is not None:
+        print(f"Drift:        {res['drift_ppm']:.0f} ppm")
+
+    if args.bms is not None:
+        b = align_bms(load_bms(args.bms), cur)
+        res["bms"] = b
+        if b is None:
+            print("BMS: no usable current trace overlapping the OWON log")
+        else:
+            print(f"BMS clock:    {b['offset_s']:+.1f} s vs OWON  (r {b['confidence']:.3f}, "
+                  f"peak ratio {b['peak_ratio']:.3f})")
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(res, indent=1))
+        print(f"Saved → {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Joint tracking error against the gait tables in the controller firmware.
+
+The R_hip / R_knee / L_hip / L_knee arrays (radians), GAIT_LENGTH, the knee
+phase offset and the walking-loop setpoints are parsed straight from the
+.ino, e.g. for MIT_position_control.ino:
+
+  LeftHip   -(R_hip[LgaitIndex]) * 1.3
+  LeftKnee  -(R_knee[leftKnee] * .7) * 1.3     leftKnee = (LgaitIndex + offset) % GAIT_LENGTH
+  RightHip   (R_hip[RgaitIndex]) * 1.3
+  RightKnee  (R_knee[rightKnee] * .7) * 1.3
+
+Each joint's setpoint is precomputed for all GAIT_LENGTH indices (degrees),
+so the target of every logged row is one array lookup by gait index. The
+firmware logs the index after advancing it, so a row with index i was
+commanded with entry i - 1 (--lag). Only walking rows get a target: the
+ramp phases ("moving legs to start/zero", ×0.9 knee) and the hold depend on
+the loop counter, which isn't logged.
+
+Per joint: RMS / peak / mean error over all walking rows. Per cycle: RMS and
+peak error over the gait_cycles index, as reduceat over the error columns
+(targets_for() output also plugs into gait_cycles.cycle_stats).
+
+Usage:
+  python tracking_error.py Experiment5/gait_data_log_20251120_151836_decoded.csv
+  python tracking_error.py decoded.csv --ino Intermittent_MIT_controller/Intermittent_MIT_controller.ino
+  python tracking_error.py decoded.csv --csv cycles_err.csv
+"""
+
+import argparse
+import ast
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gait_cycles import LEG_MOTORS, LEGS, as_index, build_index, segment_error, typical_step
+
+DEFAULT_INO = (Path(__file__).resolve().parents[2]
+               / "Control System" / "MIT_position_control" / "MIT_position_control.ino")
+MOTOR_IDS = {
+    "MOTOR_ID_LEFT_HIP": "LeftHip",
+    "MOTOR_ID_LEFT_KNEE": "LeftKnee",
+    "MOTOR_ID_RIGHT_HIP": "RightHip",
+    "MOTOR_ID_RIGHT_KNEE": "RightKnee",
+}
+INDEX_VARS = {"LgaitIndex": "L", "RgaitIndex": "R"}
+LOG_LAG = 1   # logGaitData() runs after the index is advanced
+
+
+# ---------- firmware parsing ----------
+def _strip_comments(src):
+    src = re.sub(r"/\*.*?\*/", "", src, flags=re.S)
+    return re.sub(r"//[^\n]*", "", src)
+
+
+def _numbers(text):
+    return np.array([float(v) for v in re.findall(r"[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?",
+                                                  text)])
+
+
+def _eval_scale(expr):
+    """Value of a constant expression made of numbers, * / and unary signs."""
+    def ev(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return float(node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            v = ev(node.operand)
+            return -v if isinstance(node.op, ast.USub) else v
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mult, ast.Div)):
+            a, b = ev(node.left), ev(node.right)
+            return a * b if isinstance(node.op, ast.Mult) else a / b
+        raise ValueError(f"unsupported setpoint expression: {expr!r}")
+    return ev(ast.parse(expr, mode="eval").body)
+
+
+def _split_args(call_args):
+    """Top-level comma split of a C argument list."""
+    out, depth, cur = [], 0, ""
+    for ch in call_args:
+        if ch == "," and depth == 0:
+            out.append(cur.strip())
+            cur = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        cur += ch
+    out.append(cur.strip())
+    return out
+
+
+def parse_firmware(path=DEFAULT_INO):
+    """
+    {"gait_length", "offset", "tables": {name: rad array},
+     "setpoints": {motor: {"table", "leg", "shift", "scale", "expr"}}}
+    from the walking loop of a controller .ino.
+    """
+    src = _strip_comments(Path(path).read_text(errors="replace"))
+    m = re.search(r"#define\s+GAIT_LENGTH\s+(\d+)", src)
+    if not m:
+        raise ValueError(f"{path}: no GAIT_LENGTH")
+    gait_length = int(m.group(1))
+
+    tables = {}
+    for name, body in re.findall(r"\b(?:double|float)\s+(\w+)\s*\[\s*GAIT_LENGTH\s*\]\s*=\s*\{(.*?)\}",
+                                 src, flags=re.S):
+        vals = _numbers(body)
+        if len(vals) != gait_length:
+            raise ValueError(f"{path}: {name} has {len(vals)} entries, not {gait_length}")
+        tables[name] = vals
+
+    ints = {k: int(v) for k, v in re.findall(r"\bint\s+(\w+)\s*=\s*(-?\d+)\s*;", src)}
+    # e.g. int leftKnee = (LgaitIndex + offset) % GAIT_LENGTH;
+    shifted = {}
+    for var, base, shift in re.findall(
+            r"\bint\s+(\w+)\s*=\s*\(\s*(\w+)\s*\+\s*(\w+)\s*\)\s*%\s*GAIT_LENGTH", src):
+        shifted[var] = (base, int(shift) if shift.isdigit() else ints[shift])
+
+    setpoints = {}
+    for call in re.findall(r"sendMITCommand\s*\(([^;{}]*)\)\s*;", src):
+        args = _split_args(call)
+        motor = MOTOR_IDS.get(args[-1])
+        expr = " ".join(args[0].split())
+        ref = re.search(r"(\w+)\s*\[\s*(\w+)\s*\]", expr)
+        # walking loop only: ramped phases scale by the loop counter (i / iterations)
+        if motor is None or motor in setpoints or ref is None or re.search(r"\bi\b", expr):
+            continue
+        table, var = ref.groups()
+        if table not in tables:
+            continue
+        base, shift = shifted.get(var, (var, 0))
+        if base not in INDEX_VARS:
+            continue
+        scale_expr = re.sub(r"(\d)[fF]\b", r"\1", expr[:ref.start()] + "1.0" + expr[ref.end():])
+        setpoints[motor] = {"table": table, "leg": INDEX_VARS[base], "shift": shift,
+                            "scale": _eval_scale(scale_expr), "expr": expr}
+    if not setpoints:
+        raise ValueError(f"{path}: no walking-loop sendMITCommand setpoints found")
+    return {"gait_length": gait_length, "offset": ints.get("offset"), "tables": tables,
+            "setpoints": setpoints}
+
+
+def setpoint_tables(fw):
+    """{motor: target (deg) for each logged gait index value}, before the log lag."""
+    out = {}
+    for motor, sp in fw["setpoints"].items():
+        deg = np.degrees(sp["scale"] * fw["tables"][sp["table"]])
+        out[motor] = np.roll(deg, -sp["shift"])  # out[i] = deg[(i + shift) % N]
+    return out
+
+
+# ---------- targets and errors ----------
+def walking_rows(gait_index, gait_length):
+    """Rows reached by a forward step of the gait index (not holds / restarts)."""
+    idx = as_index(gait_index)
+    if len(idx) < 2:
+        return np.zeros(len(idx), dtype=bool)
+    fwd = np.mod(np.diff(idx), gait_length)
+    return np.r_[False, (fwd > 0) & (fwd <= typical_step(idx, gait_length))]
+
+
+def targets_for(df, fw, lag=LOG_LAG):
+    """{motor: per-row target (deg), NaN outside walking rows}."""
+    n_idx = fw["gait_length"]
+    legs = {}
+    for leg, col in LEGS.items():
+        if col in df.columns:
+            idx = as_index(df[col].to_numpy())
+            legs[leg] = (idx, walking_rows(idx, n_idx))
+    out = {}
+    for motor, table in setpoint_tables(fw).items():
+        sp = fw["setpoints"][motor]
+        if sp["leg"] not in legs or f"{motor}_pos_deg" not in df.columns:
+            continue
+        idx, walking = legs[sp["leg"]]
+        target = np.roll(table, lag)[idx]  # row with index i → entry i - lag
+        target[~walking] = np.nan
+        out[motor] = target
+    return out
+
+
+def errors_for(df, targets):
+    """{motor: measured - target (deg) per row, NaN where there is no target}."""
+    return {m: df[f"{m}_pos_deg"].to_numpy(dtype=float) - t for m, t in targets.items()}
+
+
+def joint_summary(errors):
+    """Per-joint rows, RMS / peak / mean (bias) error over the rows with a target."""
+    rows = []
+    for motor, err in errors.items():
+        err = err[np.isfinite(err)]
+        if not len(err):
+            continue
+        rows.append({"joint": motor, "rows": len(err),
+                     "rms_deg": float(np.sqrt(np.dot(err, err) / len(err))),
+                     "peak_deg": float(max(err.max(), -err.min())),
+                     "mean_deg": float(err.mean())})
+    return pd.DataFrame(rows)
+
+
+def cycle_errors(errors, index, leg):
+    """Per-cycle RMS / peak error of the leg's joints (rows without a target skipped)."""
+    starts, stops = index[leg]
+    out = {"cycle": np.arange(len(starts)), "start_row": starts, "stop_row": stops}
+    for m in LEG_MOTORS[leg]:
+        if m not in errors:
+            continue
+        out[f"{m}_rms_err_deg"], out[f"{m}_peak_err_deg"] = segment_error(errors[m], starts, stops)
+    return pd.DataFrame(out)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tracking error against the firmware gait tables.")
+    ap.add_argument("decoded", type=Path, help="Decoded gait CSV (or its .npz cache)")
+    ap.add_argument("--ino", type=Path, default=DEFAULT_INO,
+                    help="Controller sketch holding the gait tables (default: MIT_position_control.ino)")
+    ap.add_argument("--lag", type=int, default=LOG_LAG,
+                    help="Table entries between the commanded and the logged gait index (default: 1)")
+    ap.add_argument("--csv", type=Path, default=None,
+                    help="Write the per-cycle error table (both legs, 'leg' column)")
+    args = ap.parse_args()
+
+    fw = parse_firmware(args.ino)
+    print(f"Firmware: {args.ino.name}  GAIT_LENGTH={fw['gait_length']}  offset={fw['offset']}")
+    for motor, sp in fw["setpoints"].items():
+        print(f"  {motor:9s} {sp['expr']:38s} → {sp['scale']:+.3f} × {sp['table']}"
+              f"[{sp['leg']} + {sp['shift']}]")
+
+    import gait_cache  # decoder LUTs are only needed when run as a script
+    df = gait_cache.load_decoded(args.decoded)
+
+    t0 = time.perf_counter()
+    errors = errors_for(df, targets_for(df, fw, args.lag))
+    summary = joint_summary(errors)
+    index = build_index(df, fw["gait_length"])
+    tables = []
+    for leg in index:
+        stats = cycle_errors(errors, index, leg)
+        tables.append(pd.concat([pd.Series(leg, index=stats.index, name="leg"), stats], axis=1))
+    elapsed = time.perf_counter() - t0
+
+    pd.set_option("display.width", 160)
+    print(f"\nRows: {len(df)}  (targets + errors + per-cycle in {elapsed * 1e3:.0f} ms)\n")
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    for t in tables:
+        if len(t):
+            err_cols = [c for c in t.columns if c.endswith("_err_deg")]
+            print(f"\n{t['leg'].iloc[0]}: {len(t)} cycles")
+            print(t[err_cols].describe().loc[["mean", "min", "max"]]
+                  .to_string(float_format=lambda v: f"{v:.3f}"))
+
+    if args.csv:
+        pd.concat(tables, ignore_index=True).to_csv(args.csv, index=False)
+        print(f"Saved → {args.csv}")
+
+
+if __name__ == "__main__":
+    main()